@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent chat retrievals against a slow synchronous Qdrant client.
+
+Runs N concurrent get_relevant_content calls twice: once with the search made
+directly on the event loop (the old behaviour) and once through the bounded
+search executor. With the blocking call the wall time grows with N; with the
+executor it stays close to a single search latency (up to the worker count).
+
+Usage: python benchmarks/bench_concurrent_retrieval.py [--concurrency 16] [--latency-ms 100]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.services.chatbot_service import ChatbotService
+
+
+class SlowQdrantClient:
+    """Stands in for QdrantClient.search with a fixed, blocking latency."""
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    def search(self, **kwargs):
+        time.sleep(self.latency_s)
+        return [types.SimpleNamespace(
+            payload={"content_id": "chunk-1", "content": "ROS 2 topics...", "source": "module-1"},
+            score=0.9
+        )]
+
+
+class BenchChatbotService(ChatbotService):
+    async def embed_query(self, query):
+        return [0.0] * 8
+
+
+class BlockingChatbotService(BenchChatbotService):
+    """The pre-offload behaviour: the sync search runs on the event loop."""
+
+    async def get_relevant_content(self, query, top_k=5):
+        return self.qdrant_client.search(collection_name="textbook_content", limit=top_k)
+
+
+async def run(service: ChatbotService, concurrency: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(service.get_relevant_content(f"query {i}") for i in range(concurrency)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    qdrant = SlowQdrantClient(args.latency_ms / 1000)
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    blocking = BlockingChatbotService(None, qdrant, None)
+    offloaded = BenchChatbotService(None, qdrant, None, executor)
+
+    blocking_s = asyncio.run(run(blocking, args.concurrency))
+    offloaded_s = asyncio.run(run(offloaded, args.concurrency))
+    executor.shutdown()
+
+    print(f"concurrency={args.concurrency} search_latency={args.latency_ms:.0f}ms workers={args.workers}")
+    print(f"  blocking on event loop : {blocking_s * 1000:8.1f} ms")
+    print(f"  offloaded to executor  : {offloaded_s * 1000:8.1f} ms")
+    print(f"  speedup                : {blocking_s / offloaded_s:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Load test: the full register -> login -> create session -> query flow.
+
+Each virtual user registers, logs in, opens a chat session and asks a few
+questions; --concurrency users run at once. By default the app runs
+in-process (httpx ASGI transport) on a throw-away SQLite database, with the
+simulated LLM (LLM_PROVIDER=stub) and the embedded vector index built from
+the textbook by the regular ingestion code, so the numbers measure this
+backend rather than OpenAI or Qdrant. Every SQL statement is attributed to
+the request that issued it.
+
+The report has throughput and p50/p95/p99 latency per endpoint plus DB
+queries per request. --save-baseline writes it to the baseline file; later
+runs are compared against that file and regressions are listed.
+
+Usage:
+  python benchmarks/load_test.py [--users 50] [--concurrency 10] [--queries-per-user 3] [--stream]
+  python benchmarks/load_test.py --save-baseline
+  python benchmarks/load_test.py --base-url http://127.0.0.1:8000   # a running server; no DB counts
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "load_test.json")
+
+QUESTIONS = [
+    "What is a ROS 2 topic?",
+    "How do ROS 2 services differ from topics?",
+    "What is URDF used for?",
+    "Explain the role of a digital twin in humanoid robotics.",
+    "How does Gazebo simulate physics?",
+    "What is Isaac Sim?",
+    "How do vision-language-action models control a robot?",
+    "What sensors does a humanoid robot need for balance?",
+    "What is inverse kinematics?",
+    "How is reinforcement learning used for locomotion?",
+]
+
+# Requests that are being timed, so each SQL statement can be charged to one
+_current_request: contextvars.ContextVar = contextvars.ContextVar("current_request", default=None)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+
+    async def timed(self, endpoint: str, send):
+        sample = {"queries": 0}
+        token = _current_request.set(sample)
+        started = time.perf_counter()
+        try:
+            response = await send()
+            sample["status"] = response.status_code
+            return response
+        except Exception as e:
+            sample["status"] = type(e).__name__
+            raise
+        finally:
+            sample["seconds"] = time.perf_counter() - started
+            _current_request.reset(token)
+            self.samples[endpoint].append(sample)
+
+    def summary(self, wall_seconds: float, count_queries: bool) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, samples in self.samples.items():
+            latencies = [s["seconds"] * 1000 for s in samples]
+            errors = sum(1 for s in samples if not (isinstance(s["status"], int) and s["status"] < 400))
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": errors,
+                "throughput_rps": round(len(samples) / wall_seconds, 2),
+                "p50_ms": round(percentile(latencies, 0.50), 2),
+                "p95_ms": round(percentile(latencies, 0.95), 2),
+                "p99_ms": round(percentile(latencies, 0.99), 2),
+                "db_queries_per_request": (round(sum(s["queries"] for s in samples) / len(samples), 2)
+                                           if count_queries else None),
+            }
+        return endpoints
+
+
+async def user_flow(client, recorder: Recorder, user: int, queries: int, stream: bool, rng: random.Random) -> None:
+    email = f"load-{user}-{rng.getrandbits(32):08x}@example.com"
+    password = "load-test-password"
+    response = await recorder.timed("register", lambda: client.post("/api/auth/register", json={
+        "email": email, "password": password, "name": f"Load {user}",
+        "software_experience": "intermediate", "hardware_experience": "basic"
+    }))
+    if response.status_code >= 400:
+        return
+
+    response = await recorder.timed("login", lambda: client.post("/api/auth/login", json={"email": email, "password": password}))
+    if response.status_code >= 400:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = await recorder.timed("create_session", lambda: client.post(
+        "/api/chatbot/sessions", json={"title": f"Load session {user}"}, headers=headers
+    ))
+    if response.status_code >= 400:
+        return
+    session_id = response.json()["id"]
+
+    endpoint = "query_stream" if stream else "query"
+    path = f"/api/chatbot/sessions/{session_id}/query" + ("/stream" if stream else "")
+    for _ in range(queries):
+        question = rng.choice(QUESTIONS)
+
+        async def ask():
+            if not stream:
+                return await client.post(path, params={"query": question}, headers=headers)
+            # Time the whole stream, not just the headers
+            async with client.stream("POST", path, params={"query": question}, headers=headers) as streamed:
+                await streamed.aread()
+                return streamed
+
+        await recorder.timed(endpoint, ask)
+
+
+async def prepare_local_app(workdir: str):
+    """Import the app against a fresh database and an embedded index of the textbook."""
+    from sqlalchemy import event
+
+    from src.database.database import engine
+    from src.services.ingestion_service import TextbookIngestionService
+    from src.utils.clients import client_pool
+    from initialize_db import create_tables
+
+    await create_tables()
+    report = await TextbookIngestionService(client_pool.qdrant, client_pool.openai).run(force=True)
+    print(f"Indexed {report.chunks_total} textbook chunks into {workdir}")
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        sample = _current_request.get()
+        if sample is not None:
+            sample["queries"] += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+
+    from src.main import app
+    return app, engine
+
+
+async def run_load(args) -> Dict[str, Any]:
+    import httpx
+
+    engine = None
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=120)
+    else:
+        app, engine = await prepare_local_app(args.workdir)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=120)
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one_user(user: int):
+        async with gate:
+            await user_flow(client, recorder, user, args.queries_per_user, args.stream, random.Random(rng.random()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_user(user) for user in range(args.users)))
+    wall_seconds = time.perf_counter() - started
+    await client.aclose()
+    if engine is not None:
+        from src.utils.clients import client_pool
+        await client_pool.shutdown()
+        await engine.dispose()
+
+    return {
+        "config": {
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "queries_per_user": args.queries_per_user,
+            "stream": args.stream,
+            "target": args.base_url or "in-process",
+            "llm_provider": os.environ.get("LLM_PROVIDER"),
+            "retriever_backend": os.environ.get("RETRIEVER_BACKEND"),
+        },
+        "wall_seconds": round(wall_seconds, 2),
+        "flows_per_second": round(args.users / wall_seconds, 2),
+        "endpoints": recorder.summary(wall_seconds, count_queries=engine is not None),
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """
+    Regressions against the baseline: percentiles slower by more than tolerance
+    and by more than min_delta_ms (tails of millisecond endpoints are noisy),
+    any extra DB query per request, any extra error.
+    """
+    regressions = []
+    for endpoint, now in result["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if before[metric] and now[metric] > before[metric] * (1 + tolerance) \
+                    and now[metric] - before[metric] > min_delta_ms:
+                regressions.append(f"{endpoint} {metric}: {before[metric]} -> {now[metric]}")
+        if before.get("db_queries_per_request") is not None and now.get("db_queries_per_request") is not None \
+                and now["db_queries_per_request"] > before["db_queries_per_request"]:
+            regressions.append(f"{endpoint} db_queries_per_request: "
+                               f"{before['db_queries_per_request']} -> {now['db_queries_per_request']}")
+        if now["errors"] > before["errors"]:
+            regressions.append(f"{endpoint} errors: {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    config = result["config"]
+    print(f"\nusers={config['users']} concurrency={config['concurrency']} queries/user={config['queries_per_user']} "
+          f"stream={config['stream']} target={config['target']}")
+    print(f"wall {result['wall_seconds']}s, {result['flows_per_second']} flows/s\n")
+    print(f"{'endpoint':<16}{'reqs':>6}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'db q/req':>10}")
+    for endpoint, stats in result["endpoints"].items():
+        queries = stats["db_queries_per_request"]
+        print(f"{endpoint:<16}{stats['requests']:>6}{stats['errors']:>6}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{queries if queries is not None else '-':>10}")
+        before = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if before:
+            print(f"{'  baseline':<16}{before['requests']:>6}{before['errors']:>6}{before['throughput_rps']:>9}"
+                  f"{before['p50_ms']:>10}{before['p95_ms']:>10}{before['p99_ms']:>10}"
+                  f"{before['db_queries_per_request'] if before['db_queries_per_request'] is not None else '-':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the register -> login -> session -> query flow")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--queries-per-user", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="use the streaming query endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-url", default=None, help="load a running server instead of the in-process app")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative latency increase")
+    parser.add_argument("--min-delta-ms", type=float, default=100.0, help="latency increases below this are noise")
+    parser.add_argument("--output", default=None, help="also write the result JSON here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        if not args.base_url:
+            # Must be in place before anything under src/ reads its settings
+            os.environ.setdefault("OPENAI_API_KEY", "stub")
+            os.environ.setdefault("LLM_PROVIDER", "stub")
+            os.environ.setdefault("RETRIEVER_BACKEND", "embedded")
+            os.environ.setdefault("RETENTION_ENABLED", "false")
+            os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/load_test.db"
+            os.environ["RAG_INDEX_DIR"] = os.path.join(workdir, "rag_index")
+            os.environ.setdefault("TEXTBOOK_DOCS_PATH", os.path.join(BACKEND_DIR, "..", "physical-ai-humanoid-robotics", "docs"))
+        result = asyncio.run(run_load(args))
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved baseline to {args.baseline}")
+    elif baseline is not None:
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        print("\nRegressions against baseline:" if regressions else "\nNo regressions against baseline.")
+        for line in regressions:
+            print(f"  {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmark: retrieval quality vs. latency vs. memory over the textbook.
+
+Builds a question set from the docs/module-* chapters: one question per
+section heading (gold = the chunks of that section) plus the hand-written
+pairs in benchmarks/retrieval_questions.json, which paraphrase instead of
+repeating the heading. Gold is a (page, heading) pair rather than a chunk ID,
+so it holds whatever the chunk size.
+
+For every configuration (chunk size x index dtype x retrieval mode) the
+textbook is ingested into a throw-away embedded index with the regular
+ingestion code, and each question goes through
+ChatbotService.get_relevant_content. One table reports recall@k, MRR,
+chunks returned, per-query latency and the in-memory size of the indexes
+that mode reads. --adaptive adds each mode with the adaptive top_k cutoff,
+to weigh the chunks it saves against the recall it costs.
+
+By default the stub provider embeds (hashed bags of words, no API key, no
+embedding latency), so vector numbers show relative trends only; run with
+LLM_PROVIDER=openai and a real key for absolute ones.
+
+Usage:
+  python benchmarks/retrieval_eval.py [--chunk-tokens 64,400] [--dtypes float32,int8]
+                                      [--modes vector,lexical,hybrid] [--hybrid-weights 1:1,2:1] [--k 1,3,5,10]
+                                      [--adaptive]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(__file__), "retrieval_questions.json")
+MODES = ("vector", "lexical", "hybrid")
+
+# (page path, section heading)
+Gold = Tuple[str, str]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def heading_questions(docs_path: Path) -> List[Dict[str, Any]]:
+    """One question per section; headings used in several chapters get the chapter title."""
+    from src.services.ingestion_service import HEADING_RE, _strip_front_matter
+
+    sections: List[Tuple[str, str, str]] = []
+    for page in sorted(p for p in docs_path.glob("module-*/**/*") if p.suffix in (".md", ".mdx")):
+        rel_path = page.relative_to(docs_path).as_posix()
+        title = page.stem
+        for line in _strip_front_matter(page.read_text(encoding="utf-8")).splitlines():
+            match = HEADING_RE.match(line)
+            if not match:
+                continue
+            if len(match.group(1)) == 1:
+                title = match.group(2).strip()
+            else:
+                sections.append((rel_path, title, match.group(2).strip()))
+
+    seen: Dict[str, int] = {}
+    for _, _, heading in sections:
+        seen[heading.lower()] = seen.get(heading.lower(), 0) + 1
+    return [
+        {
+            "question": heading if seen[heading.lower()] == 1 else f"{heading} in {title}",
+            "gold": (rel_path, heading),
+            "kind": "heading",
+        }
+        for rel_path, title, heading in sections
+    ]
+
+
+def seeded_questions(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [{"question": pair["question"], "gold": (pair["path"], pair["heading"]), "kind": "seeded"}
+                for pair in json.load(f)]
+
+
+async def build_indexes(docs_path: Path, index_dir: Path, chunk_tokens: int, dtypes: List[str]) -> Dict[str, Path]:
+    """Ingest once per chunk size; other dtypes are re-quantised from the float32 vectors."""
+    from src.services.index_generations import current_index_dir
+    from src.services.ingestion_service import MarkdownChunker, TextbookIngestionService
+    from src.services.vector_index import EmbeddedVectorIndex
+    from src.utils.clients import client_pool
+    from src.utils.security import settings
+
+    root = index_dir / f"chunks-{chunk_tokens}-float32"
+    settings.EMBEDDED_INDEX_DTYPE = "float32"
+    report = await TextbookIngestionService(
+        None, client_pool.openai, docs_path=str(docs_path), index_dir=str(root),
+        chunker=MarkdownChunker(chunk_tokens)
+    ).run(force=True)
+    print(f"chunk_tokens={chunk_tokens}: {report.chunks_total} chunks")
+    # The generation ingestion published holds vectors/ and bm25/
+    base = current_index_dir(root)
+
+    built = {"float32": base}
+    float_index = EmbeddedVectorIndex.load(base / "vectors")
+    for dtype in dtypes:
+        if dtype in built:
+            continue
+        directory = index_dir / f"chunks-{chunk_tokens}-{dtype}"
+        shutil.copytree(base / "bm25", directory / "bm25")
+        vectors = float_index.vectors()
+        EmbeddedVectorIndex.build(
+            float_index.ids, [vectors[chunk_id] for chunk_id in float_index.ids], float_index.payloads, dtype=dtype
+        ).save(directory / "vectors")
+        built[dtype] = directory
+    return {dtype: built[dtype] for dtype in dtypes}
+
+
+def index_megabytes(directory: Path) -> Dict[str, float]:
+    """Bytes the search arrays occupy once loaded (payload JSON excluded, it is shared by all modes)."""
+    from src.services.bm25_index import BM25Index
+    from src.services.vector_index import EmbeddedVectorIndex
+
+    vectors = EmbeddedVectorIndex.load(directory / "vectors")
+    bm25 = BM25Index.load(directory / "bm25")
+    vector_bytes = vectors.matrix.nbytes + (vectors.scales.nbytes if vectors.scales is not None else 0)
+    bm25_bytes = sum(array.nbytes for array in (bm25.offsets, bm25.doc_ids, bm25.term_freqs, bm25.doc_lengths))
+    return {"vector": vector_bytes / 2 ** 20, "lexical": bm25_bytes / 2 ** 20}
+
+
+def gold_ids(directory: Path) -> Dict[Gold, Set[str]]:
+    from src.services.vector_index import EmbeddedVectorIndex
+
+    index = EmbeddedVectorIndex.load(directory / "vectors")
+    gold: Dict[Gold, Set[str]] = {}
+    for payload in index.payloads:
+        gold.setdefault((payload["path"], payload["heading"]), set()).add(payload["content_id"])
+    return gold
+
+
+def apply_mode(mode: str, weights: Optional[Tuple[float, float]]) -> None:
+    from src.utils.security import settings
+
+    settings.HYBRID_SEARCH_ENABLED = mode != "vector"
+    if mode == "lexical":
+        # BM25 order; vector-only hits fuse with score 0 and sort after every lexical hit
+        settings.HYBRID_VECTOR_WEIGHT, settings.HYBRID_LEXICAL_WEIGHT = 0.0, 1.0
+    elif mode == "hybrid":
+        settings.HYBRID_VECTOR_WEIGHT, settings.HYBRID_LEXICAL_WEIGHT = weights
+
+
+async def evaluate(directory: Path, questions: List[Dict[str, Any]], ks: List[int],
+                   adaptive: bool = False) -> Dict[str, Any]:
+    """
+    Fixed depth retrieves max(ks) chunks per question; adaptive goes through
+    ChatbotService.retrieve, which over-fetches and cuts with AdaptiveTopK.
+    """
+    from src.services.adaptive_top_k import AdaptiveTopK
+    from src.services.bm25_index import BM25Store
+    from src.services.chatbot_service import ChatbotService
+    from src.services.retrievers import EmbeddedRetriever
+    from src.services.vector_index import EmbeddedVectorStore
+    from src.utils.clients import client_pool
+
+    service = ChatbotService(None, None, client_pool.openai,
+                             retriever=EmbeddedRetriever(EmbeddedVectorStore(str(directory))))
+    service.bm25_store = BM25Store(str(directory))
+    service.adaptive_top_k = AdaptiveTopK(enabled=True)
+    gold = gold_ids(directory)
+    depth = max(ks)
+
+    async def retrieve(query: str):
+        if adaptive:
+            return (await service.retrieve(query))[1]
+        return await service.get_relevant_content(query, top_k=depth)
+
+    # Warm up: load both indexes before timing
+    await retrieve(questions[0]["question"])
+
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks, latencies, returned, missing = [], [], [], 0
+    for question in questions:
+        expected = gold.get(question["gold"])
+        if not expected:
+            missing += 1
+            continue
+        started = time.perf_counter()
+        results = await retrieve(question["question"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        returned.append(len(results))
+
+        ranks = [rank for rank, result in enumerate(results, 1) if result.content_id in expected]
+        first = ranks[0] if ranks else None
+        for k in ks:
+            hits[k] += first is not None and first <= k
+        reciprocal_ranks.append(1.0 / first if first else 0.0)
+
+    evaluated = len(reciprocal_ranks)
+    return {
+        "questions": evaluated,
+        "unmatched_gold": missing,
+        "recall": {k: round(hits[k] / evaluated, 3) if evaluated else 0.0 for k in ks},
+        "mrr": round(sum(reciprocal_ranks) / evaluated, 3) if evaluated else 0.0,
+        "avg_chunks": round(sum(returned) / evaluated, 2) if evaluated else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+    }
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    from src.utils.clients import client_pool
+
+    docs_path = Path(args.docs_path)
+    questions = []
+    if args.questions in ("all", "headings"):
+        questions += heading_questions(docs_path)
+    if args.questions in ("all", "seeded"):
+        questions += seeded_questions(args.questions_file)
+    print(f"{len(questions)} questions ({args.questions})")
+
+    variants = []
+    for mode in args.modes:
+        if mode == "hybrid":
+            variants += [(mode, weights) for weights in args.hybrid_weights]
+        else:
+            variants.append((mode, None))
+    if args.adaptive:
+        variants += [(mode, weights, True) for mode, weights in variants]
+    variants = [variant if len(variant) == 3 else variant + (False,) for variant in variants]
+
+    rows = []
+    for chunk_tokens in args.chunk_tokens:
+        directories = await build_indexes(docs_path, Path(args.workdir), chunk_tokens, args.dtypes)
+        for dtype, directory in directories.items():
+            sizes = index_megabytes(directory)
+            for mode, weights, adaptive in variants:
+                apply_mode(mode, weights)
+                result = await evaluate(directory, questions, args.k, adaptive)
+                megabytes = sizes["vector"] * (mode != "lexical") + sizes["lexical"] * (mode != "vector")
+                rows.append({
+                    "chunk_tokens": chunk_tokens,
+                    "dtype": dtype,
+                    "mode": (mode if weights is None else f"hybrid {weights[0]:g}:{weights[1]:g}")
+                            + (" +cut" if adaptive else ""),
+                    "index_mb": round(megabytes, 3),
+                    **result,
+                })
+
+    await client_pool.shutdown()
+    return rows
+
+
+def print_table(rows: List[Dict[str, Any]], ks: List[int]) -> None:
+    header = f"{'chunk':>6} {'dtype':<8}{'mode':<19}" + "".join(f"{f'R@{k}':>7}" for k in ks) \
+        + f"{'MRR':>7}{'used':>6}{'p50 ms':>9}{'p95 ms':>9}{'index MB':>10}"
+    print("\n" + header)
+    for row in rows:
+        print(f"{row['chunk_tokens']:>6} {row['dtype']:<8}{row['mode']:<19}"
+              + "".join(f"{row['recall'][k]:>7.3f}" for k in ks)
+              + f"{row['mrr']:>7.3f}{row['avg_chunks']:>6.1f}{row['p50_ms']:>9.3f}{row['p95_ms']:>9.3f}{row['index_mb']:>10.3f}")
+    unmatched = max((row["unmatched_gold"] for row in rows), default=0)
+    if unmatched:
+        print(f"\n{unmatched} question(s) name a page/heading that is not in the index and were skipped")
+
+
+def _ints(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def _weights(value: str) -> List[Tuple[float, float]]:
+    pairs = []
+    for part in value.split(","):
+        vector, lexical = part.split(":")
+        pairs.append((float(vector), float(lexical)))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval recall/MRR vs. latency and memory over the textbook")
+    parser.add_argument("--chunk-tokens", type=_ints, default=[64, 400], help="chunk sizes to ingest, e.g. 64,400")
+    parser.add_argument("--dtypes", type=lambda v: v.split(","), default=["float32", "int8"])
+    parser.add_argument("--modes", type=lambda v: v.split(","), default=list(MODES))
+    parser.add_argument("--hybrid-weights", type=_weights, default=[(1.0, 1.0)], help="vector:lexical RRF weights")
+    parser.add_argument("--k", type=_ints, default=[1, 3, 5, 10])
+    parser.add_argument("--adaptive", action="store_true",
+                        help="also run every mode with the adaptive top_k cutoff (ADAPTIVE_TOP_K_* settings)")
+    parser.add_argument("--questions", choices=("all", "headings", "seeded"), default="all")
+    parser.add_argument("--questions-file", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--docs-path", default=os.path.join(BACKEND_DIR, "..", "physical-ai-humanoid-robotics", "docs"))
+    parser.add_argument("--output", default=None, help="also write the rows as JSON here")
+    args = parser.parse_args()
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        # Must be in place before anything under src/ reads its settings
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        os.environ.setdefault("LLM_PROVIDER", "stub")
+        os.environ.setdefault("STUB_EMBEDDING_LATENCY_SECONDS", "0")
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/unused.db")
+        os.environ["RETRIEVER_BACKEND"] = "embedded"
+        rows = asyncio.run(run(args))
+
+    print_table(rows, args.k)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import argparse
+import asyncio
+
+from src.services.retention_service import RetentionService
+
+
+async def compact(ttl_hours: float, max_batches: int):
+    """Delete anonymous chat sessions idle for longer than the TTL."""
+    service = RetentionService(
+        ttl_seconds=ttl_hours * 3600 if ttl_hours is not None else None,
+        max_batches=max_batches
+    )
+    report = await service.compact()
+
+    print(
+        f"Deleted {report.sessions_deleted} anonymous sessions and {report.messages_deleted} messages "
+        f"idle since {report.cutoff:%Y-%m-%d %H:%M} UTC in {report.batches} batches ({report.duration_seconds}s)"
+        f"{'; more remain, run again' if report.truncated else ''}."
+    )
+    if report.error:
+        print(f"Stopped on error: {report.error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact expired anonymous chat sessions")
+    parser.add_argument("--ttl-hours", type=float, default=None, help="override ANONYMOUS_SESSION_TTL_SECONDS")
+    parser.add_argument("--max-batches", type=int, default=None, help="override RETENTION_MAX_BATCHES_PER_RUN")
+    args = parser.parse_args()
+    asyncio.run(compact(args.ttl_hours, args.max_batches))
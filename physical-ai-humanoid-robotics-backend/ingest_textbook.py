@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+
+from src.services.ingestion_service import TextbookIngestionService
+from src.utils.clients import client_pool
+
+
+async def ingest(force: bool):
+    """Sync the Docusaurus textbook chapters into the vector store."""
+    service = TextbookIngestionService(client_pool.qdrant, client_pool.openai)
+    try:
+        report = await service.run(force=force)
+    finally:
+        await client_pool.shutdown()
+
+    print(
+        f"Scanned {report.files_scanned} files: {report.files_changed} changed, {report.files_removed} removed. "
+        f"Embedded {report.chunks_embedded} chunks, deleted {report.chunks_deleted}, "
+        f"{report.chunks_total} chunks indexed{' (full rebuild)' if report.full_rebuild else ''}."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the textbook into the RAG vector store")
+    parser.add_argument("--force", action="store_true", help="re-embed every chunk, ignoring the manifest")
+    args = parser.parse_args()
+    asyncio.run(ingest(args.force))
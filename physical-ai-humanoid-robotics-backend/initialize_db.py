@@ -1,6 +1,58 @@
 import asyncio
+from sqlalchemy import func, inspect, select, text, update
 from src.database.database import engine, Base
 from src.database.models import User, ChatSession, ChatMessage
+from src.utils.security import settings
+
+
+# Columns added to tables that may already exist in deployed databases
+ADDED_COLUMNS = {
+    ChatSession.__table__: ["message_count", "last_message_at", "last_message_preview"],
+}
+
+# Indexes replaced by wider ones in the models
+SUPERSEDED_INDEXES = ["ix_chat_messages_session_created_at"]
+
+
+def add_missing_columns(sync_conn) -> list:
+    """create_all never alters existing tables, so add newer columns by hand."""
+    inspector = inspect(sync_conn)
+    added = []
+    for table, names in ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(dialect=sync_conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            sync_conn.execute(text(ddl))
+            added.append(f"{table.name}.{name}")
+    return added
+
+
+def backfill_session_activity():
+    """UPDATE filling the denormalised session columns from chat_messages."""
+    in_session = ChatMessage.chat_session_id == ChatSession.id
+    return (
+        update(ChatSession)
+        .where(ChatSession.last_message_at.is_(None))
+        .values(
+            message_count=select(func.count(ChatMessage.id)).where(in_session).scalar_subquery(),
+            last_message_at=func.coalesce(
+                select(func.max(ChatMessage.created_at)).where(in_session).scalar_subquery(),
+                ChatSession.created_at
+            ),
+            last_message_preview=select(func.substr(ChatMessage.content, 1, settings.CHAT_SESSION_PREVIEW_CHARS))
+            .where(in_session)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+    )
 
 
 async def create_tables():
@@ -8,8 +60,18 @@ async def create_tables():
     async with engine.begin() as conn:
         # Create all tables
         await conn.run_sync(Base.metadata.create_all)
+        added = await conn.run_sync(add_missing_columns)
+        if added:
+            print(f"Added columns: {', '.join(added)}")
+        await conn.execute(backfill_session_activity())
+        for name in SUPERSEDED_INDEXES:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        # create_all skips indexes on tables that already existed
+        for table in (ChatMessage.__table__, ChatSession.__table__):
+            for index in table.indexes:
+                await conn.run_sync(lambda sync_conn, index=index: index.create(sync_conn, checkfirst=True))
     print("Database tables created successfully!")
 
 
 if __name__ == "__main__":
-    asyncio.run(create_tables())
\ No newline at end of file
+    asyncio.run(create_tables())
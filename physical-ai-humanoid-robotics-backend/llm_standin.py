@@ -0,0 +1,30 @@
+import argparse
+
+import uvicorn
+
+from src.services.llm_providers import SimulatedLLM, create_standin_app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a deterministic OpenAI-compatible stand-in; run the API with LLM_PROVIDER=local against it"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--seed", type=int, default=None, help="override STUB_LLM_SEED")
+    parser.add_argument("--ttft", type=float, default=None, help="median time to first token in seconds (STUB_LLM_TTFT_SECONDS)")
+    parser.add_argument("--sigma", type=float, default=None, help="lognormal latency spread (STUB_LLM_LATENCY_SIGMA)")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="override STUB_LLM_TOKENS_PER_SECOND")
+    parser.add_argument("--error-rate", type=float, default=None, help="share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=None, help="share of requests answered with a 429")
+    args = parser.parse_args()
+
+    llm = SimulatedLLM(
+        seed=args.seed,
+        ttft_seconds=args.ttft,
+        latency_sigma=args.sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate
+    )
+    uvicorn.run(create_standin_app(llm), host=args.host, port=args.port, log_level="warning")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, JSON, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -21,6 +21,10 @@ class User(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # The session list is a keyset walk over a user's sessions by recent activity
+        Index("ix_chat_sessions_user_last_message_at", "user_id", "last_message_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -28,10 +32,19 @@ class ChatSession(Base):
     context = Column(JSON, nullable=True)  # Use JSON column type for context
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Denormalised from chat_messages, maintained by the message writes
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_message_at = Column(DateTime, nullable=True)  # created_at until the first message
+    last_message_preview = Column(String(200), nullable=True)
 
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # History pages and exports walk a session's messages in (created_at, id) order;
+        # id is in the index so ties (a turn's two messages) need no extra sort
+        Index("ix_chat_messages_session_created_at_id", "chat_session_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     chat_session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
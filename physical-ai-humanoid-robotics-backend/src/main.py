@@ -1,12 +1,40 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from src.routes import auth, content, chatbot, progress, personalization, translation, hardware
 from src.routes import ingestion, retrieval
+from src.utils.clients import client_pool
+from src.services.answer_cache import answer_cache, selected_text_cache
+from src.services.prompts import prompt_cache_stats
+from src.services.single_flight import single_flight
+from src.services.llm_dispatcher import LLMOverloaded, llm_dispatcher
+from src.services.model_router import model_router
+from src.services.adaptive_top_k import adaptive_top_k
+from src.services.retrieval_scope import scoped_search_policy
+from src.services.retention_service import retention_service
+from src.utils.metrics import registry
+from src.utils.security import settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the shared Qdrant/OpenAI clients once and close them on shutdown
+    await client_pool.startup()
+    # Expired anonymous sessions are compacted in the background
+    retention_task = asyncio.create_task(retention_service.run_periodically()) if settings.RETENTION_ENABLED else None
+    yield
+    if retention_task is not None:
+        retention_task.cancel()
+    await client_pool.shutdown()
+
 
 app = FastAPI(
     title="Physical AI & Humanoid Robotics Textbook API",
     description="Backend API for the Physical AI textbook with authentication, content management, and RAG chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -29,10 +57,53 @@ app.include_router(personalization.router, prefix="/api/personalization", tags=[
 app.include_router(translation.router, prefix="/api/translation", tags=["translation"])
 app.include_router(hardware.router, prefix="/api/hardware", tags=["hardware"])
 
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"The assistant is busy ({exc.reason}). Please retry shortly."},
+        headers={"Retry-After": exc.retry_after_header}
+    )
+
 @app.get("/")
 def read_root():
     return {"message": "Physical AI & Humanoid Robotics Textbook API"}
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/pools")
+def pool_stats():
+    return client_pool.stats()
+
+@app.get("/health/caches")
+def cache_stats():
+    return {
+        "answers": answer_cache.stats(),
+        "selected_text": selected_text_cache.stats(),
+        "query_embeddings": client_pool.embedding_batcher.stats(),
+        "single_flight": single_flight.stats(),
+        "prompt_tokens": prompt_cache_stats.stats()
+    }
+
+@app.get("/health/llm")
+def llm_stats():
+    return llm_dispatcher.stats()
+
+@app.get("/health/router")
+def router_stats():
+    return model_router.stats()
+
+@app.get("/health/retrieval")
+def retrieval_stats():
+    return {"adaptive_top_k": adaptive_top_k.stats(), "scoped_search": scoped_search_policy.stats()}
+
+@app.get("/health/retention")
+def retention_stats():
+    return retention_service.stats()
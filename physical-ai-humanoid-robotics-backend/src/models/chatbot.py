@@ -3,6 +3,8 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
 
+from src.models.content import ModuleType
+
 
 class MessageRole(str, Enum):
     USER = "user"
@@ -29,6 +31,12 @@ class ChatMessage(ChatMessageBase):
         from_attributes = True
 
 
+class ChatHistoryPage(BaseModel):
+    messages: List[ChatMessage]  # oldest first
+    next_cursor: Optional[str] = None  # pass as `before` to fetch the preceding page
+    has_more: bool = False
+
+
 class ChatSessionBase(BaseModel):
     user_id: Optional[str] = None
     title: str
@@ -48,16 +56,39 @@ class ChatSession(ChatSessionBase):
     id: str
     created_at: datetime
     updated_at: datetime
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class ChatSessionPage(BaseModel):
+    sessions: List[ChatSession]  # most recently active first
+    next_cursor: Optional[str] = None  # pass as `before` to fetch the next page
+    has_more: bool = False
+
+
+class ChatDebug(BaseModel):
+    # Wall-clock milliseconds per pipeline stage: db_read, embedding, vector_search,
+    # lexical_search, prompt_build, llm_ttft (streams), llm_total, db_write, total
+    timings_ms: Dict[str, float]
+    # Adaptive top_k (chunks fetched, chunks kept and why the list was cut there)
+    # and, for scoped queries, whether the scope was kept or fell back to global search
+    retrieval: Optional[Dict[str, Any]] = None
+
+
 class ChatResponse(BaseModel):
     message: str
     sources: List[str]
     confidence: float
     reasoning_steps: List[str]
+    cached: bool = False
+    context_tokens: Optional[int] = None
+    model: Optional[str] = None
+    chunks_used: Optional[int] = None  # retrieved chunks that made it into the prompt
+    debug: Optional[ChatDebug] = None
 
     class Config:
         from_attributes = True
@@ -68,15 +99,26 @@ class RetrievalResult(BaseModel):
     content: str
     similarity_score: float
     source: str
+    lexical_score: Optional[float] = None
+    fusion_score: Optional[float] = None
+    module_type: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class RetrievalScope(BaseModel):
+    # Narrows RAG retrieval to part of the textbook; every field given must match
+    module_type: Optional[ModuleType] = None
+    chapter: Optional[str] = None  # chapter slug, e.g. "chapter-1-isaac-sim-and-synthetic-data"
+    page: Optional[str] = None  # URL or docs path of the page being read
+
+
 class ChatbotConfig(BaseModel):
     model_name: str = "gpt-4"
     temperature: float = 0.7
     max_tokens: int = 1000
+    max_context_tokens: int = 3000
     retrieval_top_k: int = 5
     enforce_selected_text: bool = True
 
@@ -0,0 +1,57 @@
+from pydantic import BaseModel
+from typing import Optional, List
+
+
+class TextbookChunk(BaseModel):
+    id: str
+    path: str
+    module: str
+    module_type: Optional[str] = None
+    chapter: str
+    title: str
+    heading: str
+    content: str
+    chunk_hash: str
+    token_count: int
+
+    @property
+    def embedding_text(self) -> str:
+        # The chapter title gives short sections enough context to embed well
+        if self.heading and self.heading != self.title:
+            return f"{self.title}\n\n{self.content}"
+        return self.content
+
+    @property
+    def source(self) -> str:
+        return f"{self.path}#{self.anchor}" if self.anchor else self.path
+
+    @property
+    def anchor(self) -> str:
+        # Same slug rules Docusaurus uses for heading anchors
+        slug = "".join(c if c.isalnum() else "-" for c in self.heading.lower())
+        return "-".join(part for part in slug.split("-") if part)
+
+    def to_payload(self) -> dict:
+        return {
+            "content_id": self.id,
+            "content": self.content,
+            "source": self.source,
+            "path": self.path,
+            "module": self.module,
+            "module_type": self.module_type,
+            "chapter": self.chapter,
+            "title": self.title,
+            "heading": self.heading,
+            "chunk_hash": self.chunk_hash,
+        }
+
+
+class IngestionReport(BaseModel):
+    files_scanned: int = 0
+    files_changed: int = 0
+    files_removed: int = 0
+    chunks_embedded: int = 0
+    chunks_deleted: int = 0
+    chunks_total: int = 0
+    full_rebuild: bool = False
+    changed_paths: List[str] = []
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, computed_field
+from typing import Optional
+from datetime import datetime
+
+
+class CompactionReport(BaseModel):
+    cutoff: datetime
+    sessions_deleted: int = 0
+    messages_deleted: int = 0
+    batches: int = 0
+    duration_seconds: float = 0.0
+    # True when the run hit max_batches; expired sessions may remain for the next run
+    truncated: bool = False
+    error: Optional[str] = None
+
+    @computed_field
+    @property
+    def rows_reclaimed(self) -> int:
+        return self.sessions_deleted + self.messages_deleted
@@ -1,16 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
-import openai
-from qdrant_client import QdrantClient
-import os
+from typing import Optional
+import json
 import uuid
 
 from src.services.chatbot_service import ChatbotService
-from src.models.chatbot import ChatSessionCreate, ChatSessionUpdate, ChatSession, ChatResponse
+from src.models.chatbot import ChatSessionCreate, ChatSessionUpdate, ChatSession, ChatResponse, ChatMessage, ChatHistoryPage, ChatSessionPage, RetrievalScope
+from src.models.content import ModuleType
 from src.database.database import get_db
 from src.routes.auth import get_current_user
-from src.utils.security import settings, verify_token, TokenData
+from src.utils.security import verify_token, TokenData
+from src.utils.clients import client_pool
 
 
 router = APIRouter()
@@ -25,17 +27,34 @@ async def get_current_user_optional(credentials: HTTPAuthorizationCredentials =
     return token_data or None
 
 
+def get_retrieval_scope(
+    module_type: Optional[ModuleType] = None,
+    chapter: Optional[str] = None,
+    page: Optional[str] = None
+) -> Optional[RetrievalScope]:
+    # Optional query parameters narrowing retrieval to what the student is reading
+    if module_type is None and not chapter and not page:
+        return None
+    return RetrievalScope(module_type=module_type, chapter=chapter, page=page)
+
+
+async def get_chatbot_service(db: AsyncSession = Depends(get_db)) -> ChatbotService:
+    # Qdrant and OpenAI clients are process-wide and pooled, see src/utils/clients.py
+    return ChatbotService(
+        db, client_pool.qdrant, client_pool.openai,
+        search_executor=client_pool.search_executor,
+        embedding_batcher=client_pool.embedding_batcher,
+        retriever=client_pool.retriever,
+        completion_client=client_pool.openai_completions
+    )
+
+
 @router.post("/sessions", response_model=ChatSession)
 async def create_chat_session(
     session_data: ChatSessionCreate,
     current_user: TokenData = Depends(get_current_user_optional),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
-
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
     # For anonymous sessions, user_id can be None or we can generate a temporary ID
     if current_user:
         session_data.user_id = current_user.user_id
@@ -48,13 +67,8 @@ async def create_chat_session(
 async def get_chat_session(
     session_id: str,
     current_user: TokenData = Depends(get_current_user_optional),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
-
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
     session = await chatbot_service.get_chat_session(session_id)
 
     if not session:
@@ -79,13 +93,8 @@ async def update_chat_session(
     session_id: str,
     session_update: ChatSessionUpdate,
     current_user=Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
-
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
     updated_session = await chatbot_service.update_chat_session(session_id, session_update)
 
     if not updated_session or updated_session.user_id != current_user.user_id:
@@ -101,16 +110,48 @@ async def update_chat_session(
 async def process_query_with_rag(
     session_id: str,
     query: str,
+    debug: bool = False,
+    scope: Optional[RetrievalScope] = Depends(get_retrieval_scope),
     current_user: TokenData = Depends(get_current_user_optional),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
+    user_id = current_user.user_id if current_user else f"anonymous_{uuid.uuid4()}"
+    return await chatbot_service.process_query_with_rag(query, session_id, user_id, debug, scope)
 
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
+
+@router.post("/sessions/{session_id}/query/stream")
+async def stream_query_with_rag(
+    session_id: str,
+    query: str,
+    debug: bool = False,
+    scope: Optional[RetrievalScope] = Depends(get_retrieval_scope),
+    current_user: TokenData = Depends(get_current_user_optional),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
+):
+    """
+    Stream the RAG answer as newline-delimited JSON events:
+    sources first, then completion deltas, then a final done event
+    (or an error event if the completion fails part-way)
+    """
     user_id = current_user.user_id if current_user else f"anonymous_{uuid.uuid4()}"
-    return await chatbot_service.process_query_with_rag(query, session_id, user_id)
+    events = chatbot_service.stream_query_with_rag(query, session_id, user_id, debug, scope)
+    # Run up to the first event here so an overloaded LLM queue still becomes a 503
+    first_event = await events.__anext__()
+
+    async def event_stream():
+        try:
+            yield json.dumps(first_event) + "\n"
+            async for event in events:
+                yield json.dumps(event) + "\n"
+        finally:
+            # On a disconnect the service saves the turn now, not when the generator is collected
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/enforce-selected-text", response_model=ChatResponse)
@@ -118,28 +159,16 @@ async def enforce_selected_text(
     query: str,
     selected_text: str,
     current_user=Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
-
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
     return await chatbot_service.enforce_selected_text(query, selected_text)
 
 
-@router.get("/sessions/{session_id}/history", response_model=list)
-async def get_chat_history(
+async def get_owned_session(
     session_id: str,
-    limit: int = 10,
     current_user=Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
-
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
     session = await chatbot_service.get_chat_session(session_id)
 
     if not session or session.user_id != current_user.user_id:
@@ -148,17 +177,64 @@ async def get_chat_history(
             detail="Chat session not found"
         )
 
-    return await chatbot_service.get_chat_history(session_id, limit)
+    return session
+
 
+@router.get("/sessions/{session_id}/history", response_model=ChatHistoryPage)
+async def get_chat_history(
+    session_id: str,
+    limit: int = 10,
+    before: Optional[str] = None,
+    session=Depends(get_owned_session),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
+):
+    """
+    Latest messages first page; follow next_cursor via `before` to page back
+    """
+    try:
+        return await chatbot_service.get_chat_history_page(session_id, limit, before)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
-@router.get("/sessions/", response_model=list)
+
+@router.get("/sessions/{session_id}/export")
+async def export_chat_history(
+    session_id: str,
+    session=Depends(get_owned_session),
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
+):
+    """
+    Stream the full history as newline-delimited JSON, one message per line, oldest first
+    """
+    async def message_stream():
+        async for message in chatbot_service.export_session_messages(session_id):
+            yield ChatMessage.model_validate(message).model_dump_json() + "\n"
+
+    return StreamingResponse(
+        message_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-{session_id}.ndjson"'}
+    )
+
+
+@router.get("/sessions/", response_model=ChatSessionPage)
 async def get_all_sessions(
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
     current_user=Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    chatbot_service: ChatbotService = Depends(get_chatbot_service)
 ):
-    # Initialize Qdrant and OpenAI clients (in a real app, these would be properly configured)
-    qdrant_client = QdrantClient(":memory:")  # For demo purposes
-    openai_client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)  # Use API key from settings
-
-    chatbot_service = ChatbotService(db, qdrant_client, openai_client)
-    return await chatbot_service.get_all_sessions(current_user.user_id)
\ No newline at end of file
+    """
+    Most recently active sessions first, each with its message count and a
+    last-message preview; follow next_cursor via `before` for more
+    """
+    try:
+        return await chatbot_service.get_sessions_page(current_user.user_id, limit, before)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
\ No newline at end of file
@@ -3,9 +3,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
 from src.services.content_service import ContentService
+from src.services.ingestion_service import TextbookIngestionService
 from src.models.content import ContentCreate
+from src.models.ingestion import IngestionReport
 from src.database.database import get_db
 from src.routes.auth import get_current_user
+from src.utils.clients import client_pool
 
 router = APIRouter()
 
@@ -73,4 +76,16 @@ async def ingest_text(
         "message": "Text content ingested successfully",
         "content_id": created_content.id,
         "title": created_content.title
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/ingest/textbook", response_model=IngestionReport)
+async def ingest_textbook(
+    force: bool = False,
+    current_user=Depends(get_current_user)
+):
+    """
+    Incrementally sync the textbook chapters into the vector store
+    """
+    ingestion_service = TextbookIngestionService(client_pool.qdrant, client_pool.openai)
+    return await ingestion_service.run(force=force)
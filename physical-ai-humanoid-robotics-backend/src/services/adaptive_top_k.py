@@ -0,0 +1,118 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.models.chatbot import RetrievalResult
+from src.utils.security import settings
+
+
+@dataclass
+class CutoffDecision:
+    kept: int
+    fetched: int
+    reason: str
+    module_type: Optional[str]
+
+
+def relative_scores(results: List[RetrievalResult]) -> List[float]:
+    """
+    Each result's score as a share of the best one. Fused (RRF) scores only
+    encode ranks, so hybrid results are judged on their vector similarity and
+    BM25 score instead, each relative to the best of its own list, taking
+    whichever signal rates the chunk higher.
+    """
+    top_similarity = max((result.similarity_score for result in results), default=0.0)
+    top_lexical = max((result.lexical_score or 0.0 for result in results), default=0.0)
+    scores = []
+    for result in results:
+        similarity = result.similarity_score / top_similarity if top_similarity > 0 else 0.0
+        lexical = (result.lexical_score or 0.0) / top_lexical if top_lexical > 0 else 0.0
+        scores.append(max(similarity, lexical))
+    return scores
+
+
+class AdaptiveTopK:
+    """
+    Decide how many of the retrieved chunks a query actually needs.
+
+    Retrieval over-fetches `candidates` chunks, best first. Scores are taken
+    relative to the best one (see relative_scores); chunks below
+    min_relative_score are dropped, and so is everything below the largest
+    drop between neighbouring scores when that drop is at least min_gap: a
+    first hit far above the rest is answered from that hit alone instead of
+    dragging four noise chunks into the prompt. The kept chunks stay in their
+    ranked order, clamped to [floor, ceiling]; module_limits overrides both
+    per module (the module of the best hit), e.g. {"nvidia_isaac": (2, 6)}
+    for chapters whose answers tend to span several sections.
+
+    Decisions are counted per reason, with the average number of chunks
+    kept, so the thresholds can be tuned against the retrieval benchmark.
+    """
+
+    def __init__(self, candidates: Optional[int] = None, floor: Optional[int] = None, ceiling: Optional[int] = None,
+                 min_relative_score: Optional[float] = None, min_gap: Optional[float] = None,
+                 module_limits: Optional[Dict[str, Sequence[int]]] = None, enabled: Optional[bool] = None):
+        self.candidates = candidates or settings.ADAPTIVE_TOP_K_CANDIDATES
+        self.floor = floor if floor is not None else settings.ADAPTIVE_TOP_K_FLOOR
+        self.ceiling = ceiling or settings.ADAPTIVE_TOP_K_CEILING
+        self.min_relative_score = (min_relative_score if min_relative_score is not None
+                                   else settings.ADAPTIVE_TOP_K_MIN_RELATIVE_SCORE)
+        self.min_gap = min_gap if min_gap is not None else settings.ADAPTIVE_TOP_K_MIN_GAP
+        self.module_limits = dict(module_limits if module_limits is not None else settings.ADAPTIVE_TOP_K_MODULE_LIMITS)
+        self.enabled = enabled if enabled is not None else settings.ADAPTIVE_TOP_K_ENABLED
+        self.decisions: Counter = Counter()
+        self.kept_total = 0
+        self.fetched_total = 0
+
+    def limits(self, module_type: Optional[str]) -> Tuple[int, int]:
+        floor, ceiling = self.module_limits.get(module_type, (self.floor, self.ceiling))
+        return floor, max(floor, ceiling)
+
+    def cut(self, results: List[RetrievalResult]) -> Tuple[List[RetrievalResult], CutoffDecision]:
+        """Keep the results (in their ranked order) that clear the score cutoffs."""
+        module_type = results[0].module_type if results else None
+        floor, ceiling = self.limits(module_type)
+        scores = relative_scores(results)
+
+        threshold, reason = 0.0, "all"
+        ranked = sorted((score for score in scores if score >= self.min_relative_score), reverse=True)
+        if ranked and len(ranked) < len(scores):
+            threshold, reason = self.min_relative_score, "relative_score"
+        # Largest drop between neighbouring scores among what is left
+        gaps = [(ranked[i] - ranked[i + 1], ranked[i]) for i in range(len(ranked) - 1)]
+        if gaps:
+            gap, lowest_kept = max(gaps)
+            if gap >= self.min_gap:
+                threshold, reason = lowest_kept, "score_gap"
+
+        keep = [i for i, score in enumerate(scores) if score >= threshold] if threshold > 0 else list(range(len(results)))
+        if len(keep) > ceiling:
+            keep, reason = keep[:ceiling], "ceiling"
+        if len(keep) < min(floor, len(results)):
+            # Top up with the best-ranked of the dropped results
+            keep = sorted(keep + [i for i in range(len(results)) if i not in keep][:floor - len(keep)])
+            reason = "floor"
+
+        kept = [results[i] for i in keep]
+        self.decisions[reason] += 1
+        self.kept_total += len(kept)
+        self.fetched_total += len(results)
+        return kept, CutoffDecision(kept=len(kept), fetched=len(results), reason=reason, module_type=module_type)
+
+    def stats(self) -> Dict[str, Any]:
+        queries = sum(self.decisions.values())
+        return {
+            "enabled": self.enabled,
+            "candidates": self.candidates,
+            "floor": self.floor,
+            "ceiling": self.ceiling,
+            "min_relative_score": self.min_relative_score,
+            "min_gap": self.min_gap,
+            "module_limits": self.module_limits,
+            "decisions": dict(sorted(self.decisions.items())),
+            "avg_fetched": round(self.fetched_total / queries, 2) if queries else 0.0,
+            "avg_kept": round(self.kept_total / queries, 2) if queries else 0.0,
+        }
+
+
+adaptive_top_k = AdaptiveTopK()
@@ -0,0 +1,181 @@
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import hashlib
+import math
+import re
+import unicodedata
+
+from src.models.chatbot import ChatbotConfig
+from src.services.index_generations import current_generation
+from src.utils.cache import LRUCache
+from src.utils.security import settings
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used for cache keys: case, spacing and trailing punctuation do not matter."""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return _WHITESPACE_RE.sub(" ", query).strip().rstrip("?!. ")
+
+
+def _unit_vector(vector: Iterable[float]) -> array:
+    values = array("f", vector)
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return array("f", (v / norm for v in values))
+
+
+@dataclass
+class CachedAnswer:
+    message: str
+    sources: List[str]
+    query_vector: Optional[array] = None
+
+
+class AnswerCache:
+    """
+    Cache of RAG answers, so repeated questions skip the LLM call.
+
+    Answers are grouped by their retrieval context: the set of chunk IDs that
+    were retrieved plus the model and temperature. Inside a group a query hits
+    either on its normalised text or, for near-duplicates, when the cosine
+    similarity of the query embeddings reaches similarity_threshold. Entries
+    are evicted LRU-first and expire after ttl_seconds.
+
+    With an index_dir, every lookup and store first reads the published index
+    generation there and drops everything when it has changed. Ingestion runs
+    in its own process and each server worker has its own cache, so each one
+    notices a re-ingest this way on its next request; nothing is pushed to it.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None, similarity_threshold: float = None,
+                 index_dir: Optional[str] = None):
+        self.index_root = Path(index_dir) if index_dir else None
+        self.generation = current_generation(self.index_root) if self.index_root else None
+        self.generation_changes = 0
+        self.similarity_threshold = similarity_threshold or settings.ANSWER_CACHE_SIMILARITY
+        self._groups: Dict[str, Set[Hashable]] = {}
+        self._entries: LRUCache[CachedAnswer] = LRUCache(
+            max_entries or settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds or settings.ANSWER_CACHE_TTL_SECONDS,
+            on_evict=self._forget
+        )
+        self.near_duplicate_hits = 0
+
+    @staticmethod
+    def context_key(chunk_ids: Iterable[str], config: ChatbotConfig) -> str:
+        material = "|".join(sorted(chunk_ids)) + f"|{config.model_name}|{config.temperature}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _forget(self, key: Tuple[str, str], _: CachedAnswer) -> None:
+        group = self._groups.get(key[0])
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._groups[key[0]]
+
+    def _follow_generation(self) -> None:
+        if self.index_root is None:
+            return
+        generation = current_generation(self.index_root)
+        if generation != self.generation:
+            # Answers were generated from the chunks of the previous index
+            self.invalidate()
+            self.generation = generation
+            self.generation_changes += 1
+
+    def get(self, query: str, chunk_ids: Iterable[str], config: ChatbotConfig,
+            query_vector: Optional[List[float]] = None) -> Optional[CachedAnswer]:
+        self._follow_generation()
+        group_key = self.context_key(chunk_ids, config)
+        exact_key = (group_key, normalize_query(query))
+
+        if exact_key in self._entries or query_vector is None:
+            return self._entries.get(exact_key)
+
+        # Near-duplicate lookup: only answers built from the same context qualify
+        target = _unit_vector(query_vector)
+        best_key, best_score = None, self.similarity_threshold
+        for key in list(self._groups.get(group_key, ())):
+            candidate = self._entries.peek(key)
+            if candidate is None or candidate.query_vector is None:
+                continue
+            score = sum(a * b for a, b in zip(target, candidate.query_vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        if best_key is None:
+            return self._entries.get(exact_key)  # records the miss
+        self.near_duplicate_hits += 1
+        return self._entries.get(best_key)
+
+    def put(self, query: str, chunk_ids: Iterable[str], config: ChatbotConfig, message: str,
+            sources: List[str], query_vector: Optional[List[float]] = None) -> None:
+        self._follow_generation()
+        group_key = self.context_key(chunk_ids, config)
+        key = (group_key, normalize_query(query))
+        self._entries.put(key, CachedAnswer(
+            message=message,
+            sources=list(sources),
+            query_vector=_unit_vector(query_vector) if query_vector is not None else None
+        ))
+        self._groups.setdefault(group_key, set()).add(key)
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+        self._groups.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self._entries.stats(),
+            "near_duplicate_hits": self.near_duplicate_hits,
+            "index_generation_changes": self.generation_changes,
+        }
+
+
+class SelectedTextCache:
+    """
+    Cache of /enforce-selected-text answers.
+
+    The answer depends only on the passage, the question and the model
+    settings, so the key is a hash of the passage (whitespace-normalised, as
+    highlights of the same paragraph differ in line breaks), a hash of the
+    normalised question, the model and the temperature. Passages are never
+    stored, only their hashes. Entries are evicted LRU-first and expire after
+    ttl_seconds; re-ingesting the textbook does not affect them.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self._entries: LRUCache[str] = LRUCache(
+            max_entries or settings.SELECTED_TEXT_CACHE_MAX_ENTRIES,
+            ttl_seconds or settings.SELECTED_TEXT_CACHE_TTL_SECONDS
+        )
+
+    @staticmethod
+    def key(query: str, selected_text: str, config: ChatbotConfig) -> Tuple[str, str, str, float]:
+        passage = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", selected_text)).strip()
+        return (
+            hashlib.sha256(passage.encode("utf-8")).hexdigest(),
+            hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest(),
+            config.model_name,
+            config.temperature
+        )
+
+    def get(self, query: str, selected_text: str, config: ChatbotConfig) -> Optional[str]:
+        return self._entries.get(self.key(query, selected_text, config))
+
+    def put(self, query: str, selected_text: str, config: ChatbotConfig, message: str) -> None:
+        self._entries.put(self.key(query, selected_text, config), message)
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return self._entries.stats()
+
+
+answer_cache = AnswerCache(index_dir=settings.RAG_INDEX_DIR)
+selected_text_cache = SelectedTextCache()
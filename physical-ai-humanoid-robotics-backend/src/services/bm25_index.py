@@ -0,0 +1,173 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import math
+import re
+
+import numpy as np
+
+from src.services.index_generations import current_index_dir
+from src.services.vector_index import PayloadFilter, payload_mask, save_array, save_json
+from src.utils.security import settings
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+# Short list on purpose: technical terms like "action" or "node" must stay searchable
+_STOPWORDS = frozenset("""
+a an and are as at be by for from how in into is it its of on or that the this to was what when
+where which who why with you your can do does
+""".split())
+
+_ARRAY_FILES = ("offsets", "doc_ids", "term_freqs", "doc_lengths")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the textbook chunks, stored as flat arrays.
+
+    Postings are CSR-style: offsets[t]:offsets[t + 1] slices doc_ids and
+    term_freqs for term t. The arrays are saved as .npy files and loaded with
+    mmap, so opening the index is cheap and a query only touches the postings
+    of its own terms.
+    """
+
+    def __init__(self, vocab: Dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, doc_lengths: np.ndarray, docs: List[Dict[str, Any]],
+                 k1: float = None, b: float = None):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.docs = docs
+        self.k1 = k1 if k1 is not None else settings.BM25_K1
+        self.b = b if b is not None else settings.BM25_B
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def build(cls, docs: Sequence[Dict[str, Any]], text_key: str = "content") -> "BM25Index":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_lengths = np.zeros(len(docs), dtype=np.int32)
+        for doc_id, doc in enumerate(docs):
+            tokens = tokenize(doc[text_key])
+            doc_lengths[doc_id] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        vocab = {term: term_id for term_id, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        doc_id_parts, tf_parts = [], []
+        for term, term_id in vocab.items():
+            counts = postings[term]
+            offsets[term_id + 1] = offsets[term_id] + len(counts)
+            doc_id_parts.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            tf_parts.append(np.fromiter(counts.values(), dtype=np.uint16, count=len(counts)))
+
+        return cls(
+            vocab,
+            offsets,
+            np.concatenate(doc_id_parts) if doc_id_parts else np.zeros(0, dtype=np.int32),
+            np.concatenate(tf_parts) if tf_parts else np.zeros(0, dtype=np.uint16),
+            doc_lengths,
+            list(docs),
+        )
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Every file is replaced by rename, never rewritten under a reader's mmap
+        for name in _ARRAY_FILES:
+            save_array(directory / f"{name}.npy", getattr(self, name))
+        save_json(directory / "vocab.json", self.vocab)
+        # docs.json is written last; its mtime marks a complete index
+        save_json(directory / "docs.json", self.docs)
+
+    @classmethod
+    def load(cls, directory: Path) -> "BM25Index":
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in _ARRAY_FILES}
+        with open(directory / "vocab.json", "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(directory / "docs.json", "r", encoding="utf-8") as f:
+            docs = json.load(f)
+        return cls(vocab, docs=docs, **arrays)
+
+    def filter_mask(self, payload_filter: PayloadFilter) -> np.ndarray:
+        """Boolean mask of the documents whose payload matches every condition."""
+        return payload_mask(self.docs, payload_filter, self._columns)
+
+    def search(self, query: str, top_k: int, doc_filter: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Return up to top_k (doc index, score) pairs, best first. doc_filter is an
+        optional boolean mask over the documents.
+        """
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        n_docs = len(self.docs)
+        matched = False
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            tfs = self.term_freqs[start:end].astype(np.float32)
+            idf = math.log(1 + (n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_ids] / (self.avg_doc_length or 1.0))
+            # doc_ids are unique within a term's postings, so fancy-index += is safe
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            matched = True
+
+        if not matched:
+            return []
+        if doc_filter is not None:
+            scores[~doc_filter] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in ranked]
+
+
+class BM25Store:
+    """Process-wide handle on the live BM25 index; reloads when a new one is published."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.root = Path(directory or settings.RAG_INDEX_DIR)
+        self._index: Optional[BM25Index] = None
+        self._loaded: Optional[Tuple[Path, float]] = None
+
+    @property
+    def directory(self) -> Path:
+        return current_index_dir(self.root) / "bm25"
+
+    def get(self) -> Optional[BM25Index]:
+        directory = self.directory
+        try:
+            mtime = (directory / "docs.json").stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if self._index is None or (directory, mtime) != self._loaded:
+            self._index = BM25Index.load(directory)
+            self._loaded = (directory, mtime)
+        return self._index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], weights: Optional[Sequence[float]] = None,
+                           k: int = None) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum of weight / (k + rank)."""
+    k = k if k is not None else settings.RRF_K
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+bm25_store = BM25Store()
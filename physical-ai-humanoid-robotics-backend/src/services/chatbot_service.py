@@ -1,9 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, update
 from sqlalchemy.future import select
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable, Tuple
 from fastapi import HTTPException, status
+from dataclasses import asdict
 from datetime import datetime
+from concurrent.futures import Executor
 import asyncio
+import time
 import openai
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
@@ -11,28 +15,88 @@ import uuid
 
 from src.models.chatbot import (
     ChatMessageCreate, ChatSessionCreate,
-    ChatSessionUpdate, ChatResponse, RetrievalResult, ChatbotConfig
+    ChatSessionUpdate, ChatResponse, RetrievalResult, ChatbotConfig, ChatHistoryPage,
+    ChatSessionPage, ChatDebug, RetrievalScope
 )
 from src.database.models import ChatMessage, ChatSession
+from src.services.answer_cache import answer_cache, normalize_query, selected_text_cache
+from src.services.conversation_memory import ConversationState, conversation_memory
+from src.services.embedding_batcher import EmbeddingBatcher
+from src.services.llm_dispatcher import PRIORITY_AUTHENTICATED, LLMOverloaded, SharedPriority, llm_dispatcher, priority_for
+from src.services.context_packer import ContextPacker, PackedContext
+from src.services.bm25_index import bm25_store, reciprocal_rank_fusion
+from src.services.retrievers import QdrantRetriever, VectorRetriever
+from src.services.model_router import model_router
+from src.services.adaptive_top_k import CutoffDecision, adaptive_top_k
+from src.services.retrieval_scope import scope_filter, scoped_search_policy
+from src.services.vector_index import PayloadFilter
+from src.services.prompts import Messages, messages_text, prompt_cache_stats, rag_messages, selected_text_messages
+from src.services.single_flight import single_flight
 from src.models.content import Content
 from src.database.database import get_db
+from src.utils.metrics import StageTimer, rag_chunks_used
+from src.utils.pagination import decode_cursor, encode_cursor
+from src.utils.tokens import count_tokens
+from src.utils.security import settings
+
+
+NO_CONTENT_RESPONSE = "I couldn't find specific information about that topic in the textbook. Please check the relevant chapters or ask a more specific question."
+ERROR_RESPONSE = "I encountered an error while processing your request. Please try again."
+
+
+def message_preview(content: str) -> str:
+    """Single-line excerpt stored on the session for the sidebar."""
+    preview = " ".join(content.split())
+    limit = settings.CHAT_SESSION_PREVIEW_CHARS
+    return preview if len(preview) <= limit else preview[:limit - 1].rstrip() + "…"
 
 
 class ChatbotService:
-    def __init__(self, db: AsyncSession, qdrant_client: QdrantClient, openai_client: openai.AsyncOpenAI):
+    def __init__(self, db: AsyncSession, qdrant_client: QdrantClient, openai_client: openai.AsyncOpenAI,
+                 search_executor: Optional[Executor] = None, embedding_batcher: Optional[EmbeddingBatcher] = None,
+                 retriever: Optional[VectorRetriever] = None, completion_client: Optional[openai.AsyncOpenAI] = None):
         self.db = db
         self.qdrant_client = qdrant_client
         self.openai_client = openai_client
+        # Chat completions (dispatcher-governed, so without SDK retries); defaults to openai_client
+        self.completion_client = completion_client or openai_client
+        # None falls back to the event loop's default executor
+        self.search_executor = search_executor
+        # None embeds each query with its own request
+        self.embedding_batcher = embedding_batcher
+        # Vector backend (Qdrant or the embedded NumPy index), see src/services/retrievers.py
+        self.retriever = retriever or QdrantRetriever(qdrant_client, search_executor)
         self.config = ChatbotConfig()
+        self.context_packer = ContextPacker(self.config)
+        self.answer_cache = answer_cache
+        self.selected_text_cache = selected_text_cache
+        self.bm25_store = bm25_store
+        self.conversation_memory = conversation_memory
+        self.single_flight = single_flight
+        self.prompt_cache_stats = prompt_cache_stats
+        self.model_router = model_router
+        self.adaptive_top_k = adaptive_top_k
+        # How the last retrieve() cut its results; None when adaptive top_k is off
+        self.retrieval_cutoff: Optional[CutoffDecision] = None
+        self.scoped_search_policy = scoped_search_policy
+        # Outcome of the last scoped retrieve(); None for unscoped queries
+        self.scope_outcome: Optional[str] = None
+        # Replaced at the start of every query; the service is created per request
+        self.stage_timer = StageTimer()
+        self.llm_dispatcher = llm_dispatcher
 
     async def create_chat_session(self, session_data: ChatSessionCreate) -> ChatSession:
+        now = datetime.utcnow()
         db_session = ChatSession(
             id=str(uuid.uuid4()),
             user_id=session_data.user_id,
             title=session_data.title,
             context=session_data.context,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            created_at=now,
+            updated_at=now,
+            message_count=0,
+            # New sessions sort by creation time until their first message
+            last_message_at=now
         )
 
         self.db.add(db_session)
@@ -69,6 +133,24 @@ class ChatbotService:
 
         return session
 
+    def _session_activity_update(self, session_id: str, added: int, last_message: str, at: datetime,
+                                 context: Optional[Dict[str, Any]] = None):
+        """UPDATE keeping the session's denormalised counters in step with a message write."""
+        values = dict(
+            updated_at=at,
+            message_count=ChatSession.message_count + added,
+            last_message_at=at,
+            last_message_preview=message_preview(last_message)
+        )
+        if context is not None:
+            values["context"] = context
+        return (
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
     async def add_message_to_session(self, session_id: str, message_data: ChatMessageCreate) -> ChatMessage:
         db_message = ChatMessage(
             id=str(uuid.uuid4()),
@@ -79,111 +161,424 @@ class ChatbotService:
             created_at=datetime.utcnow()
         )
 
+        await self.db.execute(self._session_activity_update(session_id, 1, message_data.content, db_message.created_at))
         self.db.add(db_message)
         await self.db.commit()
         await self.db.refresh(db_message)
 
         return db_message
 
-    async def get_session_messages(self, session_id: str) -> List[ChatMessage]:
-        result = await self.db.execute(
-            select(ChatMessage)
-            .where(ChatMessage.chat_session_id == session_id)
-            .order_by(ChatMessage.created_at)
-        )
-        messages = result.scalars().all()
-        return messages
+    async def _message_keyset(self, session_id: str, limit: int, after: Optional[Tuple[datetime, str]] = None,
+                              before: Optional[Tuple[datetime, str]] = None) -> List[ChatMessage]:
+        """
+        One keyset page of a session's messages, served by the
+        (chat_session_id, created_at, id) index. Pages after a position come back
+        oldest first, pages before it newest first; id breaks created_at ties.
+        """
+        query = select(ChatMessage).where(ChatMessage.chat_session_id == session_id)
+        if after is not None:
+            query = query.where(or_(
+                ChatMessage.created_at > after[0],
+                and_(ChatMessage.created_at == after[0], ChatMessage.id > after[1])
+            )).order_by(ChatMessage.created_at, ChatMessage.id)
+        elif before is not None:
+            query = query.where(or_(
+                ChatMessage.created_at < before[0],
+                and_(ChatMessage.created_at == before[0], ChatMessage.id < before[1])
+            )).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        else:
+            query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+
+        result = await self.db.execute(query.limit(limit))
+        return list(result.scalars().all())
 
-    async def get_relevant_content(self, query: str, top_k: int = 5) -> List[RetrievalResult]:
+    async def get_session_messages(self, session_id: str, limit: int = 100,
+                                   after: Optional[str] = None) -> List[ChatMessage]:
         """
-        Retrieve relevant content from the vector database using Qdrant
+        Messages in chronological order, one page at a time: pass the cursor of
+        the last message received as `after` to continue
         """
-        try:
-            # Search in Qdrant for relevant content
-            search_results = self.qdrant_client.search(
-                collection_name="textbook_content",
-                query_text=query,
-                limit=top_k
-            )
+        return await self._message_keyset(session_id, limit, after=decode_cursor(after) if after else (datetime.min, ""))
 
-            results = []
-            for hit in search_results:
-                result = RetrievalResult(
-                    content_id=hit.payload.get("content_id", ""),
-                    content=hit.payload.get("content", ""),
-                    similarity_score=hit.score,
-                    source=hit.payload.get("source", "unknown")
-                )
-                results.append(result)
+    async def export_session_messages(self, session_id: str) -> AsyncIterator[ChatMessage]:
+        """
+        Every message of a session, oldest first, fetched in keyset batches so
+        memory stays flat however long the session is
+        """
+        position = (datetime.min, "")
+        while True:
+            batch = await self._message_keyset(session_id, settings.CHAT_EXPORT_BATCH_SIZE, after=position)
+            for message in batch:
+                yield message
+                self.db.expunge(message)
+            if len(batch) < settings.CHAT_EXPORT_BATCH_SIZE:
+                return
+            position = (batch[-1].created_at, batch[-1].id)
+
+    async def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a query with the same model used to ingest the textbook
+        """
+        if self.embedding_batcher is not None:
+            return await self.embedding_batcher.embed(query)
 
-            return results
+        response = await self.openai_client.embeddings.create(
+            model=settings.EMBEDDING_MODEL,
+            input=[query]
+        )
+        return response.data[0].embedding
+
+    async def vector_search(self, query_vector: List[float], limit: int,
+                            payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
+        """
+        Search the configured vector backend for the chunks closest to the query vector
+        """
+        with self.stage_timer.stage("vector_search"):
+            return await self.retriever.search(query_vector, limit, payload_filter)
+
+    def lexical_search(self, query: str, limit: int, payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
+        """
+        BM25 search over the local index built at ingestion time
+        """
+        try:
+            index = self.bm25_store.get()
         except Exception as e:
-            print(f"Error retrieving content from Qdrant: {e}")
-            # Fallback: return empty results
+            print(f"Error loading BM25 index: {e}")
+            return []
+        if index is None:
             return []
 
-    async def process_query_with_rag(self, query: str, session_id: str, user_id: Optional[str] = None) -> ChatResponse:
+        return [
+            RetrievalResult(
+                content_id=index.docs[doc]["content_id"],
+                content=index.docs[doc]["content"],
+                similarity_score=0.0,
+                source=index.docs[doc].get("source", "unknown"),
+                lexical_score=score,
+                module_type=index.docs[doc].get("module_type")
+            )
+            for doc, score in index.search(query, limit, index.filter_mask(payload_filter) if payload_filter else None)
+        ]
+
+    async def search(self, query: str, top_k: int, query_vector: Optional[List[float]],
+                     payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
         """
-        Process a user query using RAG (Retrieval-Augmented Generation)
+        Vector and BM25 retrieval merged with reciprocal-rank fusion. Either side
+        alone is used when the other has nothing (no index, embedding failed, ...).
+        A payload filter restricts both sides to the matching chunks.
         """
-        # Add user message to session
-        user_message = ChatMessageCreate(
-            role="user",
-            content=query,
-            user_id=user_id
+        if not settings.HYBRID_SEARCH_ENABLED:
+            return await self.vector_search(query_vector, top_k, payload_filter) if query_vector is not None else []
+
+        candidates = max(top_k, settings.HYBRID_CANDIDATES)
+        vector_hits = await self.vector_search(query_vector, candidates, payload_filter) if query_vector is not None else []
+        with self.stage_timer.stage("lexical_search"):
+            lexical_hits = self.lexical_search(query, candidates, payload_filter)
+        if not lexical_hits:
+            return vector_hits[:top_k]
+        if not vector_hits:
+            return lexical_hits[:top_k]
+
+        by_id: Dict[str, RetrievalResult] = {hit.content_id: hit for hit in vector_hits}
+        for hit in lexical_hits:
+            if hit.content_id in by_id:
+                by_id[hit.content_id] = by_id[hit.content_id].model_copy(update={"lexical_score": hit.lexical_score})
+            else:
+                by_id[hit.content_id] = hit
+
+        fused = reciprocal_rank_fusion(
+            [[hit.content_id for hit in vector_hits], [hit.content_id for hit in lexical_hits]],
+            weights=[settings.HYBRID_VECTOR_WEIGHT, settings.HYBRID_LEXICAL_WEIGHT]
         )
-        await self.add_message_to_session(session_id, user_message)
+        return [by_id[content_id].model_copy(update={"fusion_score": score}) for content_id, score in fused[:top_k]]
 
-        # Retrieve relevant content
-        relevant_content = await self.get_relevant_content(query, self.config.retrieval_top_k)
+    async def get_relevant_content(self, query: str, top_k: int = 5, query_vector: Optional[List[float]] = None,
+                                   payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
+        """
+        Retrieve relevant content from the vector backend, fused with BM25
+        hits on the same chunks
+        """
+        if query_vector is None:
+            query_vector = await self.try_embed_query(query)
+        return await self.search(query, top_k, query_vector, payload_filter)
 
-        if not relevant_content:
-            # If no relevant content found, return a default response
-            response_text = "I couldn't find specific information about that topic in the textbook. Please check the relevant chapters or ask a more specific question."
-            sources = []
-        else:
-            # Build context from retrieved content
-            context_parts = []
-            sources = []
-            for content in relevant_content:
-                context_parts.append(content.content)
-                sources.append(content.source)
+    async def try_embed_query(self, query: str) -> Optional[List[float]]:
+        try:
+            with self.stage_timer.stage("embedding"):
+                return await self.embed_query(query)
+        except Exception as e:
+            print(f"Error embedding query: {e}")
+            return None
 
-            context = "\n\n".join(context_parts)
+    async def scoped_search(self, query: str, top_k: int, query_vector: Optional[List[float]],
+                            scope: Optional[RetrievalScope]) -> List[RetrievalResult]:
+        """
+        Search within the scope (module, chapter or page) when one is given,
+        falling back to the whole textbook when the scoped hits are poor
+        """
+        payload_filter = scope_filter(scope)
+        self.scope_outcome = None
+        if payload_filter is None:
+            return await self.search(query, top_k, query_vector)
+
+        results = await self.search(query, top_k, query_vector, payload_filter)
+        self.scope_outcome = self.scoped_search_policy.judge(results, query_vector is not None)
+        if self.scope_outcome == "scoped":
+            return results
+        return await self.search(query, top_k, query_vector)
 
-            # Create the full prompt for the LLM
-            prompt = f"""
-            You are an AI assistant for the Physical AI & Humanoid Robotics Textbook.
-            Answer the user's question based on the following context from the textbook:
+    async def retrieve(self, query: str, scope: Optional[RetrievalScope] = None
+                       ) -> Tuple[Optional[List[float]], List[RetrievalResult]]:
+        """
+        Embed the query once and retrieve content for it; the vector is also
+        needed for the answer cache lookup. With adaptive top_k the search
+        over-fetches and the results are cut where their scores fall away.
+        """
+        query_vector = await self.try_embed_query(query)
+        if not self.adaptive_top_k.enabled:
+            self.retrieval_cutoff = None
+            return query_vector, await self.scoped_search(query, self.config.retrieval_top_k, query_vector, scope)
+
+        relevant_content = await self.scoped_search(query, self.adaptive_top_k.candidates, query_vector, scope)
+        relevant_content, self.retrieval_cutoff = self.adaptive_top_k.cut(relevant_content)
+        return query_vector, relevant_content
 
-            Context: {context}
+    async def load_conversation(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], ConversationState]:
+        """
+        The session's context column and the conversation memory stored in it.
+        The read's transaction is ended at once, so the request does not hold
+        a pooled connection through retrieval and the LLM call; save_turn
+        opens the one write transaction afterwards.
+        """
+        result = await self.db.execute(select(ChatSession.context).where(ChatSession.id == session_id))
+        context = result.scalar()
+        await self.db.commit()
+        return context, ConversationState.from_context(context)
 
-            User question: {query}
+    async def save_turn(self, session_id: str, user_message: ChatMessageCreate,
+                        assistant_message: ChatMessageCreate, user_created_at: datetime,
+                        update_context: Optional[Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]] = None
+                        ) -> None:
+        """
+        Persist a chat turn as one unit of work: both messages, the session's
+        activity counters and its updated context go out in a single
+        transaction, with no refresh afterwards.
+
+        update_context maps the session's context to the one to store. It is
+        applied to the context re-read under a row lock in this transaction,
+        not to the copy loaded when the request started: a summary refresh or
+        another request in the session may have committed since.
+        """
+        now = datetime.utcnow()
+        context = None
+        if update_context is not None:
+            current = (await self.db.execute(
+                select(ChatSession.context).where(ChatSession.id == session_id).with_for_update()
+            )).scalar()
+            context = update_context(current)
+        await self.db.execute(self._session_activity_update(session_id, 2, assistant_message.content, now, context))
+        self.db.add_all([
+            ChatMessage(
+                id=str(uuid.uuid4()),
+                chat_session_id=session_id,
+                role=user_message.role,
+                content=user_message.content,
+                user_id=user_message.user_id,
+                created_at=user_created_at
+            ),
+            ChatMessage(
+                id=str(uuid.uuid4()),
+                chat_session_id=session_id,
+                role=assistant_message.role,
+                content=assistant_message.content,
+                user_id=assistant_message.user_id,
+                created_at=now
+            )
+        ])
+        await self.db.commit()
 
-            Please provide a helpful answer based on the textbook content. If the context doesn't contain the information needed, say so politely.
-            """
+    async def remember_turn(self, session_id: str, query: str, response_text: str, user_id: Optional[str],
+                            user_created_at: datetime) -> None:
+        """
+        Save the turn together with the updated conversation memory, then
+        refresh the summary in the background if the older turns grew too long
+        """
+        conversation = ConversationState()
+
+        def add_turn(context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            nonlocal conversation
+            conversation = ConversationState.from_context(context)
+            conversation.add_turn(query, response_text)
+            return conversation.to_context(context)
+
+        await self.save_turn(
+            session_id,
+            ChatMessageCreate(role="user", content=query, user_id=user_id),
+            ChatMessageCreate(role="assistant", content=response_text, user_id=user_id),
+            user_created_at,
+            update_context=add_turn
+        )
+        if self.conversation_memory.needs_refresh(conversation):
+            self.conversation_memory.schedule_refresh(session_id, self.completion_client)
 
-            try:
-                # Call OpenAI API to generate response
-                response = await self.openai_client.chat.completions.create(
-                    model=self.config.model_name,
-                    messages=[{"role": "user", "content": prompt}],
+    def pack_context(self, query: str, relevant_content: List[RetrievalResult],
+                     conversation: ConversationState) -> PackedContext:
+        """
+        Fit the retrieved chunks into what the prompt has left after the conversation memory
+        """
+        budget = self.context_packer.budget(query)
+        if not conversation.is_empty:
+            budget = max(0, budget - count_tokens(conversation.prompt_text()))
+        packed = self.context_packer.pack(query, relevant_content, budget=budget)
+        rag_chunks_used.observe(len(packed.chunks))
+        return packed
+
+    def debug_info(self, timer: StageTimer) -> ChatDebug:
+        retrieval = asdict(self.retrieval_cutoff) if self.retrieval_cutoff is not None else {}
+        if self.scope_outcome is not None:
+            retrieval["scope"] = self.scope_outcome
+        return ChatDebug(timings_ms=timer.milliseconds(), retrieval=retrieval or None)
+
+    async def complete(self, messages: Messages, key_messages: Optional[Messages] = None,
+                       priority: int = PRIORITY_AUTHENTICATED, model: Optional[str] = None) -> str:
+        """
+        One chat completion for the messages, on model (the configured model by
+        default). Identical prompts in flight at the same time share a single
+        upstream call; key_messages, when given, is what "identical" is judged
+        on (the messages built from the normalised question). The upstream call
+        waits for an LLM dispatcher slot at the most urgent priority of the
+        callers sharing it and raises LLMOverloaded when it cannot get one in
+        time.
+        """
+        model = model or self.config.model_name
+        shared_priority = SharedPriority(priority)
+
+        async def call() -> str:
+            async with self.llm_dispatcher.slot(shared_priority):
+                started = time.perf_counter()
+                response = await self.completion_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
                     temperature=self.config.temperature,
                     max_tokens=self.config.max_tokens
                 )
+                self.model_router.record_latency(model, time.perf_counter() - started)
+            self.prompt_cache_stats.record(getattr(response, "usage", None), model)
+            return response.choices[0].message.content
 
-                response_text = response.choices[0].message.content
+        key = self.single_flight.key(messages_text(key_messages or messages), model, self.config.temperature)
+        return await self.single_flight.run(key, call, shared_priority)
+
+    async def stream_completion(self, messages: Messages, key_messages: Optional[Messages] = None,
+                                priority: int = PRIORITY_AUTHENTICATED, model: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Completion deltas for the messages. Identical prompts streaming at the
+        same time share a single upstream stream, which holds one dispatcher
+        slot until it ends.
+        """
+        model = model or self.config.model_name
+        shared_priority = SharedPriority(priority)
+
+        async def open_stream() -> AsyncIterator[str]:
+            async with self.llm_dispatcher.slot(shared_priority) as mark_first_token:
+                started = time.perf_counter()
+                stream = await self.completion_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=self.config.temperature,
+                    max_tokens=self.config.max_tokens,
+                    stream=True,
+                    # Usage arrives in a final chunk without choices
+                    extra_body={"stream_options": {"include_usage": True}}
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        self.prompt_cache_stats.record(getattr(chunk, "usage", None), model)
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        # Streams are judged on time to first token
+                        mark_first_token()
+                        yield delta
+                self.model_router.record_latency(model, time.perf_counter() - started)
+
+        key = self.single_flight.key(messages_text(key_messages or messages), model, self.config.temperature)
+        async for delta in self.single_flight.stream(key, open_stream, shared_priority):
+            yield delta
+
+    def route(self, query: str, relevant_content: List[RetrievalResult]) -> ChatbotConfig:
+        """The chatbot config for this query, on the model the router picks for it"""
+        decision = self.model_router.route(query, relevant_content)
+        return self.config.model_copy(update={"model_name": decision.model})
+
+    def build_rag_messages(self, query: str, packed: PackedContext,
+                           conversation: Optional[ConversationState] = None) -> Messages:
+        history = conversation.prompt_text() if conversation is not None and not conversation.is_empty else ""
+        return rag_messages(query, packed.chunks, history)
+
+    async def process_query_with_rag(self, query: str, session_id: str, user_id: Optional[str] = None,
+                                     debug: bool = False, scope: Optional[RetrievalScope] = None) -> ChatResponse:
+        """
+        Process a user query using RAG (Retrieval-Augmented Generation).
+        With a scope, retrieval prefers that module, chapter or page.
+        With debug, the response carries the time spent in each stage.
+        """
+        user_created_at = datetime.utcnow()
+        timer = self.stage_timer = StageTimer()
+        started = time.perf_counter()
+        with timer.stage("db_read"):
+            _, conversation = await self.load_conversation(session_id)
+        # Answers to follow-ups depend on the conversation, so only opening questions are cached
+        use_cache = conversation.is_empty
+
+        # Retrieve relevant content
+        query_vector, relevant_content = await self.retrieve(query, scope)
+        cached = None
+        packed = None
+        model = None
+
+        if not relevant_content:
+            # If no relevant content found, return a default response
+            response_text = NO_CONTENT_RESPONSE
+            sources = []
+        else:
+            config = self.route(query, relevant_content)
+            model = config.model_name
+            chunk_ids = [content.content_id for content in relevant_content]
+            cached = self.answer_cache.get(query, chunk_ids, config, query_vector) if use_cache else None
+            sources = cached.sources if cached is not None else []
+
+        if cached is not None:
+            response_text = cached.message
+        elif relevant_content:
+            with timer.stage("prompt_build"):
+                # Fit the retrieved chunks into the prompt's token budget
+                packed = self.pack_context(query, relevant_content, conversation)
+                sources = [content.source for content in packed.chunks]
+
+                # Create the full prompt for the LLM
+                messages = self.build_rag_messages(query, packed, conversation)
+                # Pasted copies of a question differ only in case, spacing and punctuation
+                key_messages = self.build_rag_messages(normalize_query(query), packed, conversation)
+
+            try:
+                # Call OpenAI API to generate response; includes any wait for a dispatcher slot
+                with timer.stage("llm_total"):
+                    response_text = await self.complete(messages, key_messages, priority_for(user_id), model)
+                if use_cache:
+                    self.answer_cache.put(query, chunk_ids, config, response_text, sources, query_vector)
+            except LLMOverloaded:
+                # Nothing is saved; the caller gets a 503 and retries the whole request
+                raise
             except Exception as e:
                 print(f"Error calling OpenAI API: {e}")
-                response_text = "I encountered an error while processing your request. Please try again."
+                response_text = ERROR_RESPONSE
 
-        # Add assistant message to session
-        assistant_message = ChatMessageCreate(
-            role="assistant",
-            content=response_text,
-            user_id=user_id
-        )
-        await self.add_message_to_session(session_id, assistant_message)
+        # Save the question and the answer together
+        with timer.stage("db_write"):
+            await self.remember_turn(session_id, query, response_text, user_id, user_created_at)
+        timer.record("total", time.perf_counter() - started)
+        timer.finish()
 
         # Extract reasoning steps (simplified for this example)
         reasoning_steps = [
@@ -196,36 +591,135 @@ class ChatbotService:
             message=response_text,
             sources=sources,
             confidence=0.8,  # Placeholder confidence score
-            reasoning_steps=reasoning_steps
+            reasoning_steps=reasoning_steps,
+            cached=cached is not None,
+            context_tokens=packed.token_count if packed is not None else None,
+            model=model,
+            chunks_used=len(packed.chunks) if packed is not None else None,
+            debug=self.debug_info(timer) if debug else None
         )
 
-    async def enforce_selected_text(self, query: str, selected_text: str) -> ChatResponse:
+    async def stream_query_with_rag(self, query: str, session_id: str, user_id: Optional[str] = None,
+                                    debug: bool = False, scope: Optional[RetrievalScope] = None
+                                    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Enforce that the response is based on the selected text
+        Streaming variant of process_query_with_rag.
+
+        Yields a "sources" event as soon as retrieval finishes, then one "delta"
+        event per completion chunk, then a "done" event. The question and the
+        assembled answer are written to the session in one commit at the end.
+        With debug, the done event carries the stage timings.
+
+        If the completion fails part-way, an "error" event ends the stream
+        instead of "done", and only the error response is saved as the
+        answer: the partial text never reaches the history or the
+        conversation memory. The same goes for a client that disconnects
+        before the answer is complete; its question is still saved.
         """
-        prompt = f"""
-        You are an AI assistant for the Physical AI & Humanoid Robotics Textbook.
-        The user has selected the following text and has a question about it:
+        user_created_at = datetime.utcnow()
+        timer = self.stage_timer = StageTimer()
+        started = time.perf_counter()
+        with timer.stage("db_read"):
+            _, conversation = await self.load_conversation(session_id)
+        use_cache = conversation.is_empty
+        query_vector, relevant_content = await self.retrieve(query, scope)
+        chunk_ids = [content.content_id for content in relevant_content]
+        config = self.route(query, relevant_content) if relevant_content else self.config
+        cached = self.answer_cache.get(query, chunk_ids, config, query_vector) if relevant_content and use_cache else None
+        packed = None
+
+        if cached is not None:
+            sources = cached.sources
+        elif relevant_content:
+            with timer.stage("prompt_build"):
+                packed = self.pack_context(query, relevant_content, conversation)
+                messages = self.build_rag_messages(query, packed, conversation)
+                key_messages = self.build_rag_messages(normalize_query(query), packed, conversation)
+            sources = [content.source for content in packed.chunks]
+        else:
+            sources = []
+
+        priority = priority_for(user_id)
+        if packed is not None:
+            # Turn the request away before the response starts, while a 503 is still possible
+            self.llm_dispatcher.check_admission(priority)
 
-        Selected text: {selected_text}
+        yield {"type": "sources", "sources": sources}
 
-        User question: {query}
+        response_parts: List[str] = []
+        failed = False
+        complete = False
+        try:
+            if not relevant_content:
+                response_parts.append(NO_CONTENT_RESPONSE)
+                complete = True
+                yield {"type": "delta", "content": NO_CONTENT_RESPONSE}
+            elif cached is not None:
+                response_parts.append(cached.message)
+                complete = True
+                yield {"type": "delta", "content": cached.message}
+            else:
+                try:
+                    llm_started = time.perf_counter()
+                    async for delta in self.stream_completion(messages, key_messages, priority, config.model_name):
+                        if not response_parts:
+                            timer.record("llm_ttft", time.perf_counter() - llm_started)
+                        response_parts.append(delta)
+                        yield {"type": "delta", "content": delta}
+                    complete = True
+                    timer.record("llm_total", time.perf_counter() - llm_started)
+                    if use_cache:
+                        self.answer_cache.put(query, chunk_ids, config, "".join(response_parts), sources, query_vector)
+                except Exception as e:
+                    print(f"Error calling OpenAI API: {e}")
+                    failed = True
+        finally:
+            # Also reached when a disconnecting client closes the stream at one of the yields above
+            response_text = "".join(response_parts) if complete else ERROR_RESPONSE
+            with timer.stage("db_write"):
+                await self.remember_turn(session_id, query, response_text, user_id, user_created_at)
+            timer.record("total", time.perf_counter() - started)
+            timer.finish()
+
+        if failed:
+            yield {"type": "error", "message": ERROR_RESPONSE}
+            return
+
+        done = {
+            "type": "done",
+            "message": response_text,
+            "sources": sources,
+            "cached": cached is not None,
+            "context_tokens": packed.token_count if packed is not None else None,
+            "model": config.model_name if relevant_content else None,
+            "chunks_used": len(packed.chunks) if packed is not None else None
+        }
+        if debug:
+            done["debug"] = self.debug_info(timer).model_dump()
+        yield done
+
+    def build_selected_text_messages(self, query: str, selected_text: str) -> Messages:
+        return selected_text_messages(query, selected_text)
 
-        Please provide an answer that is directly based on the selected text.
+    async def enforce_selected_text(self, query: str, selected_text: str) -> ChatResponse:
+        """
+        Enforce that the response is based on the selected text
         """
+        response_text = self.selected_text_cache.get(query, selected_text, self.config)
+        cached = response_text is not None
 
-        try:
-            response = await self.openai_client.chat.completions.create(
-                model=self.config.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=self.config.temperature,
-                max_tokens=self.config.max_tokens
-            )
+        if not cached:
+            messages = self.build_selected_text_messages(query, selected_text)
+            key_messages = self.build_selected_text_messages(normalize_query(query), selected_text)
 
-            response_text = response.choices[0].message.content
-        except Exception as e:
-            print(f"Error calling OpenAI API: {e}")
-            response_text = "I encountered an error while processing your request. Please try again."
+            try:
+                response_text = await self.complete(messages, key_messages)
+                self.selected_text_cache.put(query, selected_text, self.config, response_text)
+            except LLMOverloaded:
+                raise
+            except Exception as e:
+                print(f"Error calling OpenAI API: {e}")
+                response_text = ERROR_RESPONSE
 
         reasoning_steps = [
             "Focused on selected text",
@@ -236,23 +730,36 @@ class ChatbotService:
             message=response_text,
             sources=["selected_text"],
             confidence=0.9,  # Higher confidence for selected text enforcement
-            reasoning_steps=reasoning_steps
+            reasoning_steps=reasoning_steps,
+            cached=cached
         )
 
     async def get_chat_history(self, session_id: str, limit: int = 10) -> List[ChatMessage]:
         """
         Get recent chat history for a session
         """
-        result = await self.db.execute(
-            select(ChatMessage)
-            .where(ChatMessage.chat_session_id == session_id)
-            .order_by(ChatMessage.created_at.desc())
-            .limit(limit)
-        )
-        messages = result.scalars().all()
+        messages = await self._message_keyset(session_id, limit)
         # Reverse to return in chronological order
         return list(reversed(messages))
 
+    async def get_chat_history_page(self, session_id: str, limit: int = 10,
+                                    before: Optional[str] = None) -> ChatHistoryPage:
+        """
+        A page of chat history ending just before the `before` cursor (the
+        latest messages when it is omitted). The cost depends on the page
+        size only, not on how long the session is.
+        """
+        limit = max(1, min(limit, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+        # One extra row tells us whether an older page exists
+        messages = await self._message_keyset(session_id, limit + 1, before=decode_cursor(before) if before else None)
+        has_more = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
+        return ChatHistoryPage(
+            messages=messages,
+            next_cursor=encode_cursor(messages[0].created_at, messages[0].id) if has_more else None,
+            has_more=has_more
+        )
+
     async def get_all_sessions(self, user_id: str) -> List[ChatSession]:
         """
         Get all chat sessions for a user
@@ -260,7 +767,37 @@ class ChatbotService:
         result = await self.db.execute(
             select(ChatSession)
             .where(ChatSession.user_id == user_id)
-            .order_by(ChatSession.created_at.desc())
+            .order_by(ChatSession.last_message_at.desc(), ChatSession.id.desc())
         )
         sessions = result.scalars().all()
-        return sessions
\ No newline at end of file
+        return sessions
+
+    async def get_sessions_page(self, user_id: str, limit: Optional[int] = None,
+                                before: Optional[str] = None) -> ChatSessionPage:
+        """
+        A user's sessions, most recently active first, with their message
+        counts and last-message previews; one query on the
+        (user_id, last_message_at) index per page
+        """
+        limit = max(1, min(limit or settings.CHAT_SESSION_PAGE_SIZE, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+        query = select(ChatSession).where(ChatSession.user_id == user_id)
+        if before:
+            last_message_at, session_id = decode_cursor(before)
+            query = query.where(or_(
+                ChatSession.last_message_at < last_message_at,
+                and_(ChatSession.last_message_at == last_message_at, ChatSession.id < session_id)
+            ))
+        result = await self.db.execute(
+            query.order_by(ChatSession.last_message_at.desc(), ChatSession.id.desc())
+            .limit(limit + 1)
+            # Counters are bumped with bulk UPDATEs that skip the identity map
+            .execution_options(populate_existing=True)
+        )
+        sessions = list(result.scalars().all())
+        has_more = len(sessions) > limit
+        sessions = sessions[:limit]
+        return ChatSessionPage(
+            sessions=sessions,
+            next_cursor=encode_cursor(sessions[-1].last_message_at, sessions[-1].id) if has_more else None,
+            has_more=has_more
+        )
\ No newline at end of file
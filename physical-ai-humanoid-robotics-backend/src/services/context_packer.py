@@ -0,0 +1,155 @@
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Optional
+import re
+
+from src.models.chatbot import ChatbotConfig, RetrievalResult
+from src.utils.tokens import count_tokens
+
+
+# Context windows (prompt + completion) of the chat models we route to.
+# Longest matching prefix wins, so "gpt-4-32k-0613" resolves to gpt-4-32k.
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Instructions and message framing around the context and question
+PROMPT_OVERHEAD_TOKENS = 150
+
+# Do not bother appending a truncated chunk shorter than this
+MIN_TRUNCATED_TOKENS = 40
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+_WORD_RE = re.compile(r"\w+")
+
+
+def context_window(model_name: str) -> int:
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model_name.startswith(prefix)]
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+def _shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def _overlap(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Share of the smaller shingle set that also appears in the other one."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _relevance(result: RetrievalResult) -> float:
+    # Fused results are ranked by their RRF score, plain vector hits by similarity
+    return result.fusion_score if result.fusion_score is not None else result.similarity_score
+
+
+def _truncate_at_sentence(text: str, max_tokens: int) -> str:
+    kept: List[str] = []
+    for sentence in _SENTENCE_RE.split(text):
+        if count_tokens(" ".join(kept + [sentence])) > max_tokens:
+            break
+        kept.append(sentence)
+    return " ".join(kept)
+
+
+@dataclass
+class PackedContext:
+    chunks: List[RetrievalResult] = field(default_factory=list)
+    token_count: int = 0
+    budget: int = 0
+    dropped_duplicates: int = 0
+    truncated: bool = False
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(chunk.content for chunk in self.chunks)
+
+
+class ContextPacker:
+    """
+    Fit retrieved chunks into the prompt's token budget.
+
+    The budget is what the model's context window leaves after the completion
+    (ChatbotConfig.max_tokens), the prompt framing and the question, capped at
+    ChatbotConfig.max_context_tokens. Chunks that repeat or largely overlap a
+    higher-scored chunk are dropped, the rest are ordered by maximal marginal
+    relevance (MMR) so near-identical passages do not crowd out other material,
+    and the last chunk that does not fit is cut at a sentence boundary.
+
+    MMR uses word-shingle overlap between chunks as the redundancy measure:
+    search results do not carry their vectors, and shingles catch the
+    overlapping-window duplicates that matter most here.
+    """
+
+    def __init__(self, config: ChatbotConfig, duplicate_threshold: float = 0.8, mmr_lambda: float = 0.7):
+        self.config = config
+        self.duplicate_threshold = duplicate_threshold
+        self.mmr_lambda = mmr_lambda
+
+    def budget(self, query: str) -> int:
+        available = (
+            context_window(self.config.model_name)
+            - self.config.max_tokens
+            - PROMPT_OVERHEAD_TOKENS
+            - count_tokens(query)
+        )
+        return max(0, min(available, self.config.max_context_tokens))
+
+    def pack(self, query: str, results: List[RetrievalResult], budget: Optional[int] = None) -> PackedContext:
+        packed = PackedContext(budget=self.budget(query) if budget is None else budget)
+
+        # Deduplicate, keeping the best-scored copy of each passage
+        candidates: List[RetrievalResult] = []
+        shingles: List[FrozenSet[str]] = []
+        for result in sorted(results, key=_relevance, reverse=True):
+            result_shingles = _shingles(result.content)
+            if not result_shingles or any(_overlap(result_shingles, kept) >= self.duplicate_threshold for kept in shingles):
+                packed.dropped_duplicates += 1
+                continue
+            candidates.append(result)
+            shingles.append(result_shingles)
+
+        # MMR ordering
+        top_score = max((_relevance(c) for c in candidates), default=0.0) or 1.0
+        remaining = list(range(len(candidates)))
+        order: List[int] = []
+        while remaining:
+            def mmr(index: int) -> float:
+                relevance = _relevance(candidates[index]) / top_score
+                redundancy = max((_overlap(shingles[index], shingles[j]) for j in order), default=0.0)
+                return self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+
+            best = max(remaining, key=mmr)
+            order.append(best)
+            remaining.remove(best)
+
+        # Fill the budget; separators between chunks cost roughly one token each
+        for index in order:
+            chunk = candidates[index]
+            left = packed.budget - packed.token_count - (1 if packed.chunks else 0)
+            tokens = count_tokens(chunk.content)
+            if tokens <= left:
+                packed.chunks.append(chunk)
+                packed.token_count += tokens + (1 if len(packed.chunks) > 1 else 0)
+                continue
+
+            if left >= MIN_TRUNCATED_TOKENS:
+                truncated = _truncate_at_sentence(chunk.content, left)
+                if truncated:
+                    packed.chunks.append(chunk.model_copy(update={"content": truncated}))
+                    packed.token_count += count_tokens(truncated) + (1 if len(packed.chunks) > 1 else 0)
+                    packed.truncated = True
+            break
+
+        # Report the exact size of what goes into the prompt
+        packed.token_count = count_tokens(packed.text) if packed.chunks else 0
+        return packed
@@ -0,0 +1,189 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+
+import openai
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import update
+
+from src.database.database import AsyncSessionLocal
+from src.database.models import ChatSession
+from src.services.llm_dispatcher import PRIORITY_BACKGROUND, llm_dispatcher
+from src.utils.security import settings
+from src.utils.tokens import count_tokens, truncate_tokens
+
+
+CONTEXT_KEY = "conversation"
+
+
+@dataclass
+class ConversationState:
+    """
+    What a session remembers of itself, stored under ChatSession.context["conversation"].
+
+    turns holds the raw turns that are not in the summary yet, each numbered
+    with n; summarized_through is the n of the last turn folded into summary.
+    """
+
+    summary: str = ""
+    summarized_through: int = 0
+    turns: List[Dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def from_context(cls, context: Optional[Dict[str, Any]]) -> "ConversationState":
+        stored = (context or {}).get(CONTEXT_KEY) or {}
+        return cls(
+            summary=stored.get("summary", ""),
+            summarized_through=stored.get("summarized_through", 0),
+            turns=list(stored.get("turns", []))
+        )
+
+    def to_context(self, context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """A copy of context with this state in it; other keys are left alone."""
+        return {
+            **(context or {}),
+            CONTEXT_KEY: {
+                "summary": self.summary,
+                "summarized_through": self.summarized_through,
+                "turns": self.turns,
+            }
+        }
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    def add_turn(self, user: str, assistant: str) -> None:
+        last = self.turns[-1]["n"] if self.turns else self.summarized_through
+        max_tokens = settings.CONVERSATION_TURN_MAX_TOKENS
+        self.turns.append({
+            "n": last + 1,
+            "user": truncate_tokens(user, max_tokens),
+            "assistant": truncate_tokens(assistant, max_tokens),
+        })
+
+    def pending_turns(self, recent_turns: int) -> List[Dict[str, Any]]:
+        """Turns older than the last recent_turns: the ones waiting to be summarised."""
+        return self.turns[:-recent_turns] if recent_turns else list(self.turns)
+
+    def prompt_text(self) -> str:
+        lines = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        for turn in self.turns:
+            lines.append(f"User: {turn['user']}")
+            lines.append(f"Assistant: {turn['assistant']}")
+        return "\n".join(lines)
+
+
+def _turns_text(turns: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"User: {turn['user']}\nAssistant: {turn['assistant']}" for turn in turns)
+
+
+class ConversationMemory:
+    """
+    Keep each session's prompt history bounded: a running summary plus the
+    last recent_turns raw turns.
+
+    Turns older than that stay verbatim until their size crosses
+    trigger_tokens; then a background task folds them into the summary with
+    one LLM call, off the request path. A prompt therefore never carries
+    more than the summary, recent_turns turns and trigger_tokens of older
+    turns, however long the session runs.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+                 recent_turns: Optional[int] = None, trigger_tokens: Optional[int] = None):
+        self.session_factory = session_factory
+        self.recent_turns = recent_turns if recent_turns is not None else settings.CONVERSATION_RECENT_TURNS
+        self.trigger_tokens = trigger_tokens or settings.CONVERSATION_SUMMARY_TRIGGER_TOKENS
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.llm_dispatcher = llm_dispatcher
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def needs_refresh(self, state: ConversationState) -> bool:
+        pending = state.pending_turns(self.recent_turns)
+        return bool(pending) and count_tokens(_turns_text(pending)) >= self.trigger_tokens
+
+    def schedule_refresh(self, session_id: str, openai_client: openai.AsyncOpenAI) -> Optional[asyncio.Task]:
+        """Start a background summary refresh unless one is already running for the session."""
+        if session_id in self._refreshing:
+            return None
+        task = asyncio.get_running_loop().create_task(self.refresh(session_id, openai_client))
+        self._refreshing[session_id] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(session_id, None))
+        return task
+
+    async def summarize(self, openai_client: openai.AsyncOpenAI, summary: str,
+                        turns: List[Dict[str, Any]]) -> str:
+        prompt = (
+            "You maintain a running summary of a tutoring conversation about the Physical AI & "
+            "Humanoid Robotics Textbook. Merge the new turns into the summary. Keep the topics, "
+            "what the student already understood or struggled with, and any names, code or "
+            f"numbers they may refer back to. Stay under {settings.CONVERSATION_SUMMARY_MAX_TOKENS} tokens.\n\n"
+            f"Current summary: {summary or '(none)'}\n\n"
+            f"New turns:\n{_turns_text(turns)}\n\n"
+            "Updated summary:"
+        )
+        # Summaries can wait: they queue behind every interactive request
+        async with self.llm_dispatcher.slot(PRIORITY_BACKGROUND):
+            response = await openai_client.chat.completions.create(
+                model=settings.CONVERSATION_SUMMARY_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0,
+                max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS
+            )
+        return response.choices[0].message.content.strip()
+
+    async def refresh(self, session_id: str, openai_client: openai.AsyncOpenAI) -> bool:
+        """Fold the pending turns into the summary. Returns whether the summary changed."""
+        try:
+            async with self.session_factory() as db:
+                context = (await db.execute(
+                    select(ChatSession.context).where(ChatSession.id == session_id)
+                )).scalar()
+            state = ConversationState.from_context(context)
+            pending = state.pending_turns(self.recent_turns)
+            if not pending:
+                return False
+
+            # No connection is held while the LLM runs
+            summary = await self.summarize(openai_client, state.summary, pending)
+            through = pending[-1]["n"]
+
+            async with self.session_factory() as db:
+                # Re-read under a row lock: turns may have been added meanwhile
+                context = (await db.execute(
+                    select(ChatSession.context).where(ChatSession.id == session_id).with_for_update()
+                )).scalar()
+                current = ConversationState.from_context(context)
+                if current.summarized_through >= through:
+                    return False
+                current.summary = summary
+                current.summarized_through = through
+                current.turns = [turn for turn in current.turns if turn["n"] > through]
+                await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == session_id)
+                    .values(context=current.to_context(context))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            self.refreshes += 1
+            return True
+        except Exception as e:
+            print(f"Error refreshing conversation summary: {e}")
+            self.refresh_errors += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recent_turns": self.recent_turns,
+            "trigger_tokens": self.trigger_tokens,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "refreshing": len(self._refreshing),
+        }
+
+
+conversation_memory = ConversationMemory()
@@ -0,0 +1,98 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+
+import openai
+
+from src.utils.cache import LRUCache
+from src.utils.security import settings
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent query embeddings into batched API requests.
+
+    Callers wait up to max_wait_ms (or until max_batch_size texts are queued)
+    and then share a single embeddings request; each caller gets its own
+    vector back. Identical texts queued in the same window are sent once, and
+    recent vectors are kept in an LRU cache so repeated queries skip the API.
+    """
+
+    def __init__(self, openai_client: openai.AsyncOpenAI, model: Optional[str] = None,
+                 max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                 cache_size: Optional[int] = None):
+        self.openai_client = openai_client
+        self.model = model or settings.EMBEDDING_MODEL
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_BATCH_MAX_WAIT_MS) / 1000
+        self.cache: LRUCache[List[float]] = LRUCache(cache_size or settings.EMBEDDING_CACHE_SIZE)
+
+        self._pending: List[str] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        self.requests_sent = 0
+        self.texts_embedded = 0
+        self.coalesced = 0
+
+    async def embed(self, text: str) -> List[float]:
+        key = text.strip()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[key] = future
+            self._pending.append(key)
+
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._flush)
+
+        # shield: one caller giving up must not cancel the vector for the others
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[str]) -> None:
+        try:
+            self.requests_sent += 1
+            response = await self.openai_client.embeddings.create(model=self.model, input=batch)
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            self.texts_embedded += len(batch)
+            for key, vector in zip(batch, vectors):
+                self.cache.put(key, vector)
+                future = self._inflight.pop(key)
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for key in batch:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_sent": self.requests_sent,
+            "texts_embedded": self.texts_embedded,
+            "avg_batch_size": round(self.texts_embedded / self.requests_sent, 2) if self.requests_sent else 0.0,
+            "coalesced": self.coalesced,
+            "pending": len(self._pending),
+            "cache": self.cache.stats(),
+        }
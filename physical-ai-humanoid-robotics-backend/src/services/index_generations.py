@@ -0,0 +1,52 @@
+from pathlib import Path
+from typing import Optional
+import os
+import shutil
+import time
+import uuid
+
+
+CURRENT_POINTER = "CURRENT"
+GENERATIONS_DIR = "generations"
+
+
+def current_generation(root: Path) -> Optional[str]:
+    """The name of the published generation in root/CURRENT, or None before the first publish."""
+    try:
+        return (root / CURRENT_POINTER).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_index_dir(root: Path) -> Path:
+    """
+    The directory holding the live bm25/ and vectors/ indexes: the generation
+    named in root/CURRENT, or root itself when nothing has been published
+    (indexes saved straight into it by tests, benchmarks and older ingests).
+    """
+    name = current_generation(root)
+    return root / GENERATIONS_DIR / name if name else root
+
+
+def new_generation(root: Path) -> Path:
+    """An empty directory to write the next index into; names sort by creation time."""
+    directory = root / GENERATIONS_DIR / f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    directory.mkdir(parents=True)
+    return directory
+
+
+def publish_generation(root: Path, directory: Path, keep: int = 2) -> None:
+    """
+    Make a completely written generation the live one by replacing
+    root/CURRENT in one rename, then delete older generations beyond the
+    newest `keep`. The one just replaced is kept for readers still loading
+    from it; files a reader already has mmap'd stay valid after deletion.
+    """
+    tmp_path = root / f"{CURRENT_POINTER}.tmp"
+    tmp_path.write_text(directory.name, encoding="utf-8")
+    os.replace(tmp_path, root / CURRENT_POINTER)
+
+    # Newer directories belong to an ingest still in progress; leave them alone
+    older = sorted(p for p in (root / GENERATIONS_DIR).iterdir() if p.is_dir() and p.name < directory.name)
+    for stale in older[:max(len(older) - (keep - 1), 0)]:
+        shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,435 @@
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+import openai
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.models.ingestion import TextbookChunk, IngestionReport
+from src.services.bm25_index import BM25Index
+from src.services.index_generations import current_index_dir, new_generation, publish_generation
+from src.services.retrieval_scope import SCOPE_PAYLOAD_FIELDS
+from src.services.vector_index import EmbeddedVectorIndex
+from src.utils.security import settings
+from src.utils.tokens import count_tokens, truncate_tokens
+
+
+MANIFEST_VERSION = 1
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c1f0e-8a55-4d1b-9a43-3b5f3f3c7a11")
+
+# Embedding models reject inputs above 8191 tokens
+MAX_EMBEDDING_INPUT_TOKENS = 8000
+
+# Docs directories map onto the ModuleType values used by the content API
+MODULE_TYPES = {
+    "module-1": "ros_2",
+    "module-2": "gazebo_unity",
+    "module-3": "nvidia_isaac",
+    "module-4": "vla",
+    "module-5": "humanoid",
+}
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _strip_front_matter(text: str) -> str:
+    if not text.startswith("---"):
+        return text
+    lines = text.splitlines(keepends=True)
+    for index in range(1, len(lines)):
+        if lines[index].strip() == "---":
+            return "".join(lines[index + 1:])
+    return text
+
+
+class MarkdownChunker:
+    """
+    Split a Docusaurus markdown page into token-bounded chunks.
+
+    Every heading starts a new chunk, so chunks never straddle sections. Long
+    sections are packed block by block (paragraphs, lists, code fences) up to
+    max_tokens; paragraphs that are too long on their own are split at sentence
+    boundaries. Fenced code blocks are never split.
+    """
+
+    def __init__(self, max_tokens: int = None):
+        self.max_tokens = max_tokens or settings.CHUNK_MAX_TOKENS
+
+    def _sections(self, text: str) -> List[Tuple[int, str, List[str]]]:
+        """Group the page into (heading level, heading, blocks) triples."""
+        sections: List[Tuple[int, str, List[str]]] = [(0, "", [])]
+        paragraph: List[str] = []
+        fence: Optional[List[str]] = None
+        fence_marker = ""
+
+        def flush_paragraph():
+            if paragraph:
+                sections[-1][2].append("\n".join(paragraph).strip())
+                paragraph.clear()
+
+        for line in text.splitlines():
+            if fence is not None:
+                fence.append(line)
+                if line.strip().startswith(fence_marker):
+                    sections[-1][2].append("\n".join(fence))
+                    fence = None
+                continue
+
+            fence_match = FENCE_RE.match(line)
+            if fence_match:
+                flush_paragraph()
+                fence = [line]
+                fence_marker = fence_match.group(1)
+                continue
+
+            heading_match = HEADING_RE.match(line)
+            if heading_match:
+                flush_paragraph()
+                level = len(heading_match.group(1))
+                sections.append((level, heading_match.group(2).strip(), [line.strip()]))
+                continue
+
+            if not line.strip():
+                flush_paragraph()
+            else:
+                paragraph.append(line)
+
+        flush_paragraph()
+        if fence is not None:
+            # Unterminated fence: keep whatever was collected
+            sections[-1][2].append("\n".join(fence))
+
+        return [section for section in sections if any(b.strip() for b in section[2])]
+
+    def _split_block(self, block: str) -> List[str]:
+        if FENCE_RE.match(block) or count_tokens(block) <= self.max_tokens:
+            return [block]
+
+        pieces, current = [], ""
+        for sentence in SENTENCE_END_RE.split(block):
+            candidate = f"{current} {sentence}".strip()
+            if current and count_tokens(candidate) > self.max_tokens:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+        # A single sentence longer than the budget is cut by tokens
+        return [p if count_tokens(p) <= self.max_tokens else truncate_tokens(p, self.max_tokens) for p in pieces]
+
+    def chunk_document(self, rel_path: str, text: str) -> List[TextbookChunk]:
+        body = _strip_front_matter(text)
+        path = Path(rel_path)
+        module = path.parts[0] if len(path.parts) > 1 else ""
+        module_type = MODULE_TYPES.get("-".join(module.split("-")[:2]))
+        chapter = path.stem
+
+        sections = self._sections(body)
+        title = next((heading for level, heading, _ in sections if level == 1), chapter)
+
+        chunks: List[TextbookChunk] = []
+        carried: List[str] = []
+        for index, (_, heading, blocks) in enumerate(sections):
+            # A heading with no body of its own (e.g. the H1 right above an H2)
+            # is carried into the next section instead of becoming a tiny chunk
+            if len(blocks) == 1 and HEADING_RE.match(blocks[0]) and index + 1 < len(sections):
+                carried.extend(blocks)
+                continue
+            blocks = carried + blocks
+            carried = []
+
+            packed: List[str] = []
+            for block in blocks:
+                for piece in self._split_block(block):
+                    candidate = "\n\n".join(packed + [piece])
+                    if packed and count_tokens(candidate) > self.max_tokens:
+                        chunks.append(self._make_chunk(rel_path, module, module_type, chapter, title, heading, packed))
+                        packed = [piece]
+                    else:
+                        packed.append(piece)
+            if packed:
+                chunks.append(self._make_chunk(rel_path, module, module_type, chapter, title, heading, packed))
+
+        # Identical chunks within one file would share an ID; keep the first
+        unique: Dict[str, TextbookChunk] = {}
+        for chunk in chunks:
+            unique.setdefault(chunk.id, chunk)
+        return list(unique.values())
+
+    def _make_chunk(self, rel_path: str, module: str, module_type: Optional[str], chapter: str,
+                    title: str, heading: str, blocks: List[str]) -> TextbookChunk:
+        content = "\n\n".join(blocks)
+        heading = heading or title
+        chunk_hash = _sha256(f"{title}\n{heading}\n{content}")
+        return TextbookChunk(
+            id=str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{rel_path}:{chunk_hash}")),
+            path=rel_path,
+            module=module,
+            module_type=module_type,
+            chapter=chapter,
+            title=title,
+            heading=heading,
+            content=content,
+            chunk_hash=chunk_hash,
+            token_count=count_tokens(content),
+        )
+
+
+class TextbookIngestionService:
+    """
+    Incrementally sync the Docusaurus textbook into the vector backend: the
+    Qdrant collection, or with RETRIEVER_BACKEND=embedded a local NumPy index.
+
+    A manifest in RAG_INDEX_DIR records the content hash of every file and the
+    IDs of the chunks it produced. Chunk IDs are derived from chunk content, so
+    on re-runs unchanged files are skipped, and in changed files only new
+    chunks are embedded while vanished ones are deleted.
+
+    The BM25 index used for hybrid retrieval is rebuilt from the same chunks
+    whenever anything changed. Chunking is local and cheap, so unchanged files
+    are re-chunked for it rather than stored twice. The embedded index is
+    rewritten the same way, carrying the vectors of unchanged chunks over.
+
+    Local indexes are never rewritten under a running server: each rebuild is
+    written to a new directory under RAG_INDEX_DIR/generations and published
+    by swapping the RAG_INDEX_DIR/CURRENT pointer once it is complete.
+    """
+
+    def __init__(self, qdrant_client: QdrantClient, openai_client: openai.AsyncOpenAI,
+                 docs_path: Optional[str] = None, index_dir: Optional[str] = None,
+                 chunker: Optional[MarkdownChunker] = None):
+        self.qdrant_client = qdrant_client
+        self.openai_client = openai_client
+        self.docs_path = Path(docs_path or settings.TEXTBOOK_DOCS_PATH)
+        self.index_dir = Path(index_dir or settings.RAG_INDEX_DIR)
+        self.manifest_path = self.index_dir / "manifest.json"
+        self.chunker = chunker or MarkdownChunker()
+        self.collection_name = settings.QDRANT_COLLECTION
+        self.backend = settings.RETRIEVER_BACKEND
+
+    @property
+    def bm25_dir(self) -> Path:
+        return current_index_dir(self.index_dir) / "bm25"
+
+    @property
+    def vectors_dir(self) -> Path:
+        return current_index_dir(self.index_dir) / "vectors"
+
+    def discover_files(self) -> List[Path]:
+        files = [p for p in self.docs_path.glob("module-*/**/*") if p.suffix in (".md", ".mdx") and p.is_file()]
+        return sorted(files)
+
+    def _manifest_settings(self) -> Dict[str, Any]:
+        return {
+            "version": MANIFEST_VERSION,
+            "embedding_model": settings.EMBEDDING_MODEL,
+            "embedding_dimensions": settings.EMBEDDING_DIMENSIONS,
+            "chunk_max_tokens": self.chunker.max_tokens,
+            "retriever_backend": self.backend,
+            "embedded_index_dtype": settings.EMBEDDED_INDEX_DTYPE if self.backend == "embedded" else None,
+        }
+
+    def load_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest: Dict[str, Any]) -> None:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _collection_exists(self) -> bool:
+        if self.backend == "embedded":
+            return (self.vectors_dir / "payloads.json").exists()
+        return any(c.name == self.collection_name for c in self.qdrant_client.get_collections().collections)
+
+    def _recreate_collection(self) -> None:
+        if self.backend == "embedded":
+            return  # rewritten from scratch in _save_embedded_index
+        self.qdrant_client.recreate_collection(
+            collection_name=self.collection_name,
+            vectors_config=models.VectorParams(
+                size=settings.EMBEDDING_DIMENSIONS,
+                distance=models.Distance.COSINE
+            )
+        )
+
+    def _ensure_payload_indexes(self) -> None:
+        """
+        Keyword indexes on the payload fields scoped retrieval filters on, so a
+        filtered search only visits the matching points
+        """
+        if self.backend == "embedded":
+            return  # the embedded index filters on in-memory payload columns
+        existing = self.qdrant_client.get_collection(self.collection_name).payload_schema or {}
+        for field_name in SCOPE_PAYLOAD_FIELDS:
+            if field_name not in existing:
+                self.qdrant_client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType.KEYWORD,
+                    wait=True
+                )
+
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), settings.EMBEDDING_BATCH_SIZE):
+            batch = [truncate_tokens(t, MAX_EMBEDDING_INPUT_TOKENS) for t in texts[start:start + settings.EMBEDDING_BATCH_SIZE]]
+            response = await self.openai_client.embeddings.create(model=settings.EMBEDDING_MODEL, input=batch)
+            # The API does not promise to keep input order
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return vectors
+
+    async def _save_embedded_index(self, directory: Path, all_chunks: List[TextbookChunk],
+                                   new_chunks: List[TextbookChunk], new_vectors: List[List[float]],
+                                   reuse_existing: bool) -> int:
+        """
+        Write the embedded index for all_chunks to directory. Returns how many
+        chunks had to be embedded on top of new_chunks (rows missing from the
+        live index).
+        """
+        vectors_by_id: Dict[str, Any] = {}
+        if reuse_existing and self._collection_exists():
+            vectors_by_id = EmbeddedVectorIndex.load(self.vectors_dir).vectors()
+        vectors_by_id.update(zip((chunk.id for chunk in new_chunks), new_vectors))
+
+        unique = list({chunk.id: chunk for chunk in all_chunks}.values())
+        missing = [chunk for chunk in unique if chunk.id not in vectors_by_id]
+        if missing:
+            vectors = await self.embed_texts([chunk.embedding_text for chunk in missing])
+            vectors_by_id.update(zip((chunk.id for chunk in missing), vectors))
+
+        EmbeddedVectorIndex.build(
+            [chunk.id for chunk in unique],
+            [vectors_by_id[chunk.id] for chunk in unique] or np.zeros((0, settings.EMBEDDING_DIMENSIONS)),
+            [chunk.to_payload() for chunk in unique],
+            dtype=settings.EMBEDDED_INDEX_DTYPE
+        ).save(directory)
+        return len(missing)
+
+    async def _publish_local_indexes(self, all_chunks: List[TextbookChunk], new_chunks: List[TextbookChunk],
+                                     new_vectors: List[List[float]], reuse_existing: bool) -> int:
+        """
+        Write a complete new generation of the local indexes (BM25, plus the
+        embedded vector index on that backend) and make it the live one.
+        Returns the extra chunks embedded, as _save_embedded_index.
+        """
+        generation = new_generation(self.index_dir)
+        try:
+            embedded = 0
+            if self.backend == "embedded":
+                embedded = await self._save_embedded_index(
+                    generation / "vectors", all_chunks, new_chunks, new_vectors, reuse_existing
+                )
+            BM25Index.build([chunk.to_payload() for chunk in all_chunks]).save(generation / "bm25")
+        except BaseException:
+            shutil.rmtree(generation, ignore_errors=True)
+            raise
+        publish_generation(self.index_dir, generation)
+        return embedded
+
+    def _upsert(self, chunks: List[TextbookChunk], vectors: List[List[float]]) -> None:
+        batch_size = settings.QDRANT_UPSERT_BATCH_SIZE
+        for start in range(0, len(chunks), batch_size):
+            self.qdrant_client.upsert(
+                collection_name=self.collection_name,
+                points=[
+                    models.PointStruct(id=chunk.id, vector=vector, payload=chunk.to_payload())
+                    for chunk, vector in zip(chunks[start:start + batch_size], vectors[start:start + batch_size])
+                ],
+                wait=True
+            )
+
+    def _delete(self, point_ids: List[str]) -> None:
+        batch_size = settings.QDRANT_UPSERT_BATCH_SIZE
+        for start in range(0, len(point_ids), batch_size):
+            self.qdrant_client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=point_ids[start:start + batch_size]),
+                wait=True
+            )
+
+    async def run(self, force: bool = False) -> IngestionReport:
+        report = IngestionReport()
+        manifest = self.load_manifest()
+
+        # Qdrant calls are blocking; keep them off the event loop
+        collection_exists = await asyncio.to_thread(self._collection_exists)
+        compatible = all(manifest.get(k) == v for k, v in self._manifest_settings().items())
+        if force or not compatible or not collection_exists:
+            await asyncio.to_thread(self._recreate_collection)
+            manifest = {}
+            report.full_rebuild = True
+        await asyncio.to_thread(self._ensure_payload_indexes)
+
+        previous_files: Dict[str, Any] = manifest.get("files", {})
+        current_files: Dict[str, Any] = {}
+        to_embed: List[TextbookChunk] = []
+        stale_ids: List[str] = []
+        all_chunks: List[TextbookChunk] = []
+
+        for file_path in self.discover_files():
+            rel_path = file_path.relative_to(self.docs_path).as_posix()
+            text = file_path.read_text(encoding="utf-8")
+            file_hash = _sha256(text)
+            report.files_scanned += 1
+
+            chunks = self.chunker.chunk_document(rel_path, text)
+            all_chunks.extend(chunks)
+
+            previous = previous_files.get(rel_path)
+            if previous and previous["sha256"] == file_hash:
+                current_files[rel_path] = previous
+                continue
+
+            previous_chunks = previous["chunks"] if previous else {}
+            current_chunks = {chunk.id: chunk.chunk_hash for chunk in chunks}
+
+            to_embed.extend(chunk for chunk in chunks if chunk.id not in previous_chunks)
+            stale_ids.extend(chunk_id for chunk_id in previous_chunks if chunk_id not in current_chunks)
+            current_files[rel_path] = {"sha256": file_hash, "chunks": current_chunks}
+            report.files_changed += 1
+            report.changed_paths.append(rel_path)
+
+        for rel_path, previous in previous_files.items():
+            if rel_path not in current_files:
+                stale_ids.extend(previous["chunks"])
+                report.files_removed += 1
+
+        vectors = await self.embed_texts([chunk.embedding_text for chunk in to_embed]) if to_embed else []
+        if self.backend != "embedded":
+            if to_embed:
+                await asyncio.to_thread(self._upsert, to_embed, vectors)
+            if stale_ids:
+                await asyncio.to_thread(self._delete, stale_ids)
+
+        if to_embed or stale_ids or report.full_rebuild or not (self.bm25_dir / "docs.json").exists():
+            report.chunks_embedded += await self._publish_local_indexes(
+                all_chunks, to_embed, vectors, reuse_existing=not report.full_rebuild
+            )
+
+        self.save_manifest({**self._manifest_settings(), "files": current_files})
+
+        report.chunks_embedded += len(to_embed)
+        report.chunks_deleted = len(stale_ids)
+        report.chunks_total = sum(len(f["chunks"]) for f in current_files.values())
+        return report
@@ -0,0 +1,237 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+import openai
+
+from src.utils.security import settings
+
+
+T = TypeVar("T")
+
+# Lower is served first
+PRIORITY_AUTHENTICATED = 0
+PRIORITY_ANONYMOUS = 1
+PRIORITY_BACKGROUND = 2
+
+
+def priority_for(user_id: Optional[str]) -> int:
+    if not user_id or user_id.startswith("anonymous_"):
+        return PRIORITY_ANONYMOUS
+    return PRIORITY_AUTHENTICATED
+
+
+class SharedPriority:
+    """
+    The priority of one call made on behalf of several callers (see
+    SingleFlight): the most urgent among them. A caller joining late calls
+    raise_to() with its own priority; if the call is still queued in the
+    dispatcher it moves up to the new position.
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        # Set by the dispatcher while the call waits in its queue
+        self.on_raise: Optional[Callable[[int], None]] = None
+
+    def raise_to(self, value: int) -> None:
+        if value < self.value:
+            self.value = value
+            if self.on_raise is not None:
+                self.on_raise(value)
+
+
+class LLMOverloaded(Exception):
+    """The LLM queue cannot take the request in time; the API answers 503 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class LLMDispatcher:
+    """
+    Admission control for chat completions.
+
+    At most `limit` calls are in flight. The limit follows AIMD: it grows by
+    about one per limit's worth of calls that finish under the latency
+    target, shrinks a little when latency overshoots and is cut by
+    backoff_factor on every 429. Callers over the limit wait in a bounded
+    priority queue (authenticated users ahead of anonymous sessions, FIFO
+    within a class). A caller that is not expected to get a slot within
+    queue_timeout is turned away at once with LLMOverloaded instead of
+    waiting to fail.
+    """
+
+    def __init__(self, initial_limit: Optional[int] = None, min_limit: Optional[int] = None,
+                 max_limit: Optional[int] = None, queue_size: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, latency_target: Optional[float] = None,
+                 backoff_factor: Optional[float] = None):
+        self.min_limit = min_limit or settings.LLM_CONCURRENCY_MIN
+        self.max_limit = max_limit or settings.LLM_CONCURRENCY_MAX
+        self.limit = float(initial_limit or settings.LLM_CONCURRENCY_INITIAL)
+        self.queue_size = queue_size if queue_size is not None else settings.LLM_QUEUE_MAX
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.LLM_QUEUE_TIMEOUT_SECONDS
+        self.latency_target = latency_target or settings.LLM_LATENCY_TARGET_SECONDS
+        self.backoff_factor = backoff_factor or settings.LLM_BACKOFF_FACTOR
+
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Smoothed call latency, for estimating how long a queue position will wait
+        self._avg_latency: Optional[float] = None
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.rate_limited = 0
+        self.promoted = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    def _capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def estimated_wait(self, priority: int) -> float:
+        """Rough queue time for a new caller: queue position over throughput."""
+        ahead = sum(1 for p, _, waiter in self._waiters if p <= priority and not waiter.done())
+        if self.in_flight < self._capacity() and ahead == 0:
+            return 0.0
+        latency = self._avg_latency or self.latency_target
+        return (ahead + 1) * latency / self._capacity()
+
+    def check_admission(self, priority: int) -> None:
+        """Raise LLMOverloaded now if a call at this priority would be rejected."""
+        if self.queued >= self.queue_size:
+            self.rejected += 1
+            raise LLMOverloaded("LLM queue is full", self.estimated_wait(priority))
+        wait = self.estimated_wait(priority)
+        # Until a call has been measured the estimate is a guess; leave it to the deadline
+        if self._avg_latency is not None and wait > self.queue_timeout:
+            self.rejected += 1
+            raise LLMOverloaded("LLM queue wait would exceed the deadline", wait)
+
+    def _promote(self, waiter: asyncio.Future, priority: int) -> None:
+        """Move a queued waiter up to a more urgent priority, keeping its place in arrival order."""
+        for i, (current, sequence, queued) in enumerate(self._waiters):
+            if queued is waiter and priority < current:
+                self._waiters[i] = (priority, sequence, waiter)
+                heapq.heapify(self._waiters)
+                self.promoted += 1
+                return
+
+    async def acquire(self, priority: Union[int, SharedPriority]) -> None:
+        shared = priority if isinstance(priority, SharedPriority) else None
+        priority = shared.value if shared is not None else priority
+        if self.in_flight < self._capacity() and not self.queued:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        self.check_admission(priority)
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        if shared is not None:
+            shared.on_raise = lambda value: self._promote(waiter, value)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self.timed_out += 1
+                raise LLMOverloaded("LLM queue deadline exceeded", self.estimated_wait(priority))
+            # Handed a slot right at the deadline: take it
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the caller went away
+                self._release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if shared is not None:
+                shared.on_raise = None
+        self.admitted += 1
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self._capacity():
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _record(self, latency: Optional[float], rate_limited: bool) -> None:
+        if rate_limited:
+            self.rate_limited += 1
+            self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+            return
+        if latency is None:
+            return
+        self._avg_latency = latency if self._avg_latency is None else 0.8 * self._avg_latency + 0.2 * latency
+        if latency <= self.latency_target:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.min_limit, self.limit * 0.95)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: Union[int, SharedPriority]) -> AsyncIterator[Callable[[], None]]:
+        """
+        Hold a slot for the duration of the block. The yielded callable marks
+        the moment the response started (first streamed token); latency is
+        measured up to it, or to the end of the block if it is never called.
+        With a SharedPriority, the wait for the slot follows its raises.
+        """
+        await self.acquire(priority)
+        started = time.monotonic()
+        first_token: List[float] = []
+
+        def mark_first_token() -> None:
+            if not first_token:
+                first_token.append(time.monotonic())
+
+        try:
+            yield mark_first_token
+        except openai.RateLimitError:
+            self._record(None, rate_limited=True)
+            raise
+        else:
+            self._record((first_token[0] if first_token else time.monotonic()) - started, rate_limited=False)
+        finally:
+            self._release()
+
+    async def call(self, fn: Callable[[], Awaitable[T]], priority: int = PRIORITY_AUTHENTICATED) -> T:
+        async with self.slot(priority):
+            return await fn()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "avg_latency_seconds": round(self._avg_latency, 3) if self._avg_latency is not None else None,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "rate_limited": self.rate_limited,
+            "promoted": self.promoted,
+        }
+
+
+llm_dispatcher = LLMDispatcher()
@@ -0,0 +1,322 @@
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import random
+import time
+
+import httpx
+import openai
+from openai.types import CreateEmbeddingResponse
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from src.services.bm25_index import tokenize
+from src.utils.cache import LRUCache
+from src.utils.security import settings
+from src.utils.tokens import count_tokens
+
+
+# Words the simulated answers are made of; only their count and timing matter
+_VOCABULARY = (
+    "robot", "joint", "actuator", "sensor", "topic", "node", "controller", "torque", "gait", "balance",
+    "kinematics", "trajectory", "policy", "simulation", "perception", "camera", "lidar", "frame",
+    "transform", "message", "humanoid", "servo", "feedback", "model", "planner", "state", "reward",
+)
+
+
+def _digest(*parts: Any) -> int:
+    material = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return int.from_bytes(hashlib.sha256(material).digest()[:8], "big")
+
+
+# Distinct requests whose occurrence count is remembered; past that the least recent are forgotten
+SEEN_REQUESTS_MAX = 65536
+
+
+@functools.lru_cache(maxsize=65536)
+def _feature_bucket(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+@dataclass
+class CompletionPlan:
+    """Everything about one simulated completion, decided before it starts."""
+
+    model: str
+    tokens: List[str]
+    prompt_tokens: int
+    ttft_seconds: float
+    seconds_per_token: float
+    fault: Optional[int] = None
+
+    @property
+    def total_seconds(self) -> float:
+        return self.ttft_seconds + self.seconds_per_token * len(self.tokens)
+
+
+class SimulatedLLM:
+    """
+    Deterministic stand-in for the OpenAI chat and embedding endpoints.
+
+    The answer to a request depends only on the model and the messages, and an
+    embedding only on its input text. Latency and faults are drawn from a
+    random stream seeded by (seed, request, how many times that request was
+    seen), so a run replays identically regardless of how concurrent requests
+    interleave. Occurrence counts are kept for the SEEN_REQUESTS_MAX most
+    recent distinct requests, so a long load test runs in bounded memory.
+    Embeddings are hashed bags of words and word pairs, so texts sharing
+    vocabulary land close together and retrieval over them is meaningful, if
+    far cruder than a real embedding model. Time to first token is lognormal
+    around ttft_seconds with spread latency_sigma, generation runs at
+    tokens_per_second, and a request fails with a 429 with probability
+    rate_limit_rate or a 500 with probability error_rate.
+    """
+
+    def __init__(self, seed: Optional[int] = None, ttft_seconds: Optional[float] = None,
+                 latency_sigma: Optional[float] = None, tokens_per_second: Optional[float] = None,
+                 embedding_latency_seconds: Optional[float] = None, error_rate: Optional[float] = None,
+                 rate_limit_rate: Optional[float] = None, dimensions: Optional[int] = None):
+        self.seed = seed if seed is not None else settings.STUB_LLM_SEED
+        self.ttft_seconds = ttft_seconds if ttft_seconds is not None else settings.STUB_LLM_TTFT_SECONDS
+        self.latency_sigma = latency_sigma if latency_sigma is not None else settings.STUB_LLM_LATENCY_SIGMA
+        self.tokens_per_second = tokens_per_second or settings.STUB_LLM_TOKENS_PER_SECOND
+        self.embedding_latency_seconds = (embedding_latency_seconds if embedding_latency_seconds is not None
+                                          else settings.STUB_EMBEDDING_LATENCY_SECONDS)
+        self.error_rate = error_rate if error_rate is not None else settings.STUB_LLM_ERROR_RATE
+        self.rate_limit_rate = rate_limit_rate if rate_limit_rate is not None else settings.STUB_LLM_RATE_LIMIT_RATE
+        self.dimensions = dimensions or settings.EMBEDDING_DIMENSIONS
+        self._seen: LRUCache[int] = LRUCache(SEEN_REQUESTS_MAX)
+        self.requests = 0
+        self.faults = 0
+
+    def _draws(self, request: int) -> random.Random:
+        occurrence = self._seen.get(request) or 0
+        self._seen.put(request, occurrence + 1)
+        self.requests += 1
+        return random.Random(_digest(self.seed, request, occurrence))
+
+    def _lognormal(self, draws: random.Random, median: float) -> float:
+        return median * math.exp(draws.gauss(0.0, self.latency_sigma)) if median > 0 else 0.0
+
+    def _fault(self, draws: random.Random) -> Optional[int]:
+        roll = draws.random()
+        if roll < self.rate_limit_rate:
+            fault = 429
+        elif roll < self.rate_limit_rate + self.error_rate:
+            fault = 500
+        else:
+            return None
+        self.faults += 1
+        return fault
+
+    def plan_completion(self, model: str, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> CompletionPlan:
+        request = _digest(model, messages)
+        answer = random.Random(request)
+        length = min(max_tokens or 1000, answer.randint(40, 160))
+        words = [answer.choice(_VOCABULARY) for _ in range(length)]
+        tokens = [word + " " for word in words[:-1]] + [words[-1] + "."]
+
+        draws = self._draws(request)
+        return CompletionPlan(
+            model=model,
+            tokens=tokens,
+            prompt_tokens=sum(count_tokens(message.get("content") or "") for message in messages),
+            ttft_seconds=self._lognormal(draws, self.ttft_seconds),
+            seconds_per_token=1.0 / self.tokens_per_second,
+            fault=self._fault(draws)
+        )
+
+    def embed(self, text: str) -> List[float]:
+        words = tokenize(text)
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        vector = [0.0] * self.dimensions
+        if features:
+            counts: Dict[str, int] = {}
+            for feature in features:
+                counts[feature] = counts.get(feature, 0) + 1
+            for feature, count in counts.items():
+                bucket = _feature_bucket(feature)
+                sign = 1.0 if bucket & 1 else -1.0
+                vector[(bucket >> 1) % self.dimensions] += sign * (1.0 + math.log(count))
+        else:
+            # Nothing to hash (empty text, only stopwords): a fixed random direction
+            values = random.Random(_digest("embedding", text))
+            vector = [values.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def plan_embeddings(self, inputs: List[str]) -> Dict[str, Any]:
+        draws = self._draws(_digest("embeddings", inputs))
+        return {"seconds": self._lognormal(draws, self.embedding_latency_seconds), "fault": self._fault(draws)}
+
+    # OpenAI wire format, shared by the in-process stub and the HTTP stand-in
+
+    @staticmethod
+    def _usage(plan: CompletionPlan) -> Dict[str, int]:
+        return {
+            "prompt_tokens": plan.prompt_tokens,
+            "completion_tokens": len(plan.tokens),
+            "total_tokens": plan.prompt_tokens + len(plan.tokens),
+        }
+
+    def completion_body(self, plan: CompletionPlan) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-stub-{_digest(plan.model, plan.tokens):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": plan.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(plan.tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": self._usage(plan),
+        }
+
+    def chunk_bodies(self, plan: CompletionPlan) -> Iterator[Dict[str, Any]]:
+        """Stream chunks: one per token, then the finish chunk, then a usage chunk without choices."""
+        base = {
+            "id": f"chatcmpl-stub-{_digest(plan.model, plan.tokens):x}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": plan.model,
+        }
+        for i, token in enumerate(plan.tokens):
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield {**base, "choices": [], "usage": self._usage(plan)}
+
+    def embeddings_body(self, model: str, inputs: List[str]) -> Dict[str, Any]:
+        tokens = sum(count_tokens(text) for text in inputs)
+        return {
+            "object": "list",
+            "model": model,
+            "data": [{"object": "embedding", "index": i, "embedding": self.embed(text)} for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "faults": self.faults}
+
+
+def _error(status_code: int) -> openai.APIStatusError:
+    response = httpx.Response(status_code, request=httpx.Request("POST", "http://stub.invalid/v1"))
+    if status_code == 429:
+        return openai.RateLimitError("Simulated rate limit", response=response, body=None)
+    return openai.InternalServerError("Simulated upstream error", response=response, body=None)
+
+
+class _StubCompletions:
+    def __init__(self, llm: SimulatedLLM):
+        self.llm = llm
+
+    async def create(self, model: str, messages: List[Dict[str, str]], max_tokens: Optional[int] = None,
+                     stream: bool = False, **kwargs: Any):
+        plan = self.llm.plan_completion(model, messages, max_tokens)
+        if plan.fault is not None:
+            await asyncio.sleep(plan.ttft_seconds)
+            raise _error(plan.fault)
+        if not stream:
+            await asyncio.sleep(plan.total_seconds)
+            return ChatCompletion.model_validate(self.llm.completion_body(plan))
+        return self._stream(plan)
+
+    async def _stream(self, plan: CompletionPlan) -> AsyncIterator[ChatCompletionChunk]:
+        await asyncio.sleep(plan.ttft_seconds)
+        for i, body in enumerate(self.llm.chunk_bodies(plan)):
+            if 0 < i < len(plan.tokens):
+                await asyncio.sleep(plan.seconds_per_token)
+            yield ChatCompletionChunk.model_validate(body)
+
+
+class _StubEmbeddings:
+    def __init__(self, llm: SimulatedLLM):
+        self.llm = llm
+
+    async def create(self, model: str, input: Any, **kwargs: Any) -> CreateEmbeddingResponse:
+        inputs = [input] if isinstance(input, str) else list(input)
+        plan = self.llm.plan_embeddings(inputs)
+        await asyncio.sleep(plan["seconds"])
+        if plan["fault"] is not None:
+            raise _error(plan["fault"])
+        return CreateEmbeddingResponse.model_validate(self.llm.embeddings_body(model, inputs))
+
+
+class _StubChat:
+    def __init__(self, llm: SimulatedLLM):
+        self.completions = _StubCompletions(llm)
+
+
+class StubOpenAI:
+    """
+    In-process drop-in for openai.AsyncOpenAI, covering the calls this
+    backend makes (chat.completions.create, embeddings.create) and returning
+    the SDK's own response types.
+    """
+
+    def __init__(self, llm: Optional[SimulatedLLM] = None):
+        self.llm = llm or SimulatedLLM()
+        self.chat = _StubChat(self.llm)
+        self.embeddings = _StubEmbeddings(self.llm)
+
+    def with_options(self, **options: Any) -> "StubOpenAI":
+        """Client options (retries, timeouts) mean nothing to the stand-in."""
+        return self
+
+
+def create_standin_app(llm: Optional[SimulatedLLM] = None):
+    """
+    OpenAI-compatible HTTP stand-in (/v1/chat/completions with SSE streaming,
+    /v1/embeddings) around a SimulatedLLM. Point the real client at it with
+    LLM_PROVIDER=local, so load tests also exercise the SDK and connection pool.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    llm = llm or SimulatedLLM()
+    app = FastAPI(title="Simulated OpenAI API")
+
+    def error_response(status_code: int) -> JSONResponse:
+        kind = "rate_limit_exceeded" if status_code == 429 else "server_error"
+        return JSONResponse(status_code=status_code, content={"error": {"message": "Simulated failure", "type": kind, "code": kind}})
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        plan = llm.plan_completion(body["model"], body["messages"], body.get("max_tokens"))
+        if plan.fault is not None:
+            await asyncio.sleep(plan.ttft_seconds)
+            return error_response(plan.fault)
+        if not body.get("stream"):
+            await asyncio.sleep(plan.total_seconds)
+            return llm.completion_body(plan)
+
+        async def events():
+            await asyncio.sleep(plan.ttft_seconds)
+            for i, chunk in enumerate(llm.chunk_bodies(plan)):
+                if 0 < i < len(plan.tokens):
+                    await asyncio.sleep(plan.seconds_per_token)
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = [body["input"]] if isinstance(body["input"], str) else list(body["input"])
+        plan = llm.plan_embeddings(inputs)
+        await asyncio.sleep(plan["seconds"])
+        if plan["fault"] is not None:
+            return error_response(plan["fault"])
+        return llm.embeddings_body(body["model"], inputs)
+
+    @app.get("/stats")
+    def stats():
+        return llm.stats()
+
+    return app
@@ -0,0 +1,108 @@
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+from src.models.chatbot import RetrievalResult
+from src.utils.security import settings
+from src.utils.tokens import count_tokens
+
+
+@dataclass
+class RouteDecision:
+    model: str
+    reason: str
+    query_tokens: int
+    top_score: float
+    score_spread: float
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    """
+    Pick the chat model per query from signals that are free once retrieval is done.
+
+    A query goes to small_model when it is short (at most max_query_tokens),
+    its best chunk is a confident match (vector similarity of at least
+    min_top_score) and that chunk stands out from the rest (top score minus the
+    mean of the others of at least min_score_spread): the answer is in one
+    place and needs little reasoning. Anything else, such as long, multi-part
+    or multi-hop questions and retrieval that found several equally plausible
+    chunks, goes to large_model.
+
+    Decisions are counted per model and reason, and completion latency is
+    kept per model over the last latency_window calls, so the thresholds can
+    be tuned against p95.
+    """
+
+    def __init__(self, small_model: Optional[str] = None, large_model: Optional[str] = None,
+                 max_query_tokens: Optional[int] = None, min_top_score: Optional[float] = None,
+                 min_score_spread: Optional[float] = None, enabled: Optional[bool] = None,
+                 latency_window: Optional[int] = None):
+        self.small_model = small_model or settings.ROUTER_SMALL_MODEL
+        self.large_model = large_model or settings.ROUTER_LARGE_MODEL
+        self.max_query_tokens = max_query_tokens or settings.ROUTER_MAX_QUERY_TOKENS
+        self.min_top_score = min_top_score if min_top_score is not None else settings.ROUTER_MIN_TOP_SCORE
+        self.min_score_spread = min_score_spread if min_score_spread is not None else settings.ROUTER_MIN_SCORE_SPREAD
+        self.enabled = enabled if enabled is not None else settings.MODEL_ROUTING_ENABLED
+        self.latency_window = latency_window or settings.ROUTER_LATENCY_WINDOW
+        self.decisions: Counter = Counter()
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def route(self, query: str, results: List[RetrievalResult]) -> RouteDecision:
+        scores = sorted((result.similarity_score for result in results), reverse=True)
+        top_score = scores[0] if scores else 0.0
+        rest = scores[1:]
+        spread = top_score - sum(rest) / len(rest) if rest else top_score
+        query_tokens = count_tokens(query)
+
+        if not self.enabled:
+            model, reason = self.large_model, "routing_disabled"
+        elif query_tokens > self.max_query_tokens:
+            model, reason = self.large_model, "long_query"
+        elif top_score < self.min_top_score:
+            model, reason = self.large_model, "low_top_score"
+        elif spread < self.min_score_spread:
+            model, reason = self.large_model, "flat_scores"
+        else:
+            model, reason = self.small_model, "simple_query"
+
+        self.decisions[(model, reason)] += 1
+        return RouteDecision(model=model, reason=reason, query_tokens=query_tokens,
+                             top_score=round(top_score, 4), score_spread=round(spread, 4))
+
+    def record_latency(self, model: str, seconds: float) -> None:
+        window = self._latencies.get(model)
+        if window is None:
+            window = self._latencies[model] = deque(maxlen=self.latency_window)
+        window.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        decisions: Dict[str, Dict[str, int]] = {}
+        for (model, reason), count in sorted(self.decisions.items()):
+            decisions.setdefault(model, {})[reason] = count
+        return {
+            "enabled": self.enabled,
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "thresholds": {
+                "max_query_tokens": self.max_query_tokens,
+                "min_top_score": self.min_top_score,
+                "min_score_spread": self.min_score_spread,
+            },
+            "decisions": decisions,
+            "latency_seconds": {
+                model: {
+                    "calls": len(window),
+                    "p50": round(_percentile(list(window), 0.5), 3),
+                    "p95": round(_percentile(list(window), 0.95), 3),
+                }
+                for model, window in self._latencies.items() if window
+            },
+        }
+
+
+model_router = ModelRouter()
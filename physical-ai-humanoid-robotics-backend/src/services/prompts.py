@@ -0,0 +1,102 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.models.chatbot import RetrievalResult
+
+
+# System messages are module constants so every request sends the same bytes:
+# providers only reuse a cached prompt prefix that matches exactly. Anything
+# that varies per request belongs in the user message, after the stable parts.
+RAG_SYSTEM_PROMPT = (
+    "You are an AI assistant for the Physical AI & Humanoid Robotics Textbook.\n"
+    "Answer the user's question based on the context from the textbook given in the user message. "
+    "Please provide a helpful answer based on the textbook content. "
+    "If the context doesn't contain the information needed, say so politely."
+)
+
+SELECTED_TEXT_SYSTEM_PROMPT = (
+    "You are an AI assistant for the Physical AI & Humanoid Robotics Textbook.\n"
+    "The user has selected a passage of the textbook and has a question about it. "
+    "Please provide an answer that is directly based on the selected text."
+)
+
+Messages = List[Dict[str, str]]
+
+
+def rag_messages(query: str, chunks: List[RetrievalResult], conversation: str = "") -> Messages:
+    """
+    System prompt, then the context, then the conversation, then the question.
+
+    Chunks are ordered by ID rather than by score, so the same retrieved set
+    always renders to the same context text whatever order the search
+    returned it in.
+    """
+    context = "\n\n".join(chunk.content for chunk in sorted(chunks, key=lambda chunk: chunk.content_id))
+    parts = [f"Context:\n{context}"]
+    if conversation:
+        parts.append(f"Conversation so far:\n{conversation}")
+    parts.append(f"User question: {query}")
+    return [
+        {"role": "system", "content": RAG_SYSTEM_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+def selected_text_messages(query: str, selected_text: str) -> Messages:
+    """System prompt, then the passage, then the question: everything but the question is shared per passage."""
+    return [
+        {"role": "system", "content": SELECTED_TEXT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Selected text:\n{selected_text}\n\nUser question: {query}"},
+    ]
+
+
+def messages_text(messages: Messages) -> str:
+    """Flat rendering of a message list, for cache and single-flight keys."""
+    return "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+def _field(value: Any, name: str) -> Any:
+    # Usage objects from older SDKs keep unknown fields as plain dicts
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+
+def prompt_token_usage(usage: Any) -> Optional[Tuple[int, int]]:
+    """(cached, uncached) prompt tokens from a completion's usage, when it reports them."""
+    prompt_tokens = _field(usage, "prompt_tokens") if usage is not None else None
+    if prompt_tokens is None:
+        return None
+    cached = _field(_field(usage, "prompt_tokens_details"), "cached_tokens") or 0
+    return cached, prompt_tokens - cached
+
+
+class PromptCacheStats:
+    """Running totals of cached versus uncached prompt tokens, as reported by the provider."""
+
+    def __init__(self):
+        self.requests = 0
+        self.cached_tokens = 0
+        self.uncached_tokens = 0
+
+    def record(self, usage: Any, label: str) -> None:
+        """Add one completion's usage to the totals and log its split under label (the model)."""
+        tokens = prompt_token_usage(usage)
+        if tokens is None:
+            return
+        cached, uncached = tokens
+        self.requests += 1
+        self.cached_tokens += cached
+        self.uncached_tokens += uncached
+        print(f"Prompt tokens for {label}: {cached} cached, {uncached} uncached")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.cached_tokens + self.uncached_tokens
+        return {
+            "requests": self.requests,
+            "cached_tokens": self.cached_tokens,
+            "uncached_tokens": self.uncached_tokens,
+            "cached_ratio": round(self.cached_tokens / total, 4) if total else 0.0,
+        }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+import asyncio
+import time
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.database import AsyncSessionLocal
+from src.database.models import ChatMessage, ChatSession
+from src.models.retention import CompactionReport
+from src.utils.security import settings
+
+
+ANONYMOUS_PREFIX = "anonymous_"
+
+
+class RetentionService:
+    """
+    Delete anonymous chat sessions that have been idle for longer than the TTL.
+
+    Work is done in short transactions of at most batch_size rows (messages
+    first, then the sessions they belonged to) with a pause in between, so the
+    compaction never holds locks for long and interleaves with live traffic.
+    A run stops after max_batches transactions; the rest is picked up by the
+    next run.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+                 ttl_seconds: Optional[float] = None, batch_size: Optional[int] = None,
+                 pause_seconds: Optional[float] = None, max_batches: Optional[int] = None):
+        self.session_factory = session_factory
+        self.ttl = timedelta(seconds=ttl_seconds if ttl_seconds is not None else settings.ANONYMOUS_SESSION_TTL_SECONDS)
+        self.batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        self.pause_seconds = pause_seconds if pause_seconds is not None else settings.RETENTION_BATCH_PAUSE_SECONDS
+        self.max_batches = max_batches or settings.RETENTION_MAX_BATCHES_PER_RUN
+        self.last_report: Optional[CompactionReport] = None
+        self.total_rows_reclaimed = 0
+
+    def _expired_sessions(self, cutoff: datetime):
+        return (
+            select(ChatSession.id)
+            .where(ChatSession.user_id.startswith(ANONYMOUS_PREFIX, autoescape=True))
+            .where(ChatSession.last_message_at < cutoff)
+            .order_by(ChatSession.last_message_at)
+            .limit(self.batch_size)
+        )
+
+    async def _delete_messages(self, db: AsyncSession, session_ids: List[str], cutoff: datetime) -> int:
+        # Only sessions that are still expired: a visitor may have come back since the batch was selected
+        message_ids = (await db.execute(
+            select(ChatMessage.id)
+            .join(ChatSession, ChatSession.id == ChatMessage.chat_session_id)
+            .where(ChatMessage.chat_session_id.in_(session_ids))
+            .where(ChatSession.last_message_at < cutoff)
+            .limit(self.batch_size)
+        )).scalars().all()
+        if not message_ids:
+            return 0
+        result = await db.execute(
+            delete(ChatMessage).where(ChatMessage.id.in_(message_ids)).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+    async def _delete_sessions(self, db: AsyncSession, session_ids: List[str], cutoff: datetime) -> int:
+        # Same re-check as for the messages
+        result = await db.execute(
+            delete(ChatSession)
+            .where(ChatSession.id.in_(session_ids))
+            .where(ChatSession.last_message_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+    async def compact(self) -> CompactionReport:
+        started = time.perf_counter()
+        report = CompactionReport(cutoff=datetime.utcnow() - self.ttl)
+
+        try:
+            while report.batches < self.max_batches:
+                async with self.session_factory() as db:
+                    session_ids = (await db.execute(self._expired_sessions(report.cutoff))).scalars().all()
+                    await db.commit()
+                    if not session_ids:
+                        break
+
+                    # Messages go first, a bounded slice per transaction
+                    while report.batches < self.max_batches:
+                        deleted = await self._delete_messages(db, session_ids, report.cutoff)
+                        if not deleted:
+                            break
+                        report.messages_deleted += deleted
+                        report.batches += 1
+                        await asyncio.sleep(self.pause_seconds)
+                    else:
+                        report.truncated = True
+                        break
+
+                    report.sessions_deleted += await self._delete_sessions(db, session_ids, report.cutoff)
+                    report.batches += 1
+                await asyncio.sleep(self.pause_seconds)
+            else:
+                report.truncated = True
+        except Exception as e:
+            print(f"Error compacting anonymous sessions: {e}")
+            report.error = str(e)
+
+        report.duration_seconds = round(time.perf_counter() - started, 3)
+        self.last_report = report
+        self.total_rows_reclaimed += report.rows_reclaimed
+        return report
+
+    async def run_periodically(self, interval_seconds: Optional[float] = None) -> None:
+        """Compact forever; meant to run as a background task from the app lifespan."""
+        interval = interval_seconds if interval_seconds is not None else settings.RETENTION_INTERVAL_SECONDS
+        while True:
+            report = await self.compact()
+            if report.rows_reclaimed:
+                print(
+                    f"Retention: deleted {report.sessions_deleted} anonymous sessions and "
+                    f"{report.messages_deleted} messages in {report.batches} batches ({report.duration_seconds}s)"
+                )
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            "ttl_seconds": self.ttl.total_seconds(),
+            "total_rows_reclaimed": self.total_rows_reclaimed,
+            "last_run": self.last_report.model_dump(mode="json") if self.last_report else None,
+        }
+
+
+retention_service = RetentionService()
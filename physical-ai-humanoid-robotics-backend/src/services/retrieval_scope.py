@@ -0,0 +1,81 @@
+from collections import Counter
+from pathlib import PurePosixPath
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from src.models.chatbot import RetrievalResult, RetrievalScope
+from src.services.vector_index import PayloadFilter
+from src.utils.security import settings
+
+
+# Payload keys a scope filters on; ingestion creates a Qdrant keyword index for each
+SCOPE_PAYLOAD_FIELDS = ("module_type", "chapter", "path")
+
+PAGE_SUFFIXES = (".md", ".mdx")
+
+
+def normalize_page(page: str) -> Optional[str]:
+    """
+    The docs-relative path (without extension) of a page, from its file path
+    or its site URL: "/docs/module-3-the-ai-robot-brain/chapter-1-isaac-sim-and-synthetic-data/"
+    and "module-3-the-ai-robot-brain/chapter-1-isaac-sim-and-synthetic-data.md" both give
+    "module-3-the-ai-robot-brain/chapter-1-isaac-sim-and-synthetic-data". None when the
+    page is not a textbook chapter.
+    """
+    parts = [part for part in PurePosixPath(urlparse(page).path).parts if part not in ("/", "")]
+    modules = [i for i, part in enumerate(parts) if part.startswith("module-")]
+    if not modules:
+        return None
+    path = "/".join(parts[modules[0]:])
+    for suffix in PAGE_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def scope_filter(scope: Optional[RetrievalScope]) -> Optional[PayloadFilter]:
+    """Payload filter for the scope; every field given must match."""
+    if scope is None:
+        return None
+    payload_filter: PayloadFilter = {}
+    if scope.module_type is not None:
+        payload_filter["module_type"] = scope.module_type.value
+    if scope.chapter:
+        payload_filter["chapter"] = scope.chapter
+    if scope.page:
+        page = normalize_page(scope.page)
+        if page is not None:
+            payload_filter["path"] = [page + suffix for suffix in PAGE_SUFFIXES]
+    return payload_filter or None
+
+
+class ScopedSearchPolicy:
+    """
+    Decide whether scoped results are good enough to answer from.
+
+    A scoped search that finds nothing, or whose best chunk has a vector
+    similarity below min_score, is answered from a global search instead: the
+    question is about something outside the page or module being read. When
+    the query could not be embedded, only an empty result falls back.
+    Outcomes are counted for /health/retrieval.
+    """
+
+    def __init__(self, min_score: Optional[float] = None):
+        self.min_score = min_score if min_score is not None else settings.SCOPED_SEARCH_MIN_SCORE
+        self.outcomes: Counter = Counter()
+
+    def judge(self, results: List[RetrievalResult], has_vector: bool) -> str:
+        if not results:
+            outcome = "fallback_empty"
+        elif has_vector and max(result.similarity_score for result in results) < self.min_score:
+            outcome = "fallback_low_score"
+        else:
+            outcome = "scoped"
+        self.outcomes[outcome] += 1
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        return {"min_score": self.min_score, "outcomes": dict(sorted(self.outcomes.items()))}
+
+
+scoped_search_policy = ScopedSearchPolicy()
@@ -0,0 +1,127 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import List, Optional
+import asyncio
+import functools
+import math
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from src.models.chatbot import RetrievalResult
+from src.services.vector_index import EmbeddedVectorStore, PayloadFilter
+from src.utils.security import settings
+
+
+RETRIEVER_BACKENDS = ("qdrant", "embedded")
+
+
+def _result(payload: dict, score: float) -> RetrievalResult:
+    return RetrievalResult(
+        content_id=payload.get("content_id", ""),
+        content=payload.get("content", ""),
+        similarity_score=score,
+        source=payload.get("source", "unknown"),
+        module_type=payload.get("module_type")
+    )
+
+
+class VectorRetriever(ABC):
+    """
+    Nearest-neighbour search over the ingested textbook chunks.
+
+    Backends return results best first and an empty list when the index is
+    missing or unreachable, so retrieval degrades to BM25 instead of failing.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def search(self, query_vector: List[float], limit: int,
+                     payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
+        ...
+
+
+class QdrantRetriever(VectorRetriever):
+    """Search the Qdrant collection; the sync client runs on the search executor."""
+
+    name = "qdrant"
+
+    def __init__(self, qdrant_client: QdrantClient, search_executor: Optional[Executor] = None,
+                 collection_name: Optional[str] = None):
+        self.qdrant_client = qdrant_client
+        # None falls back to the event loop's default executor
+        self.search_executor = search_executor
+        self.collection_name = collection_name or settings.QDRANT_COLLECTION
+
+    @staticmethod
+    def build_filter(payload_filter: Optional[PayloadFilter]) -> Optional[models.Filter]:
+        if not payload_filter:
+            return None
+        conditions = []
+        for key, value in payload_filter.items():
+            if isinstance(value, (list, tuple, set)):
+                match = models.MatchAny(any=list(value))
+            else:
+                match = models.MatchValue(value=value)
+            conditions.append(models.FieldCondition(key=key, match=match))
+        return models.Filter(must=conditions)
+
+    async def search(self, query_vector: List[float], limit: int,
+                     payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
+        try:
+            loop = asyncio.get_running_loop()
+            search = functools.partial(
+                self.qdrant_client.search,
+                collection_name=self.collection_name,
+                query_vector=query_vector,
+                query_filter=self.build_filter(payload_filter),
+                limit=limit,
+                timeout=math.ceil(settings.QDRANT_SEARCH_TIMEOUT)
+            )
+            search_results = await asyncio.wait_for(
+                loop.run_in_executor(self.search_executor, search),
+                timeout=settings.QDRANT_SEARCH_TIMEOUT
+            )
+            return [_result(hit.payload, hit.score) for hit in search_results]
+        except asyncio.TimeoutError:
+            print(f"Qdrant search timed out after {settings.QDRANT_SEARCH_TIMEOUT}s")
+            return []
+        except Exception as e:
+            print(f"Error retrieving content from Qdrant: {e}")
+            # Fallback: return empty results
+            return []
+
+
+class EmbeddedRetriever(VectorRetriever):
+    """
+    Search the local NumPy index written by ingestion, for deployments without
+    a Qdrant server. A few thousand rows score in well under a millisecond, so
+    the search runs inline on the event loop.
+    """
+
+    name = "embedded"
+
+    def __init__(self, store: Optional[EmbeddedVectorStore] = None):
+        self.store = store or EmbeddedVectorStore()
+
+    async def search(self, query_vector: List[float], limit: int,
+                     payload_filter: Optional[PayloadFilter] = None) -> List[RetrievalResult]:
+        try:
+            index = self.store.get()
+            if index is None:
+                return []
+            return [_result(index.payloads[row], score) for row, score in index.search(query_vector, limit, payload_filter)]
+        except Exception as e:
+            print(f"Error retrieving content from the embedded index: {e}")
+            return []
+
+
+def create_retriever(qdrant_client: Optional[QdrantClient] = None, search_executor: Optional[Executor] = None,
+                     backend: Optional[str] = None) -> VectorRetriever:
+    backend = backend or settings.RETRIEVER_BACKEND
+    if backend == "embedded":
+        return EmbeddedRetriever()
+    if backend == "qdrant":
+        return QdrantRetriever(qdrant_client, search_executor)
+    raise ValueError(f"Unknown retriever backend: {backend} (expected one of {', '.join(RETRIEVER_BACKENDS)})")
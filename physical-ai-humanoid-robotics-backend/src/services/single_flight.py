@@ -0,0 +1,141 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+import asyncio
+import hashlib
+
+from src.services.answer_cache import normalize_query
+from src.services.llm_dispatcher import SharedPriority
+
+
+T = TypeVar("T")
+
+
+class _SharedStream:
+    """
+    One upstream stream fanned out to any number of subscribers.
+
+    Deltas are buffered as they arrive, so a subscriber that joins late first
+    replays what it missed and then follows along live.
+    """
+
+    def __init__(self, open_stream: Callable[[], AsyncIterator[str]], priority: Optional[SharedPriority] = None):
+        self.open_stream = open_stream
+        self.priority = priority
+        self.deltas: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+        self.task = asyncio.get_running_loop().create_task(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            async for delta in self.open_stream():
+                async with self._changed:
+                    self.deltas.append(delta)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.deltas) > position or self.done)
+                new, done = self.deltas[position:], self.done
+            for delta in new:
+                yield delta
+            position += len(new)
+            if done and position >= len(self.deltas):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesce identical LLM calls that are in flight at the same time.
+
+    Callers with the same key (normalised prompt, model, temperature) share
+    one upstream completion, or for streams one upstream stream. The shared
+    call is shielded, so one caller disconnecting does not cancel it for the
+    others; errors reach every caller. Entries only live while the call is in
+    flight; repeats after that are the answer cache's job.
+
+    A caller may pass the SharedPriority its call waits on in the LLM
+    dispatcher. The first caller's is used; a later caller raises it to its
+    own, so the shared call queues at the most urgent priority among the
+    callers waiting on it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._call_priorities: Dict[Hashable, SharedPriority] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+        self.upstream_streams = 0
+        self.coalesced_streams = 0
+
+    @staticmethod
+    def key(prompt: str, model: str, temperature: float) -> Tuple[str, str, float]:
+        digest = hashlib.sha256(normalize_query(prompt).encode("utf-8")).hexdigest()
+        return digest, model, temperature
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]],
+                  priority: Optional[SharedPriority] = None) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            self.upstream_calls += 1
+            future = asyncio.ensure_future(call())
+            self._calls[key] = future
+            if priority is not None:
+                self._call_priorities[key] = priority
+            future.add_done_callback(lambda done: self._forget_call(key, done))
+        else:
+            self.coalesced_calls += 1
+            self._join(self._call_priorities.get(key), priority)
+        return await asyncio.shield(future)
+
+    async def stream(self, key: Hashable, open_stream: Callable[[], AsyncIterator[str]],
+                     priority: Optional[SharedPriority] = None) -> AsyncIterator[str]:
+        shared = self._streams.get(key)
+        if shared is None:
+            self.upstream_streams += 1
+            shared = _SharedStream(open_stream, priority)
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+        else:
+            self.coalesced_streams += 1
+            self._join(shared.priority, priority)
+        async for delta in shared.subscribe():
+            yield delta
+
+    @staticmethod
+    def _join(flight: Optional[SharedPriority], caller: Optional[SharedPriority]) -> None:
+        if flight is not None and caller is not None:
+            flight.raise_to(caller.value)
+
+    def _forget_call(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+            self._call_priorities.pop(key, None)
+
+    @staticmethod
+    def _forget(entries: Dict[Hashable, Any], key: Hashable, entry: Any) -> None:
+        if entries.get(key) is entry:
+            del entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "upstream_calls": self.upstream_calls,
+            "coalesced_calls": self.coalesced_calls,
+            "upstream_streams": self.upstream_streams,
+            "coalesced_streams": self.coalesced_streams,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
+
+
+single_flight = SingleFlight()
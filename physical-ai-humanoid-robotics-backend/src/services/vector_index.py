@@ -0,0 +1,201 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import os
+
+import numpy as np
+
+from src.services.index_generations import current_index_dir
+from src.utils.security import settings
+
+
+INDEX_DTYPES = ("float32", "int8")
+
+# Rows scored per matrix product when rows have to be copied (int8 upcasts, filtered
+# gathers); bounds the float32 scratch space a query allocates
+SEARCH_BLOCK_ROWS = 16384
+
+# A payload filter maps a payload key to a value, or to a list of accepted values
+PayloadFilter = Dict[str, Any]
+
+
+def payload_mask(payloads: List[Dict[str, Any]], payload_filter: PayloadFilter,
+                 columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Boolean mask of the payloads matching every condition. Columns of payload
+    values are built on first use and kept in `columns`, the caller's cache.
+    """
+    mask = np.ones(len(payloads), dtype=bool)
+    for key, value in payload_filter.items():
+        column = columns.get(key)
+        if column is None:
+            column = np.empty(len(payloads), dtype=object)
+            column[:] = [payload.get(key) for payload in payloads]
+            columns[key] = column
+        if isinstance(value, (list, tuple, set)):
+            mask &= np.isin(column, list(value))
+        else:
+            mask &= column == value
+    return mask
+
+
+def save_array(path: Path, array: np.ndarray) -> None:
+    """
+    Write an .npy file through a temp file and a rename. Readers keep the old
+    file mmap'd; overwriting it in place would truncate their mapping and the
+    next search would die with SIGBUS.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def save_json(path: Path, data: Any) -> None:
+    """Write a JSON file through a temp file and a rename, so readers never see half of it."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class EmbeddedVectorIndex:
+    """
+    Exact cosine top-k over an in-process embedding matrix.
+
+    Rows are L2-normalised at build time, so cosine similarity is a single
+    matrix-vector product. With dtype="int8" each row is quantised against its
+    own max-abs scale (kept in scales.npy), which cuts the matrix to a quarter
+    of its float32 size for a small loss in score precision. The matrix is
+    saved as .npy and loaded with mmap; payloads live in payloads.json.
+    """
+
+    def __init__(self, ids: List[str], matrix: np.ndarray, scales: Optional[np.ndarray],
+                 payloads: List[Dict[str, Any]]):
+        self.ids = ids
+        self.matrix = matrix
+        self.scales = scales
+        self.payloads = payloads
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimensions(self) -> int:
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    @property
+    def dtype(self) -> str:
+        return "int8" if self.scales is not None else "float32"
+
+    @classmethod
+    def build(cls, ids: Sequence[str], vectors: Sequence[Sequence[float]], payloads: Sequence[Dict[str, Any]],
+              dtype: str = "float32") -> "EmbeddedVectorIndex":
+        if dtype not in INDEX_DTYPES:
+            raise ValueError(f"Unsupported embedded index dtype: {dtype}")
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(ids), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        scales = None
+        if dtype == "int8":
+            scales = (np.abs(matrix).max(axis=1) / 127.0).astype(np.float32)
+            scales[scales == 0] = 1.0
+            matrix = np.rint(matrix / scales[:, None]).astype(np.int8)
+
+        return cls(list(ids), np.ascontiguousarray(matrix), scales, list(payloads))
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        save_array(directory / "vectors.npy", self.matrix)
+        if self.scales is not None:
+            save_array(directory / "scales.npy", self.scales)
+        elif (directory / "scales.npy").exists():
+            (directory / "scales.npy").unlink()
+        # payloads.json is written last; its mtime marks a complete index
+        save_json(directory / "payloads.json", {"ids": self.ids, "payloads": self.payloads})
+
+    @classmethod
+    def load(cls, directory: Path) -> "EmbeddedVectorIndex":
+        matrix = np.load(directory / "vectors.npy", mmap_mode="r")
+        scales_path = directory / "scales.npy"
+        scales = np.load(scales_path) if matrix.dtype == np.int8 and scales_path.exists() else None
+        with open(directory / "payloads.json", "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        return cls(metadata["ids"], matrix, scales, metadata["payloads"])
+
+    def vectors(self) -> Dict[str, np.ndarray]:
+        """Unit vectors by ID (dequantised for int8), used to carry rows over on rebuilds."""
+        rows = np.asarray(self.matrix, dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[:, None]
+        return dict(zip(self.ids, rows))
+
+    def filter_mask(self, payload_filter: PayloadFilter) -> np.ndarray:
+        """Boolean mask of the rows whose payload matches every condition."""
+        return payload_mask(self.payloads, payload_filter, self._columns)
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """Cosine scores against a unit query for the given rows, or all rows when None."""
+        if rows is None and self.scales is None:
+            return self.matrix @ query
+        count = len(self.ids) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        # An int8 matrix would be upcast whole by a single product; go a block at a time
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, count)
+            block = self.matrix[start:stop] if rows is None else self.matrix[rows[start:stop]]
+            scores[start:stop] = block.astype(np.float32, copy=False) @ query
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def search(self, query_vector: Sequence[float], top_k: int,
+               payload_filter: Optional[PayloadFilter] = None) -> List[Tuple[int, float]]:
+        """Return up to top_k (row, cosine score) pairs, best first."""
+        if not self.ids or top_k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape != (self.dimensions,):
+            raise ValueError(f"Query has {query.size} dimensions, index has {self.dimensions}")
+        norm = float(np.linalg.norm(query))
+        if norm == 0:
+            return []
+
+        # A filter narrows the rows before scoring, so scoped searches only pay for their own rows
+        rows = np.flatnonzero(self.filter_mask(payload_filter)) if payload_filter else None
+        scores = self._scores(query / norm, rows)
+
+        candidates = np.arange(len(scores))
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores, top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(rows[i] if rows is not None else i), float(scores[i])) for i in ranked]
+
+
+class EmbeddedVectorStore:
+    """Process-wide handle on the live vector index; reloads when a new one is published."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.root = Path(directory or settings.RAG_INDEX_DIR)
+        self._index: Optional[EmbeddedVectorIndex] = None
+        self._loaded: Optional[Tuple[Path, float]] = None
+
+    @property
+    def directory(self) -> Path:
+        return current_index_dir(self.root) / "vectors"
+
+    def get(self) -> Optional[EmbeddedVectorIndex]:
+        directory = self.directory
+        try:
+            mtime = (directory / "payloads.json").stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if self._index is None or (directory, mtime) != self._loaded:
+            self._index = EmbeddedVectorIndex.load(directory)
+            self._loaded = (directory, mtime)
+        return self._index
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Iterator, Optional, Tuple, TypeVar
+import time
+
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """
+    In-process LRU cache with optional TTL and hit/miss counters.
+
+    Not thread-safe; it is meant to be used from the event loop. on_evict is
+    called with (key, value) whenever an entry leaves the cache for any reason
+    other than clear().
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, V], None]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not None
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds
+
+    def _remove(self, key: Hashable) -> None:
+        _, value = self._entries.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def peek(self, key: Hashable) -> Optional[V]:
+        """Look up without touching recency or the hit/miss counters."""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry[0]):
+            return None
+        return entry[1]
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self._expired(entry[0]):
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: V) -> None:
+        if key in self._entries:
+            self._entries.pop(key)
+        self._entries[key] = (time.monotonic(), value)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def items(self) -> Iterator[Tuple[Hashable, V]]:
+        """Live (unexpired) entries, least recently used first."""
+        for key, (stored_at, value) in list(self._entries.items()):
+            if not self._expired(stored_at):
+                yield key, value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
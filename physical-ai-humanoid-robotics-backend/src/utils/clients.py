@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+import httpx
+import openai
+from qdrant_client import QdrantClient
+
+from src.services.embedding_batcher import EmbeddingBatcher
+from src.services.llm_providers import StubOpenAI
+from src.services.retrievers import VectorRetriever, create_retriever
+from src.utils.security import settings
+
+
+def _pool_stats(http_client: Any) -> Dict[str, Any]:
+    """Summarise the connection pool behind an httpx client (sync or async)."""
+    transport = getattr(http_client, "_transport", None)
+    pool = getattr(transport, "_pool", None)
+    if pool is None:
+        return {"available": False}
+
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "available": True,
+        "max_connections": getattr(pool, "_max_connections", None),
+        "max_keepalive_connections": getattr(pool, "_max_keepalive_connections", None),
+        "keepalive_expiry": getattr(pool, "_keepalive_expiry", None),
+        "open_connections": len(connections),
+        "active_connections": len(connections) - idle,
+        "idle_connections": idle,
+        "queued_requests": len(getattr(pool, "_requests", [])),
+    }
+
+
+class ClientPool:
+    """
+    Process-wide Qdrant and OpenAI clients.
+
+    The clients are created once in the app lifespan hook and shared by every
+    request, so connections (and their TLS sessions) are reused instead of being
+    rebuilt per request. Accessing a client before startup creates it lazily,
+    which keeps scripts that use TestClient without a lifespan working.
+    """
+
+    def __init__(self):
+        self._qdrant: Optional[QdrantClient] = None
+        self._openai: Optional[openai.AsyncOpenAI] = None
+        self._openai_completions: Optional[openai.AsyncOpenAI] = None
+        self._openai_http: Optional[httpx.AsyncClient] = None
+        self._search_executor: Optional[ThreadPoolExecutor] = None
+        self._embedding_batcher: Optional[EmbeddingBatcher] = None
+        self._retriever: Optional[VectorRetriever] = None
+
+    @property
+    def qdrant(self) -> QdrantClient:
+        if self._qdrant is None:
+            self._qdrant = self._create_qdrant_client()
+        return self._qdrant
+
+    @property
+    def openai(self) -> openai.AsyncOpenAI:
+        """OpenAI client, or a stand-in for it when LLM_PROVIDER is stub or local."""
+        if self._openai is None and settings.LLM_PROVIDER == "stub":
+            self._openai = StubOpenAI()
+        if self._openai is None:
+            self._openai_http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.POOL_KEEPALIVE_EXPIRY,
+                ),
+                timeout=settings.OPENAI_TIMEOUT,
+            )
+            self._openai = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.LOCAL_LLM_URL if settings.LLM_PROVIDER == "local" else None,
+                http_client=self._openai_http,
+            )
+        return self._openai
+
+    @property
+    def openai_completions(self) -> "openai.AsyncOpenAI":
+        """
+        The OpenAI client for chat completions: same connection pool, but with
+        OPENAI_COMPLETION_MAX_RETRIES, since the LLM dispatcher already backs off
+        on 429s. Embeddings and ingestion use `openai` and keep the SDK's retries.
+        """
+        if self._openai_completions is None:
+            self._openai_completions = self.openai.with_options(max_retries=settings.OPENAI_COMPLETION_MAX_RETRIES)
+        return self._openai_completions
+
+    @property
+    def search_executor(self) -> ThreadPoolExecutor:
+        """Bounded pool for blocking Qdrant calls, so they never run on the event loop."""
+        if self._search_executor is None:
+            self._search_executor = ThreadPoolExecutor(
+                max_workers=settings.QDRANT_SEARCH_WORKERS,
+                thread_name_prefix="qdrant-search",
+            )
+        return self._search_executor
+
+    @property
+    def embedding_batcher(self) -> EmbeddingBatcher:
+        """Batches concurrent query embeddings onto the shared OpenAI client."""
+        if self._embedding_batcher is None:
+            self._embedding_batcher = EmbeddingBatcher(self.openai)
+        return self._embedding_batcher
+
+    @property
+    def retriever(self) -> VectorRetriever:
+        """Vector search backend selected by RETRIEVER_BACKEND."""
+        if self._retriever is None:
+            if settings.RETRIEVER_BACKEND == "embedded":
+                self._retriever = create_retriever(backend="embedded")
+            else:
+                self._retriever = create_retriever(self.qdrant, self.search_executor)
+        return self._retriever
+
+    def _create_qdrant_client(self) -> QdrantClient:
+        if not settings.QDRANT_URL or settings.QDRANT_URL == ":memory:":
+            return QdrantClient(":memory:")
+
+        return QdrantClient(
+            url=settings.QDRANT_URL,
+            api_key=settings.QDRANT_API_KEY or None,
+            timeout=settings.QDRANT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.QDRANT_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.QDRANT_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.POOL_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    async def startup(self) -> None:
+        # Touch the properties so everything exists before the first request
+        self.qdrant
+        self.openai
+        self.openai_completions
+        self.search_executor
+        self.embedding_batcher
+        self.retriever
+
+    async def shutdown(self) -> None:
+        if self._openai_http is not None:
+            await self._openai_http.aclose()
+        if self._search_executor is not None:
+            self._search_executor.shutdown(wait=False, cancel_futures=True)
+        if self._qdrant is not None:
+            self._qdrant.close()
+        self._search_executor = None
+        self._embedding_batcher = None
+        self._retriever = None
+        self._qdrant = None
+        self._openai = None
+        self._openai_completions = None
+        self._openai_http = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection pool utilisation for the shared clients."""
+        qdrant_http = None
+        if self._qdrant is not None:
+            remote = getattr(self._qdrant, "_client", None)
+            api = getattr(getattr(remote, "openapi_client", None), "client", None)
+            qdrant_http = getattr(api, "_client", None)
+
+        return {
+            "retriever_backend": settings.RETRIEVER_BACKEND,
+            "llm_provider": settings.LLM_PROVIDER,
+            "qdrant": _pool_stats(qdrant_http) if qdrant_http is not None else {"available": False},
+            "openai": _pool_stats(self._openai_http) if self._openai_http is not None else {"available": False},
+            "qdrant_search_executor": {
+                "max_workers": settings.QDRANT_SEARCH_WORKERS,
+                "threads": len(self._search_executor._threads) if self._search_executor is not None else 0,
+                "queued": self._search_executor._work_queue.qsize() if self._search_executor is not None else 0,
+            },
+        }
+
+
+client_pool = ClientPool()
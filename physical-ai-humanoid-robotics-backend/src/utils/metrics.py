@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import time
+
+
+# Seconds; spans a cache hit through a slow GPT-4 answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """
+    Cumulative histogram rendered in the Prometheus text exposition format.
+
+    Kept in-process and dependency-free; the event loop is the only writer,
+    so no locking is needed.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = ([0] * len(self.buckets), [0.0, 0.0])
+        counts, totals = series
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, (total, count)) in sorted(self._series.items()):
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {int(count)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Histogram] = []
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+
+rag_stage_seconds = registry.histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of a chatbot RAG request.",
+    label_names=("stage",)
+)
+
+rag_chunks_used = registry.histogram(
+    "rag_chunks_used",
+    "Retrieved chunks that made it into the prompt of a chatbot RAG request.",
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
+
+
+class StageTimer:
+    """
+    Wall-clock time per pipeline stage of one request.
+
+    A stage entered twice (e.g. a scoped search that falls back to a global
+    one) accumulates. finish() feeds the per-stage totals to the
+    rag_stage_duration_seconds histogram once the request is done, so each
+    request is one sample per stage rather than one per entry.
+    """
+
+    def __init__(self, histogram: Optional[Histogram] = rag_stage_seconds):
+        self.histogram = histogram
+        self.timings: Dict[str, float] = {}
+        self.finished = False
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def finish(self) -> None:
+        """Observe every stage's total; later calls do nothing."""
+        if self.finished:
+            return
+        self.finished = True
+        if self.histogram is not None:
+            for stage, seconds in self.timings.items():
+                self.histogram.observe(seconds, stage)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def milliseconds(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 2) for stage, seconds in self.timings.items()}
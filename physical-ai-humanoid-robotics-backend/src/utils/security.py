@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 import jwt
 from pydantic_settings import BaseSettings
 from pydantic import Field, BaseModel
@@ -49,14 +49,122 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
      # 🤖 OpenAI
     OPENAI_API_KEY: str
+    # "openai", "stub" (in-process simulator) or "local" (HTTP stand-in, see llm_standin.py)
+    LLM_PROVIDER: str = "openai"
+    LOCAL_LLM_URL: str = "http://127.0.0.1:8100/v1"
+    # Simulated LLM used by the stub and local providers
+    STUB_LLM_SEED: int = 0
+    STUB_LLM_TTFT_SECONDS: float = 0.4  # median time to first token
+    STUB_LLM_LATENCY_SIGMA: float = 0.3  # lognormal spread around the medians
+    STUB_LLM_TOKENS_PER_SECOND: float = 60.0
+    STUB_EMBEDDING_LATENCY_SECONDS: float = 0.05
+    STUB_LLM_ERROR_RATE: float = 0.0  # share of requests failing with a 500
+    STUB_LLM_RATE_LIMIT_RATE: float = 0.0  # share of requests failing with a 429
 
     # 🧠 Qdrant
-    QDRANT_URL: str
-    QDRANT_API_KEY: str
+    QDRANT_URL: str = ""  # unused with RETRIEVER_BACKEND=embedded
+    QDRANT_API_KEY: str = ""
 
     # 🗄️ Database
     DATABASE_URL: str
 
+    # 🔌 Connection pools (shared clients created in the app lifespan)
+    QDRANT_TIMEOUT: float = 10.0
+    QDRANT_POOL_MAX_CONNECTIONS: int = 32
+    QDRANT_POOL_MAX_KEEPALIVE: int = 16
+    OPENAI_TIMEOUT: float = 60.0
+    OPENAI_POOL_MAX_CONNECTIONS: int = 100
+    OPENAI_POOL_MAX_KEEPALIVE: int = 20
+    POOL_KEEPALIVE_EXPIRY: float = 30.0
+
+    # 🚦 LLM admission control: AIMD concurrency limit plus a priority wait queue
+    LLM_CONCURRENCY_INITIAL: int = 8
+    LLM_CONCURRENCY_MIN: int = 1
+    LLM_CONCURRENCY_MAX: int = 64
+    LLM_QUEUE_MAX: int = 256
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 10.0  # longer expected waits get a 503 with Retry-After
+    LLM_LATENCY_TARGET_SECONDS: float = 30.0  # completion time, or time to first token when streaming
+    LLM_BACKOFF_FACTOR: float = 0.5  # limit multiplier on a 429
+    # Retries on the client chat completions use: 429s should reach the dispatcher's backoff
+    # rather than be retried while holding a slot. Embeddings keep the SDK's default retries.
+    OPENAI_COMPLETION_MAX_RETRIES: int = 0
+
+    # 🧭 Model routing: short questions with one clearly matching chunk go to the small model
+    MODEL_ROUTING_ENABLED: bool = True
+    ROUTER_SMALL_MODEL: str = "gpt-3.5-turbo"
+    ROUTER_LARGE_MODEL: str = "gpt-4"
+    ROUTER_MAX_QUERY_TOKENS: int = 24
+    ROUTER_MIN_TOP_SCORE: float = 0.8  # vector cosine similarity of the best chunk
+    ROUTER_MIN_SCORE_SPREAD: float = 0.05  # best score minus the mean of the others
+    ROUTER_LATENCY_WINDOW: int = 500  # completions per model kept for the p50/p95 figures
+
+    # 🔎 Retrieval (sync Qdrant calls run on a bounded thread pool off the event loop)
+    QDRANT_SEARCH_WORKERS: int = 8
+    QDRANT_SEARCH_TIMEOUT: float = 5.0
+    QDRANT_COLLECTION: str = "textbook_content"
+    # Vector backend: "qdrant", or "embedded" for the NumPy index in RAG_INDEX_DIR (no server needed)
+    RETRIEVER_BACKEND: str = "qdrant"
+    EMBEDDED_INDEX_DTYPE: str = "float32"  # or "int8": a quarter of the memory, per-row scaled
+    # Hybrid retrieval: BM25 over the same chunks, merged with reciprocal-rank fusion
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_CANDIDATES: int = 20
+    HYBRID_VECTOR_WEIGHT: float = 1.0
+    HYBRID_LEXICAL_WEIGHT: float = 1.0
+    RRF_K: int = 60
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    # Adaptive top_k: over-fetch, then cut at the largest score gap or below a share of the best score
+    ADAPTIVE_TOP_K_ENABLED: bool = True
+    ADAPTIVE_TOP_K_CANDIDATES: int = 10
+    ADAPTIVE_TOP_K_FLOOR: int = 1
+    ADAPTIVE_TOP_K_CEILING: int = 8
+    ADAPTIVE_TOP_K_MIN_RELATIVE_SCORE: float = 0.4
+    ADAPTIVE_TOP_K_MIN_GAP: float = 0.25  # as a share of the best score
+    # Per-module [floor, ceiling] by module type, e.g. '{"nvidia_isaac": [2, 6]}'
+    ADAPTIVE_TOP_K_MODULE_LIMITS: Dict[str, Tuple[int, int]] = {}
+    # Scoped retrieval (module, chapter or page): below this best vector similarity, search globally instead
+    SCOPED_SEARCH_MIN_SCORE: float = 0.3
+
+    # 📚 Textbook ingestion
+    TEXTBOOK_DOCS_PATH: str = "../physical-ai-humanoid-robotics/docs"
+    RAG_INDEX_DIR: str = "./rag_index"  # manifest and local index files
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIMENSIONS: int = 1536
+    EMBEDDING_BATCH_SIZE: int = 256
+    # Query-time micro-batching of embedding requests
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_CACHE_SIZE: int = 4096
+    QDRANT_UPSERT_BATCH_SIZE: int = 256
+    CHUNK_MAX_TOKENS: int = 400
+
+    # 💬 Chat history
+    CHAT_HISTORY_MAX_PAGE_SIZE: int = 100
+    CHAT_EXPORT_BATCH_SIZE: int = 500
+    CHAT_SESSION_PAGE_SIZE: int = 20
+    CHAT_SESSION_PREVIEW_CHARS: int = 120
+    # Conversation memory in ChatSession.context: a rolling summary plus the last turns verbatim
+    CONVERSATION_RECENT_TURNS: int = 3
+    CONVERSATION_SUMMARY_TRIGGER_TOKENS: int = 800  # older verbatim turns before they get summarised
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300
+    CONVERSATION_SUMMARY_MODEL: str = "gpt-3.5-turbo"
+    CONVERSATION_TURN_MAX_TOKENS: int = 300  # per stored message
+
+    # 🧹 Retention: expired anonymous sessions are deleted in the background
+    RETENTION_ENABLED: bool = True
+    ANONYMOUS_SESSION_TTL_SECONDS: float = 7 * 24 * 3600  # since the session's last message
+    RETENTION_INTERVAL_SECONDS: float = 3600
+    RETENTION_BATCH_SIZE: int = 500  # rows deleted per transaction
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.2  # between transactions, to let other writers in
+    RETENTION_MAX_BATCHES_PER_RUN: int = 200
+
+    # 💾 RAG answer cache
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: float = 6 * 3600
+    ANSWER_CACHE_SIMILARITY: float = 0.95
+    SELECTED_TEXT_CACHE_MAX_ENTRIES: int = 2048
+    SELECTED_TEXT_CACHE_TTL_SECONDS: float = 24 * 3600
+
     model_config = SettingsConfigDict(
         env_file=".env",
         extra="ignore"  # ← temporarily ignore extra fields for testing
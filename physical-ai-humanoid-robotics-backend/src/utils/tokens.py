@@ -0,0 +1,47 @@
+from functools import lru_cache
+from typing import Optional
+import re
+
+import tiktoken
+
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Used when the tiktoken BPE files cannot be loaded (e.g. offline hosts with an
+# empty TIKTOKEN_CACHE_DIR). Words and punctuation marks count as one token each,
+# which slightly undercounts real BPE tokens but keeps budgets in the right range.
+_APPROXIMATE_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = DEFAULT_ENCODING) -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"tiktoken encoding {name} unavailable, using approximate token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROXIMATE_TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+
+    encoding = get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens])
+
+    for index, match in enumerate(_APPROXIMATE_TOKEN_RE.finditer(text)):
+        if index == max_tokens - 1:
+            return text[:match.end()]
+    return text
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Test the adaptive top_k cutoff on retrieval results"""
+
+import asyncio
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.models.chatbot import RetrievalResult
+from src.services.adaptive_top_k import AdaptiveTopK
+from src.services.bm25_index import BM25Store
+from src.services.chatbot_service import ChatbotService
+
+
+def hits(*scores, module_type="ros_2"):
+    return [
+        RetrievalResult(content_id=f"c{i}", content=f"chunk {i}", similarity_score=score,
+                        source=f"m#{i}", module_type=module_type)
+        for i, score in enumerate(scores)
+    ]
+
+
+def cutoff(**overrides):
+    options = dict(candidates=10, floor=1, ceiling=8, min_relative_score=0.4, min_gap=0.25,
+                   module_limits={}, enabled=True)
+    options.update(overrides)
+    return AdaptiveTopK(**options)
+
+
+def test_cuts_at_the_largest_score_gap():
+    kept, decision = cutoff().cut(hits(0.9, 0.5, 0.48, 0.45))
+    assert [r.content_id for r in kept] == ["c0"]
+    assert (decision.kept, decision.fetched, decision.reason) == (1, 4, "score_gap")
+
+
+def test_drops_chunks_below_the_relative_score():
+    kept, decision = cutoff().cut(hits(0.9, 0.85, 0.8, 0.3, 0.28))
+    assert [r.content_id for r in kept] == ["c0", "c1", "c2"]
+    assert decision.reason == "relative_score"
+
+
+def test_floor_ceiling_and_module_limits():
+    flat = hits(*[0.9 - i * 0.01 for i in range(10)])
+    assert cutoff().cut(flat)[1].reason == "ceiling"
+    assert len(cutoff().cut(flat)[0]) == 8
+
+    # The gap after the first hit would leave one chunk; this module asks for at least three
+    limits = cutoff(module_limits={"nvidia_isaac": (3, 4)})
+    kept, decision = limits.cut(hits(0.9, 0.5, 0.48, 0.45, 0.44, module_type="nvidia_isaac"))
+    assert (len(kept), decision.reason, decision.module_type) == (3, "floor", "nvidia_isaac")
+    assert len(limits.cut(hits(0.9, 0.5, 0.48))[0]) == 1
+
+    assert cutoff().cut([])[0] == []
+    assert limits.stats()["decisions"] == {"floor": 1, "score_gap": 1}
+
+
+def test_retrieve_over_fetches_and_reports_the_cut():
+    requested = []
+
+    class FakeService(ChatbotService):
+        async def try_embed_query(self, query):
+            return [0.0]
+
+        async def vector_search(self, query_vector, limit, payload_filter=None):
+            requested.append(limit)
+            return hits(0.92, 0.55, 0.5)[:limit]
+
+    async def run():
+        service = FakeService(None, None, None)
+        service.bm25_store = BM25Store("/nonexistent")
+        service.adaptive_top_k = cutoff(candidates=12)
+
+        _, results = await service.retrieve("What is a node?")
+        assert [r.content_id for r in results] == ["c0"]
+        assert requested[-1] >= 12
+        assert service.retrieval_cutoff.reason == "score_gap"
+
+        service.adaptive_top_k = cutoff(enabled=False)
+        _, results = await service.retrieve("What is a node?")
+        assert len(results) == 3 and service.retrieval_cutoff is None
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_cuts_at_the_largest_score_gap()
+    test_drops_chunks_below_the_relative_score()
+    test_floor_ceiling_and_module_limits()
+    test_retrieve_over_fetches_and_reports_the_cut()
+    print("Adaptive top_k tests passed")
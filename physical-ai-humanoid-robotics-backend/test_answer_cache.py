@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test the semantic RAG answer cache"""
+
+import sys
+import os
+import tempfile
+import time
+from pathlib import Path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.models.chatbot import ChatbotConfig
+from src.services.answer_cache import AnswerCache, SelectedTextCache, normalize_query
+from src.services.index_generations import new_generation, publish_generation
+
+
+CHUNKS = ["chunk-a", "chunk-b"]
+
+
+def test_normalized_query_hits():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.95)
+    config = ChatbotConfig()
+    cache.put("What is a ROS 2 topic?", CHUNKS, config, "A named bus.", ["module-1"])
+
+    assert normalize_query("  what IS a ros 2   topic ") == "what is a ros 2 topic"
+    hit = cache.get("what is a ROS 2 topic", list(reversed(CHUNKS)), config)
+    assert hit is not None and hit.message == "A named bus."
+
+    # Different retrieval context or model settings never share answers
+    assert cache.get("What is a ROS 2 topic?", ["chunk-a"], config) is None
+    assert cache.get("What is a ROS 2 topic?", CHUNKS, ChatbotConfig(temperature=0.2)) is None
+
+
+def test_near_duplicate_queries_hit_by_embedding():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.95)
+    config = ChatbotConfig()
+    cache.put("What is a ROS 2 topic?", CHUNKS, config, "A named bus.", [], query_vector=[1.0, 0.0, 0.1])
+
+    assert cache.get("Explain ROS 2 topics", CHUNKS, config, query_vector=[0.98, 0.02, 0.1]).message == "A named bus."
+    assert cache.get("What is URDF?", CHUNKS, config, query_vector=[0.0, 1.0, 0.0]) is None
+    assert cache.stats()["near_duplicate_hits"] == 1
+
+
+def test_eviction_ttl_and_invalidation():
+    config = ChatbotConfig()
+    cache = AnswerCache(max_entries=1, ttl_seconds=60, similarity_threshold=0.95)
+    cache.put("first", CHUNKS, config, "1", [])
+    cache.put("second", CHUNKS, config, "2", [])
+    assert cache.get("first", CHUNKS, config) is None
+    assert cache.get("second", CHUNKS, config).message == "2"
+
+    cache.invalidate()
+    assert cache.get("second", CHUNKS, config) is None
+
+    cache = AnswerCache(max_entries=10, ttl_seconds=0.01, similarity_threshold=0.95)
+    cache.put("first", CHUNKS, config, "1", [])
+    time.sleep(0.02)
+    assert cache.get("first", CHUNKS, config) is None
+
+
+def test_publishing_a_new_index_generation_empties_the_cache():
+    config = ChatbotConfig()
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        publish_generation(root, new_generation(root))
+        cache = AnswerCache(max_entries=10, ttl_seconds=60, similarity_threshold=0.95, index_dir=tmp)
+        cache.put("What is a ROS 2 topic?", CHUNKS, config, "A named bus.", [])
+        assert cache.get("What is a ROS 2 topic?", CHUNKS, config).message == "A named bus."
+
+        # A re-ingest in another process publishes the next generation
+        publish_generation(root, new_generation(root))
+        assert cache.get("What is a ROS 2 topic?", CHUNKS, config) is None
+        assert cache.stats()["index_generation_changes"] == 1
+
+
+def test_selected_text_cache_keys_on_passage_and_question():
+    cache = SelectedTextCache(max_entries=2, ttl_seconds=60)
+    config = ChatbotConfig()
+    passage = "A node is a process\nthat performs computation."
+    cache.put("What is a node?", passage, config, "A process.")
+
+    # Same highlight with different line breaks, same question pasted differently
+    assert cache.get("  what is a NODE ", "A node is a process that performs computation. ", config) == "A process."
+    assert cache.get("What is a topic?", passage, config) is None
+    assert cache.get("What is a node?", "A topic is a bus.", config) is None
+    assert cache.get("What is a node?", passage, ChatbotConfig(model_name="gpt-3.5-turbo")) is None
+    # Only hashes are kept, never the passage itself
+    assert all(passage not in part for part in SelectedTextCache.key("q", passage, config)[:2])
+
+    cache.put("second", passage, config, "2")
+    cache.put("third", passage, config, "3")
+    assert cache.get("What is a node?", passage, config) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["evictions"] == 1 and stats["entries"] == 2
+
+
+if __name__ == "__main__":
+    test_normalized_query_hits()
+    test_near_duplicate_queries_hit_by_embedding()
+    test_eviction_ttl_and_invalidation()
+    test_publishing_a_new_index_generation_empties_the_cache()
+    test_selected_text_cache_keys_on_passage_and_question()
+    print("Answer cache tests passed")
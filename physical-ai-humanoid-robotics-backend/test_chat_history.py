@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Test keyset pagination and streaming export of chat history"""
+
+import asyncio
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.database.database import Base
+from src.database.models import ChatMessage, ChatSession
+from src.services.chatbot_service import ChatbotService
+from src.utils.security import settings
+
+
+async def seeded_db(tmp, message_count):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    db = Session()
+    start = datetime(2025, 1, 1)
+    db.add_all([
+        ChatSession(id="long", user_id="user-1", title="t", created_at=start, updated_at=start),
+        ChatSession(id="other", user_id="user-1", title="t", created_at=start, updated_at=start),
+    ])
+    db.add_all([
+        # Pairs share a timestamp so the id tie-break is exercised
+        ChatMessage(id=f"m{i:04d}", chat_session_id="long", role="user", content=f"message {i}",
+                    created_at=start + timedelta(seconds=i // 2))
+        for i in range(message_count)
+    ])
+    db.add(ChatMessage(id="x", chat_session_id="other", role="user", content="elsewhere", created_at=start))
+    await db.commit()
+    return engine, db
+
+
+def test_history_pages_walk_back_without_gaps():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, db = await seeded_db(tmp, 95)
+            service = ChatbotService(db, None, None)
+
+            page = await service.get_chat_history_page("long", limit=20)
+            assert [m.id for m in page.messages] == [f"m{i:04d}" for i in range(75, 95)]
+            assert page.has_more
+
+            seen = [m.id for m in page.messages]
+            while page.has_more:
+                page = await service.get_chat_history_page("long", limit=20, before=page.next_cursor)
+                seen = [m.id for m in page.messages] + seen
+            assert seen == [f"m{i:04d}" for i in range(95)]
+            assert page.next_cursor is None
+
+            assert [m.id for m in await service.get_chat_history("long", limit=3)] == ["m0092", "m0093", "m0094"]
+
+            try:
+                await service.get_chat_history_page("long", before="not-a-cursor")
+                assert False, "expected ValueError"
+            except ValueError:
+                pass
+
+            await db.close()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_export_streams_every_message_in_batches():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, db = await seeded_db(tmp, 23)
+            service = ChatbotService(db, None, None)
+
+            batch_size = settings.CHAT_EXPORT_BATCH_SIZE
+            settings.CHAT_EXPORT_BATCH_SIZE = 5
+            try:
+                exported = [m.id async for m in service.export_session_messages("long")]
+            finally:
+                settings.CHAT_EXPORT_BATCH_SIZE = batch_size
+            assert exported == [f"m{i:04d}" for i in range(23)]
+            # Exported rows are not kept in the session's identity map
+            assert len(db.identity_map) == 0
+
+            await db.close()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_page_query_uses_composite_index():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, db = await seeded_db(tmp, 4)
+            async with engine.connect() as conn:
+                plan = (await conn.execute(text(
+                    "EXPLAIN QUERY PLAN SELECT * FROM chat_messages WHERE chat_session_id = 'long' "
+                    "AND (created_at < '2025-01-02' OR (created_at = '2025-01-02' AND id < 'm0002')) "
+                    "ORDER BY created_at DESC, id DESC LIMIT 11"
+                ))).fetchall()
+            assert any("ix_chat_messages_session_created_at_id" in row[-1] for row in plan), plan
+            # Ties on created_at are ordered by the index too, not by a sort after it
+            assert not any("TEMP B-TREE" in row[-1] for row in plan), plan
+
+            await db.close()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_history_pages_walk_back_without_gaps()
+    test_export_streams_every_message_in_batches()
+    test_page_query_uses_composite_index()
+    print("Chat history tests passed")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test the NDJSON streaming query endpoint"""
+
+import asyncio
+import json
+import sys
+import os
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from fastapi.testclient import TestClient
+
+from src.models.chatbot import RetrievalResult
+from src.services.answer_cache import AnswerCache
+from src.services.chatbot_service import ERROR_RESPONSE, ChatbotService
+from src.services.conversation_memory import ConversationState
+from src.services.single_flight import SingleFlight
+
+
+class StreamingCompletions:
+    def __init__(self, parts, fail_after=None):
+        self.parts = parts
+        self.fail_after = fail_after
+
+    async def create(self, stream=False, **kwargs):
+        async def chunks():
+            for i, part in enumerate(self.parts):
+                if i == self.fail_after:
+                    raise RuntimeError("upstream connection reset")
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=part))])
+        return chunks()
+
+
+class OfflineChatbotService(ChatbotService):
+    async def retrieve(self, query, scope=None):
+        return None, [RetrievalResult(content_id="chunk-1", content="Topics carry messages.", similarity_score=0.9, source="m1")]
+
+    async def load_conversation(self, session_id):
+        return {}, ConversationState()
+
+    async def remember_turn(self, session_id, query, response_text, user_id, user_created_at):
+        self.saved.append((query, response_text))
+
+
+def stream_events(completions):
+    from src.main import app
+    from src.routes.chatbot import get_chatbot_service
+
+    service = OfflineChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+    service.single_flight, service.answer_cache, service.saved = SingleFlight(), AnswerCache(), []
+    app.dependency_overrides[get_chatbot_service] = lambda: service
+    try:
+        response = TestClient(app).post("/api/chatbot/sessions/s1/query/stream", params={"query": "What is a topic?"})
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()], service.saved
+
+
+def test_stream_sends_sources_deltas_then_done():
+    events, saved = stream_events(StreamingCompletions(["A topic ", "is a ", "named bus."]))
+
+    assert [e["type"] for e in events] == ["sources", "delta", "delta", "delta", "done"]
+    assert events[0]["sources"] == ["m1"]
+    assert "".join(e["content"] for e in events if e["type"] == "delta") == "A topic is a named bus."
+    assert events[-1]["message"] == "A topic is a named bus." and events[-1]["chunks_used"] == 1
+    assert saved == [("What is a topic?", "A topic is a named bus.")]
+
+
+def test_stream_failure_ends_with_an_error_event():
+    events, saved = stream_events(StreamingCompletions(["A topic ", "is a ", "named bus."], fail_after=2))
+
+    assert [e["type"] for e in events] == ["sources", "delta", "delta", "error"]
+    assert events[-1]["message"] == ERROR_RESPONSE
+    # The half-written answer is not saved, and the turn is saved once
+    assert saved == [("What is a topic?", ERROR_RESPONSE)]
+
+
+def test_disconnect_mid_stream_still_saves_the_turn():
+    async def run():
+        completions = StreamingCompletions(["A topic ", "is a ", "named bus."])
+        service = OfflineChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+        service.single_flight, service.answer_cache, service.saved = SingleFlight(), AnswerCache(), []
+
+        events = service.stream_query_with_rag("What is a topic?", "s1", "u1")
+        assert (await events.__anext__())["type"] == "sources"
+        assert (await events.__anext__())["type"] == "delta"
+        # What Starlette does when the client goes away
+        await events.aclose()
+
+        assert service.saved == [("What is a topic?", ERROR_RESPONSE)]
+        assert service.stage_timer.finished
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_stream_sends_sources_deltas_then_done()
+    test_stream_failure_ends_with_an_error_event()
+    test_disconnect_mid_stream_still_saves_the_turn()
+    print("Chat stream tests passed")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Test token-budgeted context packing for the RAG prompt"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.models.chatbot import ChatbotConfig, RetrievalResult
+from src.services.context_packer import ContextPacker, context_window
+from src.utils.tokens import count_tokens
+
+
+def chunk(content_id, content, score):
+    return RetrievalResult(content_id=content_id, content=content, similarity_score=score, source=content_id)
+
+
+TOPICS = "Topics enable asynchronous communication between nodes using a publish and subscribe pattern."
+SERVICES = "Services provide synchronous request and response communication between a client and a server."
+ACTIONS = "Actions handle long running tasks. They send feedback while running. They report a final result when done."
+
+
+def test_budget_respects_context_window_and_cap():
+    config = ChatbotConfig(model_name="gpt-4", max_tokens=1000, max_context_tokens=100000)
+    assert context_window("gpt-4-0613") == 8192
+    assert context_window("gpt-4-32k-0613") == 32768
+    assert ContextPacker(config).budget("hi") < 8192 - 1000
+
+    capped = ChatbotConfig(model_name="gpt-4", max_context_tokens=500)
+    assert ContextPacker(capped).budget("hi") == 500
+
+
+def test_duplicates_and_overlaps_are_dropped():
+    packer = ContextPacker(ChatbotConfig())
+    packed = packer.pack("q", [
+        chunk("a", TOPICS, 0.9),
+        chunk("b", TOPICS + " Each topic has a message type.", 0.8),  # overlapping window
+        chunk("c", SERVICES, 0.7),
+    ], budget=1000)
+
+    assert [c.content_id for c in packed.chunks] == ["a", "c"]
+    assert packed.dropped_duplicates == 1
+    assert packed.token_count == count_tokens(packed.text)
+
+
+def test_overflowing_chunk_is_cut_at_a_sentence_boundary():
+    packer = ContextPacker(ChatbotConfig())
+    budget = count_tokens(TOPICS) + 1 + count_tokens("Actions handle long running tasks. They send feedback while running.")
+    packed = packer.pack("q", [chunk("a", TOPICS, 0.9), chunk("b", ACTIONS, 0.8)], budget=budget + 45)
+
+    assert packed.token_count <= packed.budget
+    assert [c.content_id for c in packed.chunks] == ["a", "b"]
+
+    tight = packer.pack("q", [chunk("a", TOPICS * 3, 0.9), chunk("b", ACTIONS * 3, 0.8)],
+                        budget=count_tokens(TOPICS * 3) + 60)
+    assert tight.truncated
+    assert tight.chunks[-1].content.endswith(".")
+    assert tight.token_count <= tight.budget
+
+
+if __name__ == "__main__":
+    test_budget_respects_context_window_and_cap()
+    test_duplicates_and_overlaps_are_dropped()
+    test_overflowing_chunk_is_cut_at_a_sentence_boundary()
+    print("Context packer tests passed")
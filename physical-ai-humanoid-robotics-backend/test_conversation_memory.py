@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Test rolling conversation summaries kept in ChatSession.context"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import types
+from datetime import datetime
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.database.database import Base
+from src.database.models import ChatSession
+from src.models.chatbot import RetrievalResult
+from src.services.answer_cache import AnswerCache
+from src.services.chatbot_service import ChatbotService
+from src.services.conversation_memory import ConversationMemory, ConversationState
+from src.utils.tokens import count_tokens
+
+
+class RecordingCompletions:
+    """Answers RAG prompts at length, and summary prompts with a short summary"""
+
+    def __init__(self):
+        self.rag_prompts = []
+        self.summaries = 0
+
+    async def create(self, model, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        if prompt.startswith("You maintain a running summary"):
+            self.summaries += 1
+            content = f"Summary v{self.summaries}: the student is working through ROS 2 basics."
+        else:
+            self.rag_prompts.append(prompt)
+            content = "Here is a detailed answer about ROS 2. " * 20
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+
+class OfflineChatbotService(ChatbotService):
+    async def retrieve(self, query, scope=None):
+        return None, [RetrievalResult(content_id="chunk-1", content="Topics carry messages.", similarity_score=0.9, source="m1")]
+
+
+def test_state_round_trips_through_context():
+    state = ConversationState()
+    state.add_turn("What is a node?", "A process.")
+    state.add_turn("And a topic?", "A named bus.")
+    context = state.to_context({"page": "module-1"})
+
+    assert context["page"] == "module-1"
+    restored = ConversationState.from_context(context)
+    assert [t["n"] for t in restored.turns] == [1, 2]
+    assert restored.pending_turns(1) == restored.turns[:1]
+    assert "User: And a topic?" in restored.prompt_text()
+    assert ConversationState.from_context(None).is_empty
+
+
+def test_prompt_size_stays_flat_over_a_long_session():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+            completions = RecordingCompletions()
+            openai_client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+            memory = ConversationMemory(Session, recent_turns=2, trigger_tokens=200)
+
+            async with Session() as db:
+                now = datetime.utcnow()
+                db.add(ChatSession(id="s", user_id="u", title="t", context={"page": "intro"}, created_at=now, updated_at=now))
+                await db.commit()
+
+                service = OfflineChatbotService(db, None, openai_client)
+                service.answer_cache = AnswerCache()
+                service.conversation_memory = memory
+
+                for i in range(30):
+                    await service.process_query_with_rag(f"Question {i} about ROS 2 topics?", "s", "u")
+                    # Let a scheduled refresh finish before the next turn
+                    for task in list(memory._refreshing.values()):
+                        await task
+
+                context = (await db.execute(select(ChatSession.context).where(ChatSession.id == "s"))).scalar()
+
+            state = ConversationState.from_context(context)
+            assert context["page"] == "intro"
+            assert memory.refreshes > 0 and memory.refresh_errors == 0
+            assert state.summary.startswith(f"Summary v{completions.summaries}")
+            assert state.turns[-1]["n"] == 30 and state.summarized_through == state.turns[0]["n"] - 1
+
+            # The first prompt has no history; later ones carry a bounded amount of it
+            assert "Conversation so far" not in completions.rag_prompts[0]
+            assert "Question 28" in completions.rag_prompts[-1] and "Question 3 " not in completions.rag_prompts[-1]
+            sizes = [count_tokens(p) for p in completions.rag_prompts]
+            assert max(sizes[10:]) <= max(sizes[:10]) * 1.2
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_refresh_keeps_turns_added_while_summarising():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+            state = ConversationState()
+            for i in range(4):
+                state.add_turn(f"q{i}", f"a{i}")
+            async with Session() as db:
+                now = datetime.utcnow()
+                db.add(ChatSession(id="s", user_id="u", title="t", context=state.to_context({}), created_at=now, updated_at=now))
+                await db.commit()
+
+            memory = ConversationMemory(Session, recent_turns=1, trigger_tokens=1)
+
+            async def summarize(openai_client, summary, turns):
+                # A turn lands while the LLM is busy
+                async with Session() as db:
+                    later = ConversationState.from_context(
+                        (await db.execute(select(ChatSession.context).where(ChatSession.id == "s"))).scalar()
+                    )
+                    later.add_turn("q4", "a4")
+                    session = (await db.execute(select(ChatSession).where(ChatSession.id == "s"))).scalars().first()
+                    session.context = later.to_context(session.context)
+                    await db.commit()
+                return "summary of " + ",".join(t["user"] for t in turns)
+
+            memory.summarize = summarize
+            assert await memory.refresh("s", None)
+
+            async with Session() as db:
+                final = ConversationState.from_context(
+                    (await db.execute(select(ChatSession.context).where(ChatSession.id == "s"))).scalar()
+                )
+            assert final.summary == "summary of q0,q1,q2"
+            assert final.summarized_through == 3
+            assert [t["user"] for t in final.turns] == ["q3", "q4"]
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_turn_saved_after_a_refresh_keeps_the_new_summary():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+            state = ConversationState()
+            for i in range(4):
+                state.add_turn(f"q{i}", f"a{i}")
+            async with Session() as db:
+                now = datetime.utcnow()
+                db.add(ChatSession(id="s", user_id="u", title="t", context=state.to_context({"page": "intro"}),
+                                   created_at=now, updated_at=now))
+                await db.commit()
+
+            memory = ConversationMemory(Session, recent_turns=1, trigger_tokens=10 ** 6)
+
+            async def summarize(openai_client, summary, turns):
+                return "summary of " + ",".join(t["user"] for t in turns)
+
+            memory.summarize = summarize
+
+            class RefreshDuringAnswer(RecordingCompletions):
+                async def create(self, model, messages, **kwargs):
+                    # The background refresh commits after load_conversation, while the answer is generated
+                    assert await memory.refresh("s", None)
+                    return await super().create(model, messages, **kwargs)
+
+            openai_client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=RefreshDuringAnswer()))
+            async with Session() as db:
+                service = OfflineChatbotService(db, None, openai_client)
+                service.answer_cache = AnswerCache()
+                service.conversation_memory = memory
+                await service.process_query_with_rag("q4", "s", "u")
+
+            async with Session() as db:
+                context = (await db.execute(select(ChatSession.context).where(ChatSession.id == "s"))).scalar()
+            final = ConversationState.from_context(context)
+            assert context["page"] == "intro"
+            assert final.summary == "summary of q0,q1,q2" and final.summarized_through == 3
+            assert [(t["n"], t["user"]) for t in final.turns] == [(4, "q3"), (5, "q4")]
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_state_round_trips_through_context()
+    test_prompt_size_stays_flat_over_a_long_session()
+    test_refresh_keeps_turns_added_while_summarising()
+    test_turn_saved_after_a_refresh_keeps_the_new_summary()
+    print("Conversation memory tests passed")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Test the embedded NumPy vector index and its use as the retriever backend"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import types
+from pathlib import Path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import numpy as np
+
+from src.services.ingestion_service import TextbookIngestionService
+from src.services import vector_index
+from src.services.retrievers import EmbeddedRetriever, QdrantRetriever, VectorRetriever
+from src.services.vector_index import EmbeddedVectorIndex, EmbeddedVectorStore
+from src.utils.security import settings
+from test_ingestion import CHAPTER, FakeEmbeddings
+
+
+def test_index_round_trip_matches_brute_force():
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(300, 32)).astype(np.float32)
+    payloads = [{"content_id": str(i), "module": f"module-{i % 4 + 1}"} for i in range(300)]
+    query = vectors[42] + rng.normal(scale=0.3, size=32).astype(np.float32)
+
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = list(np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5])
+
+    for dtype in ("float32", "int8"):
+        with tempfile.TemporaryDirectory() as tmp:
+            EmbeddedVectorIndex.build([p["content_id"] for p in payloads], vectors, payloads, dtype=dtype).save(Path(tmp))
+            index = EmbeddedVectorIndex.load(Path(tmp))
+
+            assert isinstance(index.matrix, np.memmap) and index.dtype == dtype
+            hits = index.search(query, 5)
+            assert [row for row, _ in hits] == expected
+            assert hits[0][0] == 42 and hits[0][1] > hits[1][1]
+
+            scoped = index.search(query, 5, {"module": ["module-2", "module-3"]})
+            assert len(scoped) == 5
+            assert all(index.payloads[row]["module"] in ("module-2", "module-3") for row, _ in scoped)
+            assert index.search(query, 5, {"module": "module-9"}) == []
+
+            # Scoring in blocks that do not divide the row count gives the same answer
+            block_rows = vector_index.SEARCH_BLOCK_ROWS
+            vector_index.SEARCH_BLOCK_ROWS = 7
+            try:
+                for blocked, whole in ((index.search(query, 5), hits),
+                                       (index.search(query, 5, {"module": ["module-2", "module-3"]}), scoped)):
+                    assert [row for row, _ in blocked] == [row for row, _ in whole]
+                    assert np.allclose([score for _, score in blocked], [score for _, score in whole], atol=1e-5)
+            finally:
+                vector_index.SEARCH_BLOCK_ROWS = block_rows
+
+
+def test_resave_leaves_loaded_index_searchable():
+    rng = np.random.default_rng(11)
+    vectors = rng.normal(size=(2000, 64)).astype(np.float32)
+    ids = [str(i) for i in range(2000)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddedVectorStore(tmp)
+        EmbeddedVectorIndex.build(ids, vectors, [{"content_id": i} for i in ids]).save(store.directory)
+        loaded = store.get()
+        before = loaded.search(vectors[1999], 3)
+
+        # A smaller rebuild written over the files a live reader has mmap'd
+        EmbeddedVectorIndex.build(ids[:10], vectors[:10], [{"content_id": i} for i in ids[:10]]).save(store.directory)
+        assert loaded.search(vectors[1999], 3) == before
+        assert before[0][0] == 1999
+
+        os.utime(store.directory / "payloads.json", (0, 0))
+        assert len(store.get()) == 10
+
+
+def test_retriever_base_is_abstract():
+    try:
+        VectorRetriever()
+        assert False, "VectorRetriever must not be instantiable"
+    except TypeError:
+        pass
+
+
+def test_qdrant_filter_translation():
+    query_filter = QdrantRetriever.build_filter({"module": "module-1", "chapter": ["a", "b"]})
+    assert [c.key for c in query_filter.must] == ["module", "chapter"]
+    assert query_filter.must[1].match.any == ["a", "b"]
+    assert QdrantRetriever.build_filter(None) is None
+
+
+def test_ingestion_writes_embedded_index():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            docs = Path(tmp) / "docs"
+            (docs / "module-1-nervous-system").mkdir(parents=True)
+            chapter = docs / "module-1-nervous-system" / "chapter-1.md"
+            chapter.write_text(CHAPTER, encoding="utf-8")
+
+            embeddings = FakeEmbeddings()
+            openai_client = types.SimpleNamespace(embeddings=embeddings)
+            index_dir = Path(tmp) / "index"
+
+            def service():
+                return TextbookIngestionService(None, openai_client, docs_path=str(docs), index_dir=str(index_dir))
+
+            first = await service().run()
+            assert first.full_rebuild and first.chunks_embedded == 2
+            store = EmbeddedVectorStore(str(index_dir))
+            live, live_dir = store.get(), store.directory
+            live_ids = list(live.ids)
+
+            # Editing one section re-embeds only that section; the other row is carried over
+            chapter.write_text(CHAPTER.replace("asynchronous communication", "async pub/sub messaging"), encoding="utf-8")
+            second = await service().run()
+            assert not second.full_rebuild
+            assert second.chunks_embedded == 1 and embeddings.embedded == 3
+
+            # The rebuild went to a new generation; the index a reader already holds is untouched
+            assert store.directory != live_dir and store.get() is not live
+            assert live.ids == live_ids and len(live.search(np.asarray(live.matrix[0], dtype=np.float32), 2)) == 2
+            assert len(list((index_dir / "generations").iterdir())) == 2
+            await service().run(force=True)
+            assert len(list((index_dir / "generations").iterdir())) == 2
+
+            retriever = EmbeddedRetriever(store)
+            topics = service().chunker.chunk_document("module-1-nervous-system/chapter-1.md", chapter.read_text(encoding="utf-8"))[1]
+            topics_vector = (await embeddings.create(None, [topics.embedding_text])).data[0].embedding
+            results = await retriever.search(topics_vector, 2)
+            assert len(results) == 2
+            assert "async pub/sub messaging" in results[0].content
+            assert results[0].similarity_score > 0.99
+
+            scoped = await retriever.search(topics_vector, 2, {"heading": "Nodes"})
+            assert [r.source for r in scoped] == ["module-1-nervous-system/chapter-1.md#nodes"]
+
+    backend = settings.RETRIEVER_BACKEND
+    settings.RETRIEVER_BACKEND = "embedded"
+    try:
+        asyncio.run(run())
+    finally:
+        settings.RETRIEVER_BACKEND = backend
+
+
+if __name__ == "__main__":
+    test_index_round_trip_matches_brute_force()
+    test_resave_leaves_loaded_index_searchable()
+    test_retriever_base_is_abstract()
+    test_qdrant_filter_translation()
+    test_ingestion_writes_embedded_index()
+    print("Embedded retriever tests passed")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Test that concurrent query embeddings are coalesced into batched requests"""
+
+import asyncio
+import sys
+import os
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.services.embedding_batcher import EmbeddingBatcher
+
+
+class FakeEmbeddings:
+    def __init__(self, fail=False):
+        self.requests = []
+        self.fail = fail
+
+    async def create(self, model, input):
+        self.requests.append(list(input))
+        await asyncio.sleep(0.001)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        data = [types.SimpleNamespace(index=i, embedding=[float(len(text)), float(i)]) for i, text in enumerate(input)]
+        # Out of order on purpose: the batcher must use item.index
+        return types.SimpleNamespace(data=list(reversed(data)))
+
+
+def test_concurrent_queries_share_one_request():
+    async def run():
+        embeddings = FakeEmbeddings()
+        batcher = EmbeddingBatcher(types.SimpleNamespace(embeddings=embeddings), max_batch_size=100, max_wait_ms=5, cache_size=10)
+
+        queries = ["a", "bb", "ccc", "bb"]
+        vectors = await asyncio.gather(*(batcher.embed(q) for q in queries))
+
+        assert len(embeddings.requests) == 1
+        assert embeddings.requests[0] == ["a", "bb", "ccc"]  # duplicate coalesced
+        assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 2.0]
+
+        # Repeats are served from the vector cache
+        assert await batcher.embed("ccc") == vectors[2]
+        assert len(embeddings.requests) == 1
+        assert batcher.stats()["cache"]["hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_batch_size_triggers_flush_and_errors_fan_out():
+    async def run():
+        embeddings = FakeEmbeddings()
+        batcher = EmbeddingBatcher(types.SimpleNamespace(embeddings=embeddings), max_batch_size=2, max_wait_ms=1000, cache_size=10)
+        await asyncio.wait_for(asyncio.gather(batcher.embed("x"), batcher.embed("y")), timeout=0.5)
+        assert embeddings.requests == [["x", "y"]]
+
+        failing = EmbeddingBatcher(types.SimpleNamespace(embeddings=FakeEmbeddings(fail=True)), max_batch_size=10, max_wait_ms=1, cache_size=10)
+        results = await asyncio.gather(failing.embed("x"), failing.embed("y"), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_concurrent_queries_share_one_request()
+    test_batch_size_triggers_flush_and_errors_fan_out()
+    print("Embedding batcher tests passed")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Test BM25 lexical retrieval and its fusion with vector search"""
+
+import asyncio
+import sys
+import os
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import numpy as np
+
+from src.models.chatbot import RetrievalResult
+from src.services.bm25_index import BM25Index, BM25Store, reciprocal_rank_fusion
+from src.services.chatbot_service import ChatbotService
+
+
+DOCS = [
+    {"content_id": "c1", "source": "m1#nodes", "content": "ROS 2 nodes communicate over topics using rclpy publishers."},
+    {"content_id": "c2", "source": "m2#urdf", "content": "URDF describes the links and joints of a humanoid robot."},
+    {"content_id": "c3", "source": "m3#nav2", "content": "Nav2 plans paths; VSLAM provides the map and the robot pose."},
+    {"content_id": "c4", "source": "m3#isaac", "content": "Isaac Sim generates synthetic data for perception models."},
+]
+
+
+def test_bm25_round_trip_with_mmap():
+    with tempfile.TemporaryDirectory() as tmp:
+        BM25Index.build(DOCS).save(Path(tmp) / "bm25")
+        index = BM25Store(tmp).get()
+
+        assert isinstance(index.doc_ids, np.memmap)
+        assert [index.docs[i]["content_id"] for i, _ in index.search("rclpy", 5)] == ["c1"]
+        assert [index.docs[i]["content_id"] for i, _ in index.search("How does Nav2 use VSLAM?", 5)] == ["c3"]
+        assert index.search("completely unrelated words", 5) == []
+
+        mask = np.array([True, True, False, True])
+        assert index.search("Nav2", 5, doc_filter=mask) == []
+
+
+def test_bm25_resave_leaves_loaded_index_searchable():
+    many = [{"content_id": f"d{i}", "source": f"m#{i}", "content": f"joint{i} limits and torque {i}"} for i in range(3000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BM25Store(tmp)
+        BM25Index.build(many).save(store.directory)
+        loaded = store.get()
+        before = loaded.search("joint2999 torque", 3)
+
+        # A smaller rebuild written over the postings a live reader has mmap'd
+        BM25Index.build(DOCS).save(store.directory)
+        assert loaded.search("joint2999 torque", 3) == before
+        assert loaded.docs[before[0][0]]["content_id"] == "d2999"
+        assert not list(store.directory.glob("*.tmp"))
+
+        os.utime(store.directory / "docs.json", (0, 0))
+        assert len(store.get().docs) == len(DOCS)
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [item for item, _ in fused] == ["a", "c", "b"]
+
+
+def test_service_fuses_vector_and_lexical_hits():
+    class HybridService(ChatbotService):
+        async def vector_search(self, query_vector, limit, payload_filter=None):
+            return [
+                RetrievalResult(content_id="c4", content=DOCS[3]["content"], similarity_score=0.82, source="m3#isaac"),
+                RetrievalResult(content_id="c3", content=DOCS[2]["content"], similarity_score=0.80, source="m3#nav2"),
+            ]
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            BM25Index.build(DOCS).save(Path(tmp) / "bm25")
+            service = HybridService(None, None, None)
+            service.bm25_store = BM25Store(tmp)
+
+            results = await service.get_relevant_content("Nav2 with VSLAM", top_k=2, query_vector=[0.0])
+            assert [r.content_id for r in results] == ["c3", "c4"]
+            assert results[0].lexical_score > 0 and results[0].similarity_score == 0.80
+            assert results[0].fusion_score > results[1].fusion_score
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_bm25_round_trip_with_mmap()
+    test_bm25_resave_leaves_loaded_index_searchable()
+    test_reciprocal_rank_fusion()
+    test_service_fuses_vector_and_lexical_hits()
+    print("Hybrid retrieval tests passed")
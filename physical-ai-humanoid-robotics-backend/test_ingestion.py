@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Test the incremental textbook ingestion pipeline against an in-memory Qdrant"""
+
+import asyncio
+import hashlib
+import sys
+import os
+import tempfile
+import types
+from pathlib import Path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from qdrant_client import QdrantClient
+
+from src.services.ingestion_service import TextbookIngestionService, MarkdownChunker
+from src.utils.security import settings
+
+
+class FakeEmbeddings:
+    """Deterministic embeddings that count how many texts were embedded"""
+
+    def __init__(self):
+        self.embedded = 0
+
+    async def create(self, model, input):
+        self.embedded += len(input)
+        data = []
+        for index, text in enumerate(input):
+            seed = hashlib.sha256(text.encode("utf-8")).digest()
+            vector = [seed[i % len(seed)] / 255.0 for i in range(settings.EMBEDDING_DIMENSIONS)]
+            data.append(types.SimpleNamespace(index=index, embedding=vector))
+        return types.SimpleNamespace(data=data)
+
+
+CHAPTER = """---
+sidebar_position: 1
+---
+
+# ROS 2 Nodes
+
+## Nodes
+
+Nodes are the fundamental building blocks of a ROS 2 system.
+
+## Topics
+
+Topics enable asynchronous communication between nodes.
+
+```python
+# a comment, not a heading
+import rclpy
+```
+"""
+
+
+def test_chunker_follows_headings_and_keeps_code_whole():
+    chunks = MarkdownChunker(max_tokens=200).chunk_document("module-1-nervous-system/chapter-1.md", CHAPTER)
+
+    assert [chunk.heading for chunk in chunks] == ["Nodes", "Topics"]
+    assert chunks[0].content.startswith("# ROS 2 Nodes")
+    assert "```python\n# a comment, not a heading\nimport rclpy\n```" in chunks[1].content
+    assert chunks[1].module_type == "ros_2"
+    assert chunks[1].source == "module-1-nervous-system/chapter-1.md#topics"
+
+
+def test_incremental_ingestion():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            docs = Path(tmp) / "docs"
+            (docs / "module-1-nervous-system").mkdir(parents=True)
+            chapter = docs / "module-1-nervous-system" / "chapter-1.md"
+            chapter.write_text(CHAPTER, encoding="utf-8")
+            (docs / "module-1-nervous-system" / "chapter-2.md").write_text("# Services\n\nRequest and response.\n", encoding="utf-8")
+
+            qdrant = QdrantClient(":memory:")
+            embeddings = FakeEmbeddings()
+            openai_client = types.SimpleNamespace(embeddings=embeddings)
+
+            def service():
+                return TextbookIngestionService(qdrant, openai_client, docs_path=str(docs), index_dir=str(Path(tmp) / "index"))
+
+            first = await service().run()
+            assert first.full_rebuild
+            assert first.files_changed == 2
+            assert embeddings.embedded == first.chunks_total == 3
+
+            # Nothing changed: nothing is embedded
+            second = await service().run()
+            assert not second.full_rebuild
+            assert second.files_changed == 0 and second.chunks_embedded == 0
+
+            # Editing one section only re-embeds that section
+            chapter.write_text(CHAPTER.replace("asynchronous communication", "async pub/sub messaging"), encoding="utf-8")
+            third = await service().run()
+            assert third.changed_paths == ["module-1-nervous-system/chapter-1.md"]
+            assert third.chunks_embedded == 1 and third.chunks_deleted == 1
+            assert qdrant.count(settings.QDRANT_COLLECTION).count == 3
+
+            # Removing a file deletes its chunks
+            (docs / "module-1-nervous-system" / "chapter-2.md").unlink()
+            fourth = await service().run()
+            assert fourth.files_removed == 1 and fourth.chunks_deleted == 1
+            assert qdrant.count(settings.QDRANT_COLLECTION).count == 2
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_chunker_follows_headings_and_keeps_code_whole()
+    test_incremental_ingestion()
+    print("Ingestion tests passed")
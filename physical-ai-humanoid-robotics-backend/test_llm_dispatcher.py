@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""Test the adaptive LLM concurrency limit and its priority queue"""
+
+import asyncio
+import sys
+import os
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import httpx
+import openai
+from fastapi.testclient import TestClient
+
+from src.models.chatbot import RetrievalResult
+from src.services.chatbot_service import ChatbotService
+from src.services.conversation_memory import ConversationState
+from src.services.llm_dispatcher import (
+    PRIORITY_ANONYMOUS, PRIORITY_AUTHENTICATED, LLMDispatcher, LLMOverloaded, priority_for
+)
+from src.services.single_flight import SingleFlight
+
+
+def rate_limit_error():
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_priority_for_user_ids():
+    assert priority_for("3f2c-user") == PRIORITY_AUTHENTICATED
+    assert priority_for("anonymous_1234") == PRIORITY_ANONYMOUS
+    assert priority_for(None) == PRIORITY_ANONYMOUS
+
+
+def test_limit_caps_calls_in_flight():
+    async def run():
+        dispatcher = LLMDispatcher(initial_limit=3, max_limit=3, queue_timeout=5)
+        running, peak = 0, 0
+
+        async def call():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(dispatcher.call(call) for _ in range(12)))
+        assert peak == 3
+        assert dispatcher.stats()["admitted"] == 12 and dispatcher.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_authenticated_users_are_served_before_anonymous():
+    async def run():
+        dispatcher = LLMDispatcher(initial_limit=1, max_limit=1, queue_timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        async def call(tag):
+            order.append(tag)
+
+        holder = asyncio.ensure_future(dispatcher.call(blocker))
+        await asyncio.sleep(0)
+        # Anonymous callers queue up first, then an authenticated one arrives
+        waiting = [asyncio.ensure_future(dispatcher.call(lambda i=i: call(f"anon{i}"), PRIORITY_ANONYMOUS)) for i in range(3)]
+        await asyncio.sleep(0)
+        waiting.append(asyncio.ensure_future(dispatcher.call(lambda: call("user"), PRIORITY_AUTHENTICATED)))
+        await asyncio.sleep(0)
+        assert dispatcher.queued == 4
+
+        release.set()
+        await asyncio.gather(holder, *waiting)
+        assert order == ["user", "anon0", "anon1", "anon2"]
+
+    asyncio.run(run())
+
+
+def test_joining_a_flight_raises_its_priority():
+    async def run():
+        order = []
+
+        class RecordingCompletions:
+            async def create(self, messages, **kwargs):
+                order.append(messages[0]["content"])
+                return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="ok"))])
+
+        service = ChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(completions=RecordingCompletions())))
+        service.llm_dispatcher = LLMDispatcher(initial_limit=1, max_limit=1, queue_timeout=5)
+        service.single_flight = SingleFlight()
+        release = asyncio.Event()
+
+        def ask(question, priority):
+            return asyncio.ensure_future(service.complete([{"role": "user", "content": question}], priority=priority))
+
+        holder = asyncio.ensure_future(service.llm_dispatcher.call(release.wait))
+        await asyncio.sleep(0)
+        # Two anonymous questions queue up; then a signed-in user asks the second one
+        waiting = [ask("What is a node?", PRIORITY_ANONYMOUS)]
+        await asyncio.sleep(0)
+        waiting.append(ask("What is a topic?", PRIORITY_ANONYMOUS))
+        await asyncio.sleep(0)
+        waiting.append(ask("What is a topic?", PRIORITY_AUTHENTICATED))
+        await asyncio.sleep(0)
+        assert service.llm_dispatcher.queued == 2
+
+        release.set()
+        await asyncio.gather(holder, *waiting)
+        # The shared flight now waits on the user's behalf and goes first
+        assert order == ["What is a topic?", "What is a node?"]
+        assert service.llm_dispatcher.stats()["promoted"] == 1
+
+    asyncio.run(run())
+
+
+def test_rate_limits_cut_the_limit_and_fast_calls_grow_it():
+    async def run():
+        dispatcher = LLMDispatcher(initial_limit=8, min_limit=1, max_limit=16, backoff_factor=0.5)
+
+        async def throttled():
+            raise rate_limit_error()
+
+        for expected in (4, 2, 1, 1):
+            try:
+                await dispatcher.call(throttled)
+            except openai.RateLimitError:
+                pass
+            assert dispatcher.limit == expected
+        assert dispatcher.stats()["rate_limited"] == 4
+
+        async def fast():
+            return "ok"
+
+        # Additive increase: roughly one slot per limit's worth of fast calls
+        for _ in range(3):
+            await dispatcher.call(fast)
+        assert 2 <= dispatcher.limit < 3
+
+    asyncio.run(run())
+
+
+def test_slow_calls_shrink_the_limit():
+    async def run():
+        dispatcher = LLMDispatcher(initial_limit=10, latency_target=0.01)
+
+        async def slow():
+            await asyncio.sleep(0.03)
+
+        await dispatcher.call(slow)
+        assert dispatcher.limit < 10
+
+    asyncio.run(run())
+
+
+def test_full_queue_or_missed_deadline_is_rejected_at_once():
+    async def run():
+        dispatcher = LLMDispatcher(initial_limit=1, max_limit=1, queue_size=2, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        async def measured():
+            await asyncio.sleep(0.2)
+
+        # The deadline check needs a measured latency to estimate queue time
+        await dispatcher.call(measured)
+
+        tasks = [asyncio.ensure_future(dispatcher.call(blocker)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert dispatcher.in_flight == 1 and dispatcher.queued == 2
+
+        try:
+            dispatcher.check_admission(PRIORITY_AUTHENTICATED)
+            assert False, "a full queue must reject"
+        except LLMOverloaded as e:
+            assert e.reason == "LLM queue is full"
+            assert int(e.retry_after_header) >= 1
+
+        # With a short deadline a long queue is refused up front, not after waiting
+        dispatcher.queue_size, dispatcher.queue_timeout = 10, 0.3
+        try:
+            await dispatcher.acquire(PRIORITY_ANONYMOUS)
+            assert False, "a wait past the deadline must reject"
+        except LLMOverloaded as e:
+            assert e.retry_after > 0.3
+        assert dispatcher.stats()["rejected"] == 2
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+
+def test_queue_deadline_times_out_waiters():
+    async def run():
+        dispatcher = LLMDispatcher(initial_limit=1, max_limit=1, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        holder = asyncio.ensure_future(dispatcher.call(blocker))
+        await asyncio.sleep(0)
+        try:
+            await dispatcher.acquire(PRIORITY_AUTHENTICATED)
+            assert False, "the waiter must time out"
+        except LLMOverloaded:
+            pass
+        assert dispatcher.stats()["timed_out"] == 1 and dispatcher.queued == 0
+
+        release.set()
+        await holder
+        assert dispatcher.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_overloaded_query_returns_503_with_retry_after():
+    from src.main import app
+    from src.routes.chatbot import get_chatbot_service
+
+    class OfflineChatbotService(ChatbotService):
+        async def retrieve(self, query, scope=None):
+            return None, [RetrievalResult(content_id="chunk-1", content="Topics carry messages.", similarity_score=0.9, source="m1")]
+
+        async def load_conversation(self, session_id):
+            return {}, ConversationState()
+
+    # Every slot taken and the queue full
+    dispatcher = LLMDispatcher(initial_limit=1, max_limit=1, queue_size=0)
+    dispatcher.in_flight = 1
+    service = OfflineChatbotService(None, None, types.SimpleNamespace())
+    service.single_flight, service.llm_dispatcher = SingleFlight(), dispatcher
+
+    app.dependency_overrides[get_chatbot_service] = lambda: service
+    try:
+        client = TestClient(app)
+        for path in ("/api/chatbot/sessions/s1/query", "/api/chatbot/sessions/s1/query/stream"):
+            response = client.post(path, params={"query": "What is a topic?"})
+            assert response.status_code == 503, response.text
+            assert int(response.headers["Retry-After"]) >= 1
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_only_completions_skip_sdk_retries():
+    from src.routes.chatbot import get_chatbot_service
+    from src.utils.clients import ClientPool
+
+    async def run():
+        pool = ClientPool()
+        try:
+            # Embeddings and ingestion keep the SDK's retries; completions leave 429s to the dispatcher
+            assert pool.openai.max_retries == openai.DEFAULT_MAX_RETRIES > 0
+            assert pool.openai_completions.max_retries == 0
+            assert pool.openai_completions._client is pool.openai._client
+        finally:
+            await pool.shutdown()
+
+        service = await get_chatbot_service(db=None)
+        assert service.completion_client.max_retries == 0
+        assert service.openai_client.max_retries == openai.DEFAULT_MAX_RETRIES
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_priority_for_user_ids()
+    test_limit_caps_calls_in_flight()
+    test_authenticated_users_are_served_before_anonymous()
+    test_joining_a_flight_raises_its_priority()
+    test_rate_limits_cut_the_limit_and_fast_calls_grow_it()
+    test_slow_calls_shrink_the_limit()
+    test_full_queue_or_missed_deadline_is_rejected_at_once()
+    test_queue_deadline_times_out_waiters()
+    test_overloaded_query_returns_503_with_retry_after()
+    test_only_completions_skip_sdk_retries()
+    print("LLM dispatcher tests passed")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Test the deterministic LLM and embedding stand-ins"""
+
+import asyncio
+import math
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+import httpx
+import openai
+
+from src.services.llm_providers import SimulatedLLM, StubOpenAI, create_standin_app
+
+
+MESSAGES = [{"role": "system", "content": "You are helpful."}, {"role": "user", "content": "What is a topic?"}]
+
+
+def fast_llm(**overrides):
+    options = dict(seed=7, ttft_seconds=0.0, latency_sigma=0.0, tokens_per_second=1e6,
+                   embedding_latency_seconds=0.0, error_rate=0.0, rate_limit_rate=0.0, dimensions=8)
+    options.update(overrides)
+    return SimulatedLLM(**options)
+
+
+def test_answers_and_embeddings_are_deterministic():
+    async def run():
+        one, other = StubOpenAI(fast_llm()), StubOpenAI(fast_llm(seed=99))
+        first = await one.chat.completions.create(model="gpt-4", messages=MESSAGES, max_tokens=50)
+        again = await other.chat.completions.create(model="gpt-4", messages=MESSAGES, max_tokens=50)
+        different = await one.chat.completions.create(model="gpt-4", messages=MESSAGES[:1], max_tokens=50)
+
+        assert first.choices[0].message.content == again.choices[0].message.content
+        assert first.choices[0].message.content != different.choices[0].message.content
+        assert first.usage.completion_tokens <= 50
+
+        vectors = await one.embeddings.create(model="text-embedding-3-small", input=["a", "b", "a"])
+        a, b, a_again = (item.embedding for item in vectors.data)
+        assert a == a_again and a != b and len(a) == 8
+        assert abs(math.sqrt(sum(v * v for v in a)) - 1.0) < 1e-9
+
+    asyncio.run(run())
+
+
+def test_stream_follows_ttft_and_token_rate():
+    async def run():
+        client = StubOpenAI(fast_llm(ttft_seconds=0.05, tokens_per_second=1000))
+        started = time.perf_counter()
+        stream = await client.chat.completions.create(model="gpt-4", messages=MESSAGES, max_tokens=60, stream=True)
+        deltas, first_token_at, usage = [], None, None
+        async for chunk in stream:
+            if not chunk.choices:
+                usage = chunk.usage
+                continue
+            if chunk.choices[0].delta.content:
+                first_token_at = first_token_at or time.perf_counter() - started
+                deltas.append(chunk.choices[0].delta.content)
+        elapsed = time.perf_counter() - started
+
+        full = await client.chat.completions.create(model="gpt-4", messages=MESSAGES, max_tokens=60)
+        assert "".join(deltas) == full.choices[0].message.content
+        assert usage["completion_tokens"] == len(deltas)
+        assert 0.05 <= first_token_at < 0.1
+        # 60 tokens at 1000/s on top of the first token
+        assert elapsed >= 0.05 + 0.059
+
+    asyncio.run(run())
+
+
+def test_latency_replays_with_the_seed():
+    plans = [fast_llm(ttft_seconds=0.5, latency_sigma=0.5).plan_completion("gpt-4", MESSAGES) for _ in range(2)]
+    assert plans[0].ttft_seconds == plans[1].ttft_seconds
+
+    llm = fast_llm(ttft_seconds=0.5, latency_sigma=0.5)
+    repeats = [llm.plan_completion("gpt-4", MESSAGES).ttft_seconds for _ in range(200)]
+    # Repeats of one request still vary, lognormally around the median
+    assert len(set(repeats)) > 190
+    assert 0.4 < sorted(repeats)[100] < 0.6
+
+
+def test_seen_requests_stay_bounded():
+    llm = fast_llm(ttft_seconds=0.5, latency_sigma=0.5)
+    llm._seen.max_entries = 50
+    for i in range(500):
+        llm.plan_completion("gpt-4", [{"role": "user", "content": f"Question {i}"}])
+    assert len(llm._seen) == 50 and llm.requests == 500
+
+    # Requests still remembered keep counting their occurrences
+    first, second = (llm.plan_completion("gpt-4", [{"role": "user", "content": "Question 499"}]) for _ in range(2))
+    assert first.ttft_seconds != second.ttft_seconds
+
+
+def test_injected_errors():
+    async def run():
+        llm = fast_llm(error_rate=0.2, rate_limit_rate=0.1)
+        client = StubOpenAI(llm)
+        outcomes = {"ok": 0, 429: 0, 500: 0}
+        for i in range(500):
+            try:
+                await client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": f"q{i}"}])
+                outcomes["ok"] += 1
+            except openai.RateLimitError:
+                outcomes[429] += 1
+            except openai.InternalServerError:
+                outcomes[500] += 1
+        assert 30 <= outcomes[429] <= 75 and 70 <= outcomes[500] <= 130
+        assert llm.stats() == {"requests": 500, "faults": outcomes[429] + outcomes[500]}
+
+    asyncio.run(run())
+
+
+def test_http_standin_speaks_the_openai_protocol():
+    async def run():
+        app = create_standin_app(fast_llm())
+        http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        client = openai.AsyncOpenAI(api_key="x", base_url="http://standin/v1", http_client=http_client, max_retries=0)
+        expected = await StubOpenAI(fast_llm()).chat.completions.create(model="gpt-4", messages=MESSAGES)
+
+        response = await client.chat.completions.create(model="gpt-4", messages=MESSAGES)
+        assert response.choices[0].message.content == expected.choices[0].message.content
+
+        stream = await client.chat.completions.create(model="gpt-4", messages=MESSAGES, stream=True)
+        text = "".join([chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices])
+        assert text == expected.choices[0].message.content
+
+        vectors = await client.embeddings.create(model="text-embedding-3-small", input="a topic")
+        assert len(vectors.data[0].embedding) == 8
+
+        failing = openai.AsyncOpenAI(
+            api_key="x", base_url="http://standin/v1", max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_standin_app(fast_llm(rate_limit_rate=1.0))))
+        )
+        try:
+            await failing.chat.completions.create(model="gpt-4", messages=MESSAGES)
+            assert False, "the stand-in must answer 429"
+        except openai.RateLimitError:
+            pass
+        await http_client.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_answers_and_embeddings_are_deterministic()
+    test_stream_follows_ttft_and_token_rate()
+    test_latency_replays_with_the_seed()
+    test_seen_requests_stay_bounded()
+    test_injected_errors()
+    test_http_standin_speaks_the_openai_protocol()
+    print("LLM provider tests passed")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Test that a chat turn is persisted as one unit of work"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import types
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.database.database import Base
+from src.database.models import ChatMessage, ChatSession
+from src.models.chatbot import RetrievalResult
+from src.services.answer_cache import AnswerCache
+from src.services.chatbot_service import ChatbotService
+
+
+class FakeCompletions:
+    def __init__(self, db=None):
+        self.db = db
+        self.db_in_transaction = []
+
+    async def create(self, **kwargs):
+        if self.db is not None:
+            self.db_in_transaction.append(self.db.in_transaction())
+        message = types.SimpleNamespace(content="Topics are named buses.")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+class FakeEmbeddings:
+    async def create(self, model, input):
+        return types.SimpleNamespace(data=[types.SimpleNamespace(index=0, embedding=[1.0, 0.0])])
+
+
+class OfflineChatbotService(ChatbotService):
+    async def search(self, query, top_k, query_vector, payload_filter=None):
+        return [RetrievalResult(content_id="chunk-1", content="Topics carry messages.", similarity_score=0.9, source="module-1")]
+
+
+def test_query_turn_uses_one_transaction():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+
+            statements = []
+            commits = []
+            event.listen(engine.sync_engine, "before_cursor_execute",
+                         lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper()))
+            event.listen(engine.sync_engine, "commit", lambda conn: commits.append(True))
+
+            Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            async with Session() as db:
+                created = datetime.utcnow() - timedelta(hours=1)
+                db.add(ChatSession(id="session-1", user_id="user-1", title="t", created_at=created, updated_at=created))
+                await db.commit()
+
+                completions = FakeCompletions(db)
+                openai_client = types.SimpleNamespace(
+                    chat=types.SimpleNamespace(completions=completions),
+                    embeddings=FakeEmbeddings()
+                )
+                service = OfflineChatbotService(db, None, openai_client)
+                service.answer_cache = AnswerCache()
+
+                statements.clear()
+                commits.clear()
+                await service.process_query_with_rag("What is a topic?", "session-1", "user-1")
+
+                # One SELECT for the conversation memory, then in the write transaction its
+                # locked re-read, one UPDATE for the session bump and one batched INSERT for both messages
+                assert statements == ["SELECT", "SELECT", "UPDATE", "INSERT"], statements
+                # The read's transaction ends before the LLM call, so no connection is held through it
+                assert completions.db_in_transaction == [False]
+                assert len(commits) == 2
+
+                messages = (await db.execute(
+                    select(ChatMessage).where(ChatMessage.chat_session_id == "session-1").order_by(ChatMessage.created_at)
+                )).scalars().all()
+                assert [m.role for m in messages] == ["user", "assistant"]
+
+                session = (await db.execute(select(ChatSession).where(ChatSession.id == "session-1"))).scalars().first()
+                await db.refresh(session)
+                assert session.updated_at > created
+
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_query_turn_uses_one_transaction()
+    print("Message persistence tests passed")
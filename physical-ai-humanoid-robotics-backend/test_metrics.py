@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Test per-stage RAG timings and the Prometheus metrics endpoint"""
+
+import asyncio
+import sys
+import os
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from fastapi.testclient import TestClient
+
+from src.models.chatbot import RetrievalResult
+from src.services.answer_cache import AnswerCache
+from src.services.chatbot_service import ChatbotService
+from src.services.conversation_memory import ConversationState
+from src.services.retrievers import VectorRetriever
+from src.services.single_flight import SingleFlight
+from src.utils.metrics import MetricsRegistry, StageTimer
+
+
+class SlowRetriever(VectorRetriever):
+    name = "slow"
+
+    async def search(self, query_vector, limit, payload_filter=None):
+        await asyncio.sleep(0.02)
+        return [RetrievalResult(content_id="c1", content="Topics carry messages.", similarity_score=0.9, source="m1")]
+
+
+class OfflineChatbotService(ChatbotService):
+    async def embed_query(self, query):
+        await asyncio.sleep(0.01)
+        return [0.1, 0.2]
+
+    async def load_conversation(self, session_id):
+        return {}, ConversationState()
+
+    async def remember_turn(self, *args):
+        await asyncio.sleep(0.005)
+
+
+def service_with(completions):
+    service = OfflineChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)),
+                                    retriever=SlowRetriever())
+    service.single_flight, service.answer_cache = SingleFlight(), AnswerCache()
+    return service
+
+
+class SlowCompletions:
+    async def create(self, stream=False, **kwargs):
+        await asyncio.sleep(0.05)
+        if not stream:
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content="A bus."))])
+
+        async def chunks():
+            for part in ["A ", "bus."]:
+                await asyncio.sleep(0.02)
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=part))])
+        return chunks()
+
+
+def test_histogram_exposition_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo.", label_names=("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "embedding")
+    histogram.observe(0.1, "embedding")
+    histogram.observe(3.0, "embedding")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP demo_seconds Demo.", "# TYPE demo_seconds histogram"]
+    assert 'demo_seconds_bucket{stage="embedding",le="0.1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="embedding",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{stage="embedding",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="embedding"} 3' in lines
+
+
+def test_stage_entered_twice_is_observed_once():
+    histogram = MetricsRegistry().histogram("demo_seconds", "Demo.", label_names=("stage",), buckets=(0.04, 1.0))
+    timer = StageTimer(histogram)
+    timer.record("vector_search", 0.03)
+    timer.record("vector_search", 0.02)
+    assert histogram.render()[2:] == []
+
+    timer.finish()
+    timer.finish()
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{stage="vector_search",le="0.04"} 0' in lines
+    assert 'demo_seconds_count{stage="vector_search"} 1' in lines
+    assert timer.milliseconds() == {"vector_search": 50.0}
+
+
+def test_query_reports_stage_timings_only_when_asked():
+    async def run():
+        service = service_with(SlowCompletions())
+        plain = await service.process_query_with_rag("What is a topic?", "s", "u")
+        assert plain.debug is None
+
+        service = service_with(SlowCompletions())
+        response = await service.process_query_with_rag("What is a topic?", "s", "u", debug=True)
+        timings = response.debug.timings_ms
+        assert {"db_read", "embedding", "vector_search", "prompt_build", "llm_total", "db_write", "total"} <= set(timings)
+        assert timings["vector_search"] >= 15 and timings["llm_total"] >= 40
+        assert timings["total"] >= timings["vector_search"] + timings["llm_total"]
+
+    asyncio.run(run())
+
+
+def test_stream_reports_time_to_first_token():
+    async def run():
+        service = service_with(SlowCompletions())
+        events = [e async for e in service.stream_query_with_rag("What is a topic?", "s", "u", debug=True)]
+        timings = events[-1]["debug"]["timings_ms"]
+        assert 50 <= timings["llm_ttft"] < timings["llm_total"]
+
+    asyncio.run(run())
+
+
+def test_metrics_endpoint_serves_stage_histograms():
+    from src.main import app
+
+    timer = StageTimer()
+    timer.record("vector_search", 0.03)
+    timer.finish()
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE rag_stage_duration_seconds histogram" in response.text
+    assert 'rag_stage_duration_seconds_count{stage="vector_search"}' in response.text
+
+
+if __name__ == "__main__":
+    test_histogram_exposition_format()
+    test_stage_entered_twice_is_observed_once()
+    test_query_reports_stage_timings_only_when_asked()
+    test_stream_reports_time_to_first_token()
+    test_metrics_endpoint_serves_stage_histograms()
+    print("Metrics tests passed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Test routing queries between the small and the large chat model"""
+
+import asyncio
+import sys
+import os
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.models.chatbot import RetrievalResult
+from src.services.answer_cache import AnswerCache
+from src.services.chatbot_service import ChatbotService
+from src.services.conversation_memory import ConversationState
+from src.services.model_router import ModelRouter
+from src.services.single_flight import SingleFlight
+
+
+def hits(*scores):
+    return [RetrievalResult(content_id=f"c{i}", content=f"Chunk {i}.", similarity_score=score, source="m1")
+            for i, score in enumerate(scores)]
+
+
+def router():
+    return ModelRouter(small_model="small", large_model="large", max_query_tokens=12,
+                       min_top_score=0.8, min_score_spread=0.05, enabled=True)
+
+
+def test_routing_rules():
+    r = router()
+    assert r.route("What is a ROS 2 topic?", hits(0.91, 0.78, 0.75)).model == "small"
+
+    long_query = "Compare how topics, services and actions handle " + "feedback and cancellation " * 5
+    assert r.route(long_query, hits(0.91, 0.78)).reason == "long_query"
+    assert r.route("What is a topic?", hits(0.72, 0.70)).reason == "low_top_score"
+    # Several equally good chunks: the answer has to be put together from them
+    decision = r.route("What is a topic?", hits(0.86, 0.85, 0.84))
+    assert decision.model == "large" and decision.reason == "flat_scores" and decision.score_spread < 0.05
+
+    disabled = ModelRouter(small_model="small", large_model="large", enabled=False)
+    assert disabled.route("What is a topic?", hits(0.95)).reason == "routing_disabled"
+
+    stats = r.stats()
+    assert stats["decisions"] == {"large": {"flat_scores": 1, "long_query": 1, "low_top_score": 1}, "small": {"simple_query": 1}}
+
+
+def test_latency_percentiles_per_model():
+    r = router()
+    for i in range(100):
+        r.record_latency("small", 0.01 * (i + 1))
+    r.record_latency("large", 2.0)
+    latency = r.stats()["latency_seconds"]
+    assert latency["small"]["calls"] == 100 and latency["small"]["p50"] == 0.51 and latency["small"]["p95"] == 0.96
+    assert latency["large"] == {"calls": 1, "p50": 2.0, "p95": 2.0}
+
+
+def test_service_sends_each_query_to_its_routed_model():
+    async def run():
+        models = []
+
+        async def create(model, messages, **kwargs):
+            models.append(model)
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=f"from {model}"))])
+
+        class OfflineChatbotService(ChatbotService):
+            results = []
+
+            async def retrieve(self, query, scope=None):
+                return None, self.results
+
+            async def load_conversation(self, session_id):
+                return {}, ConversationState()
+
+            async def remember_turn(self, *args):
+                pass
+
+        service = OfflineChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(
+            completions=types.SimpleNamespace(create=create)
+        )))
+        service.model_router, service.single_flight, service.answer_cache = router(), SingleFlight(), AnswerCache()
+
+        service.results = hits(0.93, 0.7)
+        simple = await service.process_query_with_rag("What is a node?", "s")
+        service.results = hits(0.83, 0.82, 0.82)
+        hard = await service.process_query_with_rag("What is a node?", "s")
+
+        assert models == ["small", "large"]
+        assert (simple.model, simple.message) == ("small", "from small")
+        assert (hard.model, hard.message) == ("large", "from large")
+        assert set(service.model_router.stats()["latency_seconds"]) == {"small", "large"}
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_routing_rules()
+    test_latency_percentiles_per_model()
+    test_service_sends_each_query_to_its_routed_model()
+    print("Model router tests passed")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test the cache-friendly prompt templates and prompt-token accounting"""
+
+import asyncio
+import contextlib
+import io
+import sys
+import os
+import types
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.models.chatbot import RetrievalResult
+from src.services.chatbot_service import ChatbotService
+from src.services.prompts import (
+    RAG_SYSTEM_PROMPT, PromptCacheStats, prompt_token_usage, rag_messages, selected_text_messages
+)
+from src.services.single_flight import SingleFlight
+
+
+CHUNKS = [
+    RetrievalResult(content_id="m1-c2", content="Services are request/response.", similarity_score=0.7, source="m1"),
+    RetrievalResult(content_id="m1-c1", content="Topics carry messages.", similarity_score=0.9, source="m1"),
+]
+
+
+def test_rag_messages_share_a_byte_stable_prefix():
+    first = rag_messages("What is a topic?", CHUNKS)
+    second = rag_messages("How do services differ?", list(reversed(CHUNKS)), conversation="User: hi\nAssistant: hello")
+
+    assert first[0] == second[0] == {"role": "system", "content": RAG_SYSTEM_PROMPT}
+    # Context is ordered by chunk ID whatever order retrieval returned, and comes before anything per-request
+    context = "Context:\nTopics carry messages.\n\nServices are request/response."
+    assert first[1]["content"].startswith(context) and second[1]["content"].startswith(context)
+    assert first[1]["content"].endswith("User question: What is a topic?")
+    assert "Conversation so far" not in first[1]["content"]
+    assert second[1]["content"].index("Conversation so far") < second[1]["content"].index("User question")
+
+
+def test_selected_text_messages_end_with_the_question():
+    one = selected_text_messages("What is a node?", "A node is a process.")
+    other = selected_text_messages("Why use nodes?", "A node is a process.")
+    prefix = "Selected text:\nA node is a process.\n\nUser question: "
+    assert one[0] == other[0]
+    assert one[1]["content"] == prefix + "What is a node?" and other[1]["content"].startswith(prefix)
+
+
+def test_prompt_token_usage_reads_cached_tokens():
+    usage = types.SimpleNamespace(prompt_tokens=1500, prompt_tokens_details={"cached_tokens": 1280})
+    assert prompt_token_usage(usage) == (1280, 220)
+    assert prompt_token_usage({"prompt_tokens": 40}) == (0, 40)
+    assert prompt_token_usage(None) is None
+
+    stats = PromptCacheStats()
+    logged = io.StringIO()
+    with contextlib.redirect_stdout(logged):
+        stats.record(usage, "gpt-4")
+        stats.record(None, "gpt-4")
+    # Each completion's own split is logged; requests without usage are not
+    assert logged.getvalue() == "Prompt tokens for gpt-4: 1280 cached, 220 uncached\n"
+    assert stats.stats() == {"requests": 1, "cached_tokens": 1280, "uncached_tokens": 220, "cached_ratio": 0.8533}
+
+
+def test_completions_record_prompt_usage():
+    async def run():
+        sent = []
+
+        async def create(model, messages, stream=False, **kwargs):
+            sent.append(messages)
+            usage = types.SimpleNamespace(prompt_tokens=100, prompt_tokens_details=types.SimpleNamespace(cached_tokens=64))
+            if not stream:
+                message = types.SimpleNamespace(content="A process.")
+                return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+            async def chunks():
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content="A process."))], usage=None)
+                yield types.SimpleNamespace(choices=[], usage=usage)
+            return chunks()
+
+        service = ChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(
+            completions=types.SimpleNamespace(create=create)
+        )))
+        service.single_flight, service.prompt_cache_stats = SingleFlight(), PromptCacheStats()
+
+        messages = service.build_selected_text_messages("What is a node?", "A node is a process.")
+        logged = io.StringIO()
+        with contextlib.redirect_stdout(logged):
+            assert await service.complete(messages) == "A process."
+            assert [delta async for delta in service.stream_completion(messages)] == ["A process."]
+        assert sent == [messages, messages]
+        assert service.prompt_cache_stats.stats()["cached_tokens"] == 128
+        line = f"Prompt tokens for {service.config.model_name}: 64 cached, 36 uncached"
+        assert logged.getvalue().splitlines() == [line, line]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_rag_messages_share_a_byte_stable_prefix()
+    test_selected_text_messages_end_with_the_question()
+    test_prompt_token_usage_reads_cached_tokens()
+    test_completions_record_prompt_usage()
+    print("Prompt tests passed")
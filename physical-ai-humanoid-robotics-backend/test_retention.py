@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Test the background compaction of expired anonymous chat sessions"""
+
+import asyncio
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.database.database import Base
+from src.database.models import ChatMessage, ChatSession
+from src.services.retention_service import RetentionService
+
+
+async def seeded(tmp):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    now = datetime.utcnow()
+    old, recent = now - timedelta(days=30), now - timedelta(hours=1)
+    sessions = (
+        # 6 expired anonymous sessions with 4 messages each
+        [("anon-old-%d" % i, "anonymous_%d" % i, old) for i in range(6)]
+        + [("anon-recent", "anonymous_x", recent), ("user-old", "user-1", old), ("lookalike", "anonymousXuser", old)]
+    )
+    async with Session() as db:
+        for session_id, user_id, at in sessions:
+            db.add(ChatSession(id=session_id, user_id=user_id, title="t", created_at=at, updated_at=at,
+                               message_count=4, last_message_at=at))
+            db.add_all([
+                ChatMessage(id=f"{session_id}-{j}", chat_session_id=session_id, role="user", content="hi", created_at=at)
+                for j in range(4)
+            ])
+        await db.commit()
+    return engine, Session
+
+
+async def remaining(Session):
+    async with Session() as db:
+        session_ids = (await db.execute(select(ChatSession.id).order_by(ChatSession.id))).scalars().all()
+        messages = (await db.execute(select(func.count(ChatMessage.id)))).scalar()
+    return list(session_ids), messages
+
+
+def test_compaction_deletes_only_expired_anonymous_sessions():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, Session = await seeded(tmp)
+            service = RetentionService(Session, ttl_seconds=7 * 24 * 3600, batch_size=5, pause_seconds=0)
+
+            report = await service.compact()
+            assert report.sessions_deleted == 6 and report.messages_deleted == 24
+            assert report.rows_reclaimed == 30
+            # No transaction touched more than batch_size rows
+            assert report.batches >= (24 + 6) // 5
+            assert not report.truncated and report.error is None
+            assert await remaining(Session) == (["anon-recent", "lookalike", "user-old"], 12)
+
+            again = await service.compact()
+            assert again.rows_reclaimed == 0
+            assert service.stats()["total_rows_reclaimed"] == 30
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_compaction_stops_at_max_batches_and_resumes():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine, Session = await seeded(tmp)
+            service = RetentionService(Session, ttl_seconds=7 * 24 * 3600, batch_size=5, pause_seconds=0, max_batches=3)
+
+            first = await service.compact()
+            assert first.truncated and first.batches == 3
+            assert first.messages_deleted == 15 and first.sessions_deleted == 0
+
+            reports = [first]
+            while reports[-1].truncated:
+                reports.append(await service.compact())
+            assert sum(r.sessions_deleted for r in reports) == 6
+            assert sum(r.messages_deleted for r in reports) == 24
+            assert (await remaining(Session))[1] == 12
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_compaction_deletes_only_expired_anonymous_sessions()
+    test_compaction_stops_at_max_batches_and_resumes()
+    print("Retention tests passed")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Test module-, chapter- and page-scoped retrieval"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import types
+from pathlib import Path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from src.models.chatbot import RetrievalResult, RetrievalScope
+from src.models.content import ModuleType
+from src.routes.chatbot import get_retrieval_scope
+from src.services.adaptive_top_k import AdaptiveTopK
+from src.services.bm25_index import BM25Index, BM25Store
+from src.services.chatbot_service import ChatbotService
+from src.services.ingestion_service import TextbookIngestionService
+from src.services.retrieval_scope import ScopedSearchPolicy, normalize_page, scope_filter
+
+
+ISAAC = "module-3-the-ai-robot-brain/chapter-1-isaac-sim-and-synthetic-data"
+DOCS = [
+    {"content_id": "c1", "source": "m1#topics", "content": "Topics carry messages between ROS 2 nodes.",
+     "module_type": "ros_2", "chapter": "chapter-2-ros-2-nodes", "path": "module-1-x/chapter-2-ros-2-nodes.md"},
+    {"content_id": "c2", "source": "m3#replicator", "content": "Isaac Sim publishes synthetic camera messages to ROS 2.",
+     "module_type": "nvidia_isaac", "chapter": "chapter-1-isaac-sim-and-synthetic-data", "path": ISAAC + ".md"},
+]
+
+
+def test_scope_becomes_a_payload_filter():
+    assert normalize_page(f"https://book.example.com/docs/{ISAAC}/") == ISAAC
+    assert normalize_page(f"/physical-ai/docs/{ISAAC}#domain-randomization") == ISAAC
+    assert normalize_page(ISAAC + ".mdx") == ISAAC
+    assert normalize_page("/docs/intro") is None
+
+    assert scope_filter(None) is None
+    assert scope_filter(RetrievalScope(page="/blog/welcome")) is None
+    assert scope_filter(RetrievalScope(module_type=ModuleType.NVIDIA_ISAAC, page=f"/docs/{ISAAC}")) == {
+        "module_type": "nvidia_isaac", "path": [ISAAC + ".md", ISAAC + ".mdx"]
+    }
+    assert get_retrieval_scope() is None
+    assert get_retrieval_scope(chapter="chapter-2-ros-2-nodes").chapter == "chapter-2-ros-2-nodes"
+
+
+def test_scoped_search_filters_both_sides_and_falls_back():
+    class ScopedService(ChatbotService):
+        async def try_embed_query(self, query):
+            return [0.0]
+
+        async def vector_search(self, query_vector, limit, payload_filter=None):
+            filters.append(payload_filter)
+            hits = [RetrievalResult(content_id="c1", content=DOCS[0]["content"], similarity_score=0.7,
+                                    source="m1#topics", module_type="ros_2"),
+                    RetrievalResult(content_id="c2", content=DOCS[1]["content"], similarity_score=scoped_score,
+                                    source="m3#replicator", module_type="nvidia_isaac")]
+            if payload_filter:
+                return [hit for hit in hits if hit.module_type == payload_filter["module_type"]]
+            return hits
+
+    async def run():
+        nonlocal scoped_score
+        with tempfile.TemporaryDirectory() as tmp:
+            BM25Index.build(DOCS).save(Path(tmp) / "bm25")
+            service = ScopedService(None, None, None)
+            service.bm25_store = BM25Store(tmp)
+            service.adaptive_top_k = AdaptiveTopK(enabled=False)
+            service.scoped_search_policy = ScopedSearchPolicy(min_score=0.3)
+            scope = RetrievalScope(module_type=ModuleType.NVIDIA_ISAAC)
+
+            # "messages" matches both chunks lexically; the scope keeps only Module 3
+            assert service.lexical_search("messages", 5, {"module_type": "nvidia_isaac"})[0].content_id == "c2"
+            _, results = await service.retrieve("ROS 2 messages", scope)
+            assert [r.content_id for r in results] == ["c2"]
+            assert service.scope_outcome == "scoped" and filters == [{"module_type": "nvidia_isaac"}]
+
+            # A poor best match in scope: answer from the whole textbook
+            scoped_score = 0.1
+            _, results = await service.retrieve("ROS 2 messages", scope)
+            assert {r.content_id for r in results} == {"c1", "c2"}
+            assert service.scope_outcome == "fallback_low_score" and filters[-1] is None
+
+            _, results = await service.retrieve("ROS 2 messages")
+            assert service.scope_outcome is None
+            assert service.scoped_search_policy.stats()["outcomes"] == {"fallback_low_score": 1, "scoped": 1}
+
+    filters = []
+    scoped_score = 0.6
+    asyncio.run(run())
+
+
+def test_ingestion_indexes_scope_fields_in_qdrant():
+    created = []
+    qdrant = types.SimpleNamespace(
+        get_collection=lambda name: types.SimpleNamespace(payload_schema={"path": object()}),
+        create_payload_index=lambda **kwargs: created.append(kwargs["field_name"])
+    )
+    service = TextbookIngestionService(qdrant, None)
+    service.backend = "qdrant"
+    service._ensure_payload_indexes()
+    assert created == ["module_type", "chapter"]
+
+
+if __name__ == "__main__":
+    test_scope_becomes_a_payload_filter()
+    test_scoped_search_filters_both_sides_and_falls_back()
+    test_ingestion_indexes_scope_fields_in_qdrant()
+    print("Retrieval scope tests passed")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Test the denormalised session list: counters, previews and keyset pages"""
+
+import asyncio
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from initialize_db import add_missing_columns, backfill_session_activity
+from src.database.database import Base
+from src.models.chatbot import ChatMessageCreate, ChatSessionCreate, MessageRole
+from src.services.chatbot_service import ChatbotService
+
+
+def test_message_writes_keep_session_counters():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+            async with Session() as db:
+                service = ChatbotService(db, None, None)
+                sessions = []
+                for i in range(5):
+                    sessions.append(await service.create_chat_session(ChatSessionCreate(user_id="user-1", title=f"s{i}")))
+                await service.create_chat_session(ChatSessionCreate(user_id="user-2", title="not mine"))
+                assert sessions[0].message_count == 0 and sessions[0].last_message_at == sessions[0].created_at
+
+                # Activity on the oldest session moves it to the top of the list
+                await service.save_turn(
+                    sessions[0].id,
+                    ChatMessageCreate(role=MessageRole.USER, content="What is a topic?"),
+                    ChatMessageCreate(role=MessageRole.ASSISTANT, content="A topic is a named\n\nbus. " + "x" * 300),
+                    datetime.utcnow()
+                )
+                await service.add_message_to_session(sessions[0].id, ChatMessageCreate(role=MessageRole.USER, content="Thanks!"))
+
+                page = await service.get_sessions_page("user-1", limit=2)
+                assert [s.id for s in page.sessions] == [sessions[0].id, sessions[4].id]
+                assert page.sessions[0].message_count == 3
+                assert page.sessions[0].last_message_preview == "Thanks!"
+                assert page.has_more
+
+                seen = [s.id for s in page.sessions]
+                while page.has_more:
+                    page = await service.get_sessions_page("user-1", limit=2, before=page.next_cursor)
+                    seen += [s.id for s in page.sessions]
+                assert seen == [sessions[i].id for i in (0, 4, 3, 2, 1)]
+
+            async with engine.connect() as conn:
+                plan = (await conn.execute(text(
+                    "EXPLAIN QUERY PLAN SELECT * FROM chat_sessions WHERE user_id = 'user-1' "
+                    "ORDER BY last_message_at DESC, id DESC LIMIT 21"
+                ))).fetchall()
+            assert any("ix_chat_sessions_user_last_message_at" in row[-1] for row in plan), plan
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_existing_sessions_are_migrated_and_backfilled():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/legacy.db")
+            async with engine.begin() as conn:
+                # The chat_sessions table as it was before the counters existed
+                await conn.execute(text(
+                    "CREATE TABLE chat_sessions (id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL, title VARCHAR NOT NULL, "
+                    "context JSON, created_at DATETIME NOT NULL, updated_at DATETIME)"
+                ))
+                await conn.run_sync(Base.metadata.create_all)
+                created = datetime(2025, 1, 1)
+                await conn.execute(text("INSERT INTO chat_sessions (id, user_id, title, created_at) VALUES "
+                                        "('busy', 'u', 't', :c), ('empty', 'u', 't', :c)"), {"c": created})
+                await conn.execute(text(
+                    "INSERT INTO chat_messages (id, chat_session_id, role, content, created_at) VALUES "
+                    "('m1', 'busy', 'user', 'first', :a), ('m2', 'busy', 'assistant', 'latest answer', :b)"
+                ), {"a": created + timedelta(minutes=1), "b": created + timedelta(minutes=2)})
+
+                assert await conn.run_sync(add_missing_columns) == [
+                    "chat_sessions.message_count", "chat_sessions.last_message_at", "chat_sessions.last_message_preview"
+                ]
+                assert await conn.run_sync(add_missing_columns) == []
+                await conn.execute(backfill_session_activity())
+
+                rows = (await conn.execute(text(
+                    "SELECT id, message_count, last_message_at, last_message_preview FROM chat_sessions ORDER BY id"
+                ))).fetchall()
+            assert [(r[0], r[1], r[3]) for r in rows] == [("busy", 2, "latest answer"), ("empty", 0, None)]
+            assert rows[0][2].startswith("2025-01-01 00:02") and rows[1][2].startswith("2025-01-01 00:00")
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_message_writes_keep_session_counters()
+    test_existing_sessions_are_migrated_and_backfilled()
+    print("Session list tests passed")
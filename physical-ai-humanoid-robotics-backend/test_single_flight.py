@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Test single-flight coalescing of identical in-flight LLM calls"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import types
+from datetime import datetime
+sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.database.database import Base
+from src.database.models import ChatMessage, ChatSession
+from src.models.chatbot import RetrievalResult
+from src.services.answer_cache import AnswerCache, SelectedTextCache
+from src.services.chatbot_service import ChatbotService, ERROR_RESPONSE
+from src.services.single_flight import SingleFlight
+
+
+ANSWER = ["Topics ", "are ", "named ", "buses."]
+
+
+class SlowCompletions:
+    """Takes a while to answer, like the real API, and counts upstream calls"""
+
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    async def create(self, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        if self.fail:
+            raise RuntimeError("upstream unavailable")
+        if not stream:
+            message = types.SimpleNamespace(content="".join(ANSWER))
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+        async def chunks():
+            for part in ANSWER:
+                await asyncio.sleep(0.01)
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=part))])
+        return chunks()
+
+
+class OfflineChatbotService(ChatbotService):
+    async def retrieve(self, query, scope=None):
+        return None, [RetrievalResult(content_id="chunk-1", content="Topics carry messages.", similarity_score=0.9, source="m1")]
+
+
+async def classroom(tmp, completions, students):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp}/chat.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with Session() as db:
+        now = datetime.utcnow()
+        db.add_all([ChatSession(id=f"s{i}", user_id=f"u{i}", title="t", created_at=now, updated_at=now) for i in range(students)])
+        await db.commit()
+
+    openai_client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    flight, cache = SingleFlight(), AnswerCache()
+
+    def service(db):
+        svc = OfflineChatbotService(db, None, openai_client)
+        svc.single_flight, svc.answer_cache = flight, cache
+        return svc
+
+    return engine, Session, service, flight
+
+
+async def message_count(Session):
+    async with Session() as db:
+        return (await db.execute(select(func.count(ChatMessage.id)))).scalar()
+
+
+def test_identical_questions_share_one_completion():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            completions = SlowCompletions()
+            engine, Session, service, flight = await classroom(tmp, completions, 20)
+
+            async def ask(i):
+                async with Session() as db:
+                    # Same question, pasted with different spacing and case
+                    query = "What is a ROS 2 topic?" if i % 2 else "  what is a ros 2 TOPIC "
+                    return await service(db).process_query_with_rag(query, f"s{i}", f"u{i}")
+
+            responses = await asyncio.gather(*(ask(i) for i in range(20)))
+            assert completions.calls == 1
+            assert {r.message for r in responses} == {"".join(ANSWER)}
+            assert flight.stats()["coalesced_calls"] == 19 and flight.stats()["in_flight"] == 0
+            # Every student still gets their own question and answer recorded
+            assert await message_count(Session) == 40
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_identical_streams_share_one_upstream_stream():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            completions = SlowCompletions()
+            engine, Session, service, flight = await classroom(tmp, completions, 8)
+
+            async def ask(i):
+                # Staggered arrivals: late joiners replay what they missed
+                await asyncio.sleep(0.02 * (i % 4))
+                async with Session() as db:
+                    events = [e async for e in service(db).stream_query_with_rag("What is a topic?", f"s{i}", f"u{i}")]
+                return events
+
+            results = await asyncio.gather(*(ask(i) for i in range(8)))
+            assert completions.calls == 1
+            assert flight.stats()["upstream_streams"] == 1 and flight.stats()["coalesced_streams"] == 7
+            for events in results:
+                assert [e["content"] for e in events if e["type"] == "delta"] == ANSWER
+                assert events[-1]["message"] == "".join(ANSWER)
+            assert await message_count(Session) == 16
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_upstream_errors_reach_every_caller():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            completions = SlowCompletions(fail=True)
+            engine, Session, service, flight = await classroom(tmp, completions, 5)
+
+            async def ask(i):
+                async with Session() as db:
+                    return await service(db).process_query_with_rag("What is a topic?", f"s{i}", f"u{i}")
+
+            responses = await asyncio.gather(*(ask(i) for i in range(5)))
+            assert completions.calls == 1
+            assert all(r.message == ERROR_RESPONSE for r in responses)
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_selected_text_questions_are_coalesced():
+    async def run():
+        completions = SlowCompletions()
+        service = ChatbotService(None, None, types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+        service.single_flight, service.selected_text_cache = SingleFlight(), SelectedTextCache()
+
+        responses = await asyncio.gather(*(
+            service.enforce_selected_text("Explain this" + "?" * (i % 2), "A node is a process.") for i in range(6)
+        ))
+        assert completions.calls == 1
+        assert {r.message for r in responses} == {"".join(ANSWER)}
+        assert not any(r.cached for r in responses)
+
+        # Later students asking the same about the same passage are served from the cache
+        again = await service.enforce_selected_text("explain THIS", "A node is a process.\n")
+        assert again.cached and again.message == "".join(ANSWER) and completions.calls == 1
+
+    asyncio.run(run())
+
+
+def test_key_separates_model_and_temperature():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def call(tag):
+            calls.append(tag)
+            await asyncio.sleep(0.01)
+            return tag
+
+        results = await asyncio.gather(
+            flight.run(SingleFlight.key("Prompt", "gpt-4", 0.7), lambda: call("a")),
+            flight.run(SingleFlight.key("prompt ", "gpt-4", 0.7), lambda: call("b")),
+            flight.run(SingleFlight.key("prompt", "gpt-4", 0.2), lambda: call("c")),
+            flight.run(SingleFlight.key("prompt", "gpt-3.5-turbo", 0.7), lambda: call("d")),
+        )
+        assert results == ["a", "a", "c", "d"] and calls == ["a", "c", "d"]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_identical_questions_share_one_completion()
+    test_identical_streams_share_one_upstream_stream()
+    test_upstream_errors_reach_every_caller()
+    test_selected_text_questions_are_coalesced()
+    test_key_separates_model_and_temperature()
+    print("Single-flight tests passed")